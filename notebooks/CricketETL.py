@@ -31,238 +31,133 @@
 CRICSHEET_URL = "https://cricsheet.org/downloads/all_json.zip"
 LAKEHOUSE_PATH = "Tables"
 
+# The archive is cached in the lakehouse Files area and only re-fetched when the server's
+# ETag/Last-Modified changed; a fetch pulls DOWNLOAD_CHUNK_MB byte ranges on DOWNLOAD_WORKERS
+# parallel connections and resumes from the completed ranges if a previous attempt failed
+DOWNLOAD_DIR = "/lakehouse/default/Files/raw"
+DOWNLOAD_WORKERS = 8
+DOWNLOAD_CHUNK_MB = 8
+
+# Ingest mode: "full" re-parses every match and overwrites the tables; "incremental" compares
+# ZIP member CRC/size with the etl_manifest table from the last run and only parses and
+# replaces new or changed matches (falls back to full when there is no manifest yet)
+INGEST_MODE = "full"
+
+# Parse mode: "driver" parses every match in one loop on the driver,
+# "distributed" ships the ZIP to the executors and parses file shards in mapPartitions
+PARSE_MODE = "driver"
+PARSE_SHARDS = 0  # distributed mode only; 0 = 2 × spark.sparkContext.defaultParallelism
+
+# JSON decoder for the match files: "json" (stdlib), "orjson", or "msgspec" (decodes against the
+# TypedDict shape in cricsheet_match_type and skips every field the parser never reads). All three
+# produce identical tables; orjson/msgspec must be installed in the session (%pip install ...).
+PARSE_BACKEND = "json"
+
+# Driver mode streams deliveries to Delta while parsing. A chunk is flushed once it reaches the
+# adaptive row target or buffered rows push driver RSS more than the budget above its baseline.
+DELIVERIES_MEMORY_BUDGET_MB = 1024
+DELIVERIES_MIN_CHUNK_ROWS = 250_000
+DELIVERIES_MAX_CHUNK_ROWS = 2_000_000
+
+# Opt-in parse profiling: time, JSON size and deliveries of every match (both parse modes), and in
+# driver mode cProfile over every PARSE_PROFILE_SAMPLE_EVERY-th match (0 = no cProfile). The
+# PARSE_PROFILE_TOP_N slowest matches and hottest functions are printed and saved to RUN_METRICS_DIR.
+PARSE_PROFILE = False
+PARSE_PROFILE_SAMPLE_EVERY = 100
+PARSE_PROFILE_TOP_N = 20
+
+# Deliveries physical layout. Partition/cluster columns may be deliveries columns or matches columns
+# (e.g. match_type, season), which are then carried onto deliveries as extra trailing columns.
+# DELIVERIES_LAYOUT:
+#   "none"   - partitionBy(DELIVERIES_PARTITION_BY) only, plain OPTIMIZE; DELIVERIES_CLUSTER_BY is unused
+#   "zorder" - partitionBy(DELIVERIES_PARTITION_BY), files sorted on DELIVERIES_CLUSTER_BY at write
+#              time, OPTIMIZE ... ZORDER BY (DELIVERIES_CLUSTER_BY) in the optimize step
+#   "liquid" - table created with CLUSTER BY (DELIVERIES_CLUSTER_BY), no partitions (Delta 3.1+)
+# The default keeps the original table: unpartitioned, with the original columns only. To opt in,
+# e.g. DELIVERIES_LAYOUT = "zorder" with DELIVERIES_PARTITION_BY = ["match_type"]. Changing the
+# layout takes a full ingest.
+DELIVERIES_LAYOUT = "none"
+DELIVERIES_PARTITION_BY = []
+DELIVERIES_CLUSTER_BY = ["season", "batter_id", "bowler_id"]
+
+# Materialize the matchups table — batter vs bowler totals per match_type and season — for
+# head-to-head lookups. It is clustered on batter_id, bowler_id the way DELIVERIES_LAYOUT clusters
+# deliveries (CLUSTER BY for "liquid", Z-order otherwise)
+BUILD_MATCHUPS = True
+
+# Also write deliveries_wide: deliveries plus these matches columns, so format/season/venue filters
+# need no join. Partitioned by match_type and clustered on season, venue (DELIVERIES_LAYOUT decides how)
+BUILD_DELIVERIES_WIDE = False
+DELIVERIES_WIDE_COLUMNS = ["match_type", "gender", "team_type", "season", "venue", "city", "date_start", "event_name"]
+
+# Slim deliveries: integer keys instead of the string IDs and names (match_key, batter_key, ...,
+# batting_team_key) and small integer codes for wicket_kind and phase. Names move to the players
+# (player_key) and matches (match_key) dimensions plus teams / wicket_kinds / phases lookup tables.
+# Not cricket-mcp's schema — the summary tables stay unchanged. Switching takes a full ingest.
+DELIVERIES_SLIM = False
+
+# Every run appends its per-stage metrics (wall time, rows, bytes, peak driver RSS, errors) to the
+# etl_runs table and saves them as <run_id>.json here
+RUN_METRICS_DIR = "/lakehouse/default/Files/etl_runs"
+
+# The validate step appends every check's result to the etl_validation table (and saves them as
+# <run_id>-validation.json under RUN_METRICS_DIR); a failed "hard" check fails the run. Largest share
+# of deliveries (of wickets, for wicket_player_out_id) allowed a null player ID, per format
+VALIDATION_MAX_ID_NULL_RATE = 0.001
+
+# A failed run leaves its progress here — driver-mode deliveries chunks with the rows they parsed,
+# and finished table writes — and a rerun over the same archive and parameters resumes from it
+# instead of starting over. Cleared once etl_manifest is written. "" disables checkpointing.
+CHECKPOINT_DIR = "/lakehouse/default/Files/checkpoints"
+
+# The players, matches and innings writes (and deliveries in distributed mode) don't depend on each
+# other, so they run side by side from up to TABLE_WRITE_WORKERS threads on the shared SparkSession
+# and the small tables fill executors the deliveries write leaves idle. 1 writes them one at a time.
+TABLE_WRITE_WORKERS = 4
+
 # CELL ********************
 
+import cProfile
+import hashlib
+import heapq
+import io
 import json
 import os
+import pstats
+import shutil
+import threading
+import time
+import uuid
 import zipfile
+import zlib
+import urllib.error
 import urllib.request
-import tempfile
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
 
-from pyspark.sql import SparkSession, Row
+import pyarrow as pa
+from pyspark import StorageLevel
+from pyspark.sql import SparkSession, Row, Window
 from pyspark.sql.types import *
 from pyspark.sql import functions as F
+from pyspark.sql.pandas.types import to_arrow_schema
+from delta.tables import DeltaTable
 
 spark = SparkSession.builder.getOrCreate()
+# Column buffers reach the JVM as Arrow record batches instead of pickled rows
+spark.conf.set("spark.sql.execution.arrow.pyspark.enabled", "true")
 
 print(f"Spark version: {spark.version}")
 print(f"Start time: {datetime.now().isoformat()}")
 
 # CELL ********************
 
-# MARKDOWN ********************
-
-# ## Step 1: Download and extract Cricsheet data
-
-# CELL ********************
-
-# Download the ZIP file
-tmp_dir = tempfile.mkdtemp()
-zip_path = os.path.join(tmp_dir, "all_json.zip")
-extract_dir = os.path.join(tmp_dir, "json_files")
-
-print(f"Downloading from {CRICSHEET_URL}...")
-urllib.request.urlretrieve(CRICSHEET_URL, zip_path)
-zip_size_mb = os.path.getsize(zip_path) / (1024 * 1024)
-print(f"Download complete: {zip_size_mb:.1f} MB")
-
-# Extract
-os.makedirs(extract_dir, exist_ok=True)
-with zipfile.ZipFile(zip_path, 'r') as zf:
-    json_files = [f for f in zf.namelist() if f.endswith('.json')]
-    zf.extractall(extract_dir, members=json_files)
-
-print(f"Extracted {len(json_files)} JSON files")
-
-# CELL ********************
-
-# MARKDOWN ********************
-
-# ## Step 2: Parse JSON files into structured rows
-# 
-# Each JSON file = 1 match. We parse into 4 sets of rows:
-# - players (from registry.people)
-# - matches (from info section)
-# - innings (from innings section)
-# - deliveries (from innings → overs → deliveries)
-
-# CELL ********************
-
-# Accumulators for all tables
-all_players = {}  # {player_id: name} — deduplicated across all matches
-all_matches = []
-all_innings = []
-all_deliveries = []
-
-error_files = []
-processed = 0
-
-for json_file in json_files:
-    file_path = os.path.join(extract_dir, json_file)
-    # Match ID from filename (e.g., "1234567.json" → "1234567")
-    match_id = os.path.splitext(os.path.basename(json_file))[0]
-    
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        info = data.get('info', {})
-        meta = data.get('meta', {})
-        
-        # --- PLAYERS (from registry) ---
-        registry = info.get('registry', {}).get('people', {})
-        for name, player_id in registry.items():
-            if player_id not in all_players:
-                all_players[player_id] = name
-        
-        # --- MATCH ---
-        teams = info.get('teams', [])
-        outcome = info.get('outcome', {})
-        outcome_by = outcome.get('by', {})
-        event = info.get('event', {})
-        toss = info.get('toss', {})
-        dates = info.get('dates', [])
-        
-        match_row = {
-            'match_id': match_id,
-            'data_version': meta.get('data_version'),
-            'match_type': info.get('match_type'),
-            'match_type_number': info.get('match_type_number'),
-            'gender': info.get('gender'),
-            'team_type': info.get('team_type'),
-            'overs_per_side': info.get('overs'),
-            'balls_per_over': info.get('balls_per_over', 6),
-            'venue': info.get('venue'),
-            'city': info.get('city'),
-            'date_start': dates[0] if dates else None,
-            'date_end': dates[-1] if dates else None,
-            'team1': teams[0] if len(teams) > 0 else None,
-            'team2': teams[1] if len(teams) > 1 else None,
-            'toss_winner': toss.get('winner'),
-            'toss_decision': toss.get('decision'),
-            'outcome_winner': outcome.get('winner'),
-            'outcome_result': outcome.get('result'),
-            'outcome_method': outcome.get('method'),
-            'outcome_by_runs': outcome_by.get('runs'),
-            'outcome_by_wickets': outcome_by.get('wickets'),
-            'outcome_by_innings': outcome_by.get('innings'),
-            'player_of_match': ','.join(info.get('player_of_match', [])),
-            'event_name': event.get('name'),
-            'event_match_number': event.get('match_number'),
-            'event_group': str(event.get('group', '')) if event.get('group') is not None else None,
-            'event_stage': event.get('stage'),
-            'season': info.get('season'),
-        }
-        all_matches.append(match_row)
-        
-        # --- INNINGS ---
-        for innings_idx, innings_data in enumerate(data.get('innings', [])):
-            innings_number = innings_idx + 1
-            batting_team = innings_data.get('team')
-            # Bowling team is the other team
-            bowling_team = None
-            if batting_team and len(teams) == 2:
-                bowling_team = teams[1] if batting_team == teams[0] else teams[0]
-            
-            target = innings_data.get('target', {})
-            
-            innings_row = {
-                'match_id': match_id,
-                'innings_number': innings_number,
-                'batting_team': batting_team,
-                'bowling_team': bowling_team,
-                'target_runs': target.get('runs'),
-                'target_overs': float(target['overs']) if 'overs' in target else None,
-                'declared': innings_data.get('declared', False),
-                'forfeited': innings_data.get('forfeited', False),
-                'is_super_over': innings_data.get('super_over', False),
-            }
-            all_innings.append(innings_row)
-            
-            # --- DELIVERIES ---
-            if innings_data.get('forfeited'):
-                continue  # No deliveries in forfeited innings
-            
-            for over_data in innings_data.get('overs', []):
-                over_number = over_data.get('over', 0)
-                
-                for ball_idx, delivery in enumerate(over_data.get('deliveries', [])):
-                    runs = delivery.get('runs', {})
-                    extras = delivery.get('extras', {})
-                    wickets = delivery.get('wickets', [])
-                    
-                    # First wicket (most common — >99.99% have 0 or 1)
-                    wicket = wickets[0] if wickets else {}
-                    fielders = wicket.get('fielders', [])
-                    
-                    # Resolve player IDs from registry
-                    batter_name = delivery.get('batter')
-                    bowler_name = delivery.get('bowler')
-                    non_striker_name = delivery.get('non_striker')
-                    player_out_name = wicket.get('player_out')
-                    
-                    delivery_row = {
-                        'match_id': match_id,
-                        'innings_number': innings_number,
-                        'over_number': over_number,
-                        'ball_number': ball_idx + 1,
-                        'batter': batter_name,
-                        'batter_id': registry.get(batter_name),
-                        'bowler': bowler_name,
-                        'bowler_id': registry.get(bowler_name),
-                        'non_striker': non_striker_name,
-                        'non_striker_id': registry.get(non_striker_name),
-                        'runs_batter': runs.get('batter', 0),
-                        'runs_extras': runs.get('extras', 0),
-                        'runs_total': runs.get('total', 0),
-                        'runs_non_boundary': runs.get('non_boundary', False),
-                        'extras_wides': extras.get('wides', 0),
-                        'extras_noballs': extras.get('noballs', 0),
-                        'extras_byes': extras.get('byes', 0),
-                        'extras_legbyes': extras.get('legbyes', 0),
-                        'extras_penalty': extras.get('penalty', 0),
-                        'is_wicket': len(wickets) > 0,
-                        'wicket_kind': wicket.get('kind'),
-                        'wicket_player_out': player_out_name,
-                        'wicket_player_out_id': registry.get(player_out_name) if player_out_name else None,
-                        'wicket_fielder1': fielders[0].get('name') if fielders else None,
-                        'wicket_fielder2': fielders[1].get('name') if len(fielders) > 1 else None,
-                        'batting_team': batting_team,
-                        'bowling_team': bowling_team,
-                    }
-                    all_deliveries.append(delivery_row)
-        
-        processed += 1
-        if processed % 5000 == 0:
-            print(f"Processed {processed}/{len(json_files)} matches ({len(all_deliveries):,} deliveries)")
-    
-    except Exception as e:
-        error_files.append((json_file, str(e)))
+# --- TABLE SCHEMAS ---
+# Shared by the driver-side writes and the distributed parse, so both paths produce identical tables.
+# The parser's column buffers follow these field orders.
 
-print(f"\n=== Parsing Complete ===")
-print(f"  Matches:    {len(all_matches):,}")
-print(f"  Innings:    {len(all_innings):,}")
-print(f"  Deliveries: {len(all_deliveries):,}")
-print(f"  Players:    {len(all_players):,}")
-print(f"  Errors:     {len(error_files)}")
-if error_files:
-    print(f"  First 5 errors:")
-    for ef, err in error_files[:5]:
-        print(f"    {ef}: {err}")
-
-# CELL ********************
-
-# MARKDOWN ********************
-
-# ## Step 3: Create DataFrames and write Delta tables
-# 
-# Player name ↔ ID mapping uses Cricsheet's registry (8-char hex IDs).
-# These are stable across all matches — the same player always has the same ID.
-
-# CELL ********************
-
-# --- PLAYERS TABLE ---
 # Schema matches cricket-mcp: player_id (registry hex ID), player_name
 # batting_style, bowling_style, playing_role, country are NULL initially
 # (populated later by the PlayerEnrichment dataflow)
@@ -275,16 +170,6 @@ players_schema = StructType([
     StructField("country", StringType()),
 ])
 
-player_rows = [{"player_id": pid, "player_name": name, "batting_style": None, "bowling_style": None, "playing_role": None, "country": None} for pid, name in all_players.items()]
-players_df = spark.createDataFrame(player_rows, schema=players_schema)
-
-print(f"Players: {players_df.count():,} rows")
-players_df.write.format("delta").mode("overwrite").option("overwriteSchema", "true").saveAsTable("players")
-print("✓ players table written")
-
-# CELL ********************
-
-# --- MATCHES TABLE ---
 matches_schema = StructType([
     StructField("match_id", StringType()),
     StructField("data_version", StringType()),
@@ -316,15 +201,6 @@ matches_schema = StructType([
     StructField("season", StringType()),
 ])
 
-matches_df = spark.createDataFrame(all_matches, schema=matches_schema)
-
-print(f"Matches: {matches_df.count():,} rows")
-matches_df.write.format("delta").mode("overwrite").option("overwriteSchema", "true").saveAsTable("matches")
-print("✓ matches table written")
-
-# CELL ********************
-
-# --- INNINGS TABLE ---
 innings_schema = StructType([
     StructField("match_id", StringType()),
     StructField("innings_number", IntegerType()),
@@ -337,15 +213,6 @@ innings_schema = StructType([
     StructField("is_super_over", BooleanType()),
 ])
 
-innings_df = spark.createDataFrame(all_innings, schema=innings_schema)
-
-print(f"Innings: {innings_df.count():,} rows")
-innings_df.write.format("delta").mode("overwrite").option("overwriteSchema", "true").saveAsTable("innings")
-print("✓ innings table written")
-
-# CELL ********************
-
-# --- DELIVERIES TABLE ---
 deliveries_schema = StructType([
     StructField("match_id", StringType()),
     StructField("innings_number", IntegerType()),
@@ -376,39 +243,2085 @@ deliveries_schema = StructType([
     StructField("bowling_team", StringType()),
 ])
 
-# Create in batches to avoid driver memory issues
-BATCH_SIZE = 2_000_000
-total_deliveries = len(all_deliveries)
-print(f"Writing {total_deliveries:,} deliveries in batches of {BATCH_SIZE:,}...")
+# Summary tables: one row per player per innings, aggregated from deliveries
+batting_innings_schema = StructType([
+    StructField("match_id", StringType()),
+    StructField("innings_number", IntegerType()),
+    StructField("player_id", StringType()),
+    StructField("player_name", StringType()),
+    StructField("batting_team", StringType()),
+    StructField("runs", IntegerType()),
+    StructField("balls_faced", IntegerType()),
+    StructField("fours", IntegerType()),
+    StructField("sixes", IntegerType()),
+    StructField("is_out", BooleanType()),
+    StructField("dismissal_kind", StringType()),  # also set for retirements, which aren't outs
+])
 
-for i in range(0, total_deliveries, BATCH_SIZE):
-    batch = all_deliveries[i:i + BATCH_SIZE]
-    batch_df = spark.createDataFrame(batch, schema=deliveries_schema)
-    
-    mode = "overwrite" if i == 0 else "append"
-    batch_df.write.format("delta").mode(mode).option("overwriteSchema", "true").saveAsTable("deliveries")
-    
-    print(f"  Batch {i // BATCH_SIZE + 1}: wrote {len(batch):,} rows ({i + len(batch):,}/{total_deliveries:,})")
+bowling_innings_schema = StructType([
+    StructField("match_id", StringType()),
+    StructField("innings_number", IntegerType()),
+    StructField("player_id", StringType()),
+    StructField("player_name", StringType()),
+    StructField("bowling_team", StringType()),
+    StructField("legal_balls", IntegerType()),
+    StructField("runs_conceded", IntegerType()),
+    StructField("wickets", IntegerType()),
+    StructField("dots", IntegerType()),
+    StructField("fours", IntegerType()),
+    StructField("sixes", IntegerType()),
+    StructField("wides", IntegerType()),
+    StructField("noballs", IntegerType()),
+])
+
+# Wicket kinds the semantic model's measures leave out (semantic-model/tables/deliveries.tmdl)
+NON_DISMISSAL_KINDS = ["retired hurt", "retired not out", "retired out"]  # 'Dismissals'
+NON_BOWLER_WICKET_KINDS = NON_DISMISSAL_KINDS + [                       # 'Wickets'
+    "run out", "obstructing the field", "handled the ball", "hit the ball twice",
+]
+# Wicket kinds that don't cost the batting side a wicket (running_wickets)
+NON_TEAM_WICKET_KINDS = ["retired hurt", "retired not out"]
+
+
+def with_delivery_flags(df):
+    """Add the additive columns the semantic model SUMs instead of iterating FILTER over deliveries.
+
+    Each is 0/1 per ball (bowler_runs is the runs charged to the bowler), encoding the rules above.
+    """
+    return df.select(
+        "*",
+        ((F.col("extras_wides") == 0) & (F.col("extras_noballs") == 0)).cast("int").alias("is_legal_ball"),
+        (F.col("extras_wides") == 0).cast("int").alias("is_ball_faced"),
+        (F.col("is_wicket") & ~F.coalesce(F.col("wicket_kind").isin(NON_DISMISSAL_KINDS), F.lit(False)))
+        .cast("int").alias("is_batter_dismissal"),
+        (F.col("is_wicket") & ~F.coalesce(F.col("wicket_kind").isin(NON_BOWLER_WICKET_KINDS), F.lit(False)))
+        .cast("int").alias("is_bowler_wicket"),
+        (F.col("runs_total") - F.col("extras_byes") - F.col("extras_legbyes")).alias("bowler_runs"),
+        (F.col("runs_batter").isin(4, 6) & ~F.col("runs_non_boundary")).cast("int").alias("is_boundary"),
+    )
+
+
+# Match columns with_match_state needs, joined onto deliveries at write time; it also needs the
+# innings' is_super_over, joined on (match_id, innings_number)
+MATCH_STATE_INPUTS = ["overs_per_side", "balls_per_over"]
+
+
+def with_match_state(df):
+    """Add the situation at each ball, from one window pass per (match_id, innings_number).
+
+    Needs is_legal_ball (with_delivery_flags), MATCH_STATE_INPUTS and the innings' is_super_over
+    (null counts as false). legal_ball_index counts the innings' legal balls up to and including
+    this one; balls_remaining is what is left of the overs_per_side * balls_per_over allocation, or
+    of one over in a super over; running_runs / running_wickets are the score after this ball.
+    phase splits a limited-overs innings into powerplay, middle and death overs — the first 30% and
+    last 25% of the overs up to 20 overs a side (1-6 / 7-15 / 16-20 in a T20), the first and last
+    20% beyond (1-10 / 11-40 / 41-50 in an ODI) — or is "super over". phase and balls_remaining are
+    null in unlimited-overs matches.
+    """
+    innings = (Window.partitionBy("match_id", "innings_number").orderBy("over_number", "ball_number")
+               .rowsBetween(Window.unboundedPreceding, Window.currentRow))
+    overs = F.col("overs_per_side")
+    powerplay_overs = F.round(overs * F.when(overs <= 20, 0.3).otherwise(0.2))
+    death_overs = F.round(overs * F.when(overs <= 20, 0.25).otherwise(0.2))
+    legal_ball_index = F.sum("is_legal_ball").over(innings).cast("int")
+    super_over = F.coalesce(F.col("is_super_over"), F.lit(False))
+    # A super over is allotted one over
+    allotted_overs = F.when(super_over, 1).otherwise(overs)
+    team_wicket = F.col("is_wicket") & ~F.coalesce(F.col("wicket_kind").isin(NON_TEAM_WICKET_KINDS), F.lit(False))
+    return df.select(
+        "*",
+        F.when(super_over, "super over")
+        .when(overs.isNull(), F.lit(None).cast("string"))
+        .when(F.col("over_number") < powerplay_overs, "powerplay")
+        .when(F.col("over_number") >= overs - death_overs, "death")
+        .otherwise("middle").alias("phase"),
+        legal_ball_index.alias("legal_ball_index"),
+        (allotted_overs * F.col("balls_per_over") - legal_ball_index).alias("balls_remaining"),
+        F.sum("runs_total").over(innings).cast("int").alias("running_runs"),
+        F.sum(team_wicket.cast("int")).over(innings).cast("int").alias("running_wickets"),
+    )
+
+
+# Batter vs bowler totals per format and season (BUILD_MATCHUPS); same rules as the summary tables
+matchups_schema = StructType([
+    StructField("batter_id", StringType()),
+    StructField("batter", StringType()),
+    StructField("bowler_id", StringType()),
+    StructField("bowler", StringType()),
+    StructField("match_type", StringType()),
+    StructField("season", StringType()),
+    StructField("balls", IntegerType()),
+    StructField("runs", IntegerType()),
+    StructField("dismissals", IntegerType()),
+    StructField("dots", IntegerType()),
+    StructField("fours", IntegerType()),
+    StructField("sixes", IntegerType()),
+])
+MATCHUPS_CLUSTER_BY = ["batter_id", "bowler_id"]
+
+# deliveries_wide (BUILD_DELIVERIES_WIDE): the match columns it carries always include its layout keys
+DELIVERIES_WIDE_PARTITION_BY = ["match_type"]
+DELIVERIES_WIDE_CLUSTER_BY = ["season", "venue"]
+deliveries_wide_columns = list(dict.fromkeys(DELIVERIES_WIDE_PARTITION_BY + DELIVERIES_WIDE_CLUSTER_BY + DELIVERIES_WIDE_COLUMNS))
+unknown_wide_columns = [c for c in deliveries_wide_columns if c not in matches_schema.fieldNames()]
+if unknown_wide_columns:
+    raise ValueError(f"DELIVERIES_WIDE_COLUMNS not in matches: {unknown_wide_columns}")
+
+# One row per ingested ZIP member. CRC-32 and size come from the ZIP central directory,
+# so change detection needs no decompression.
+manifest_schema = StructType([
+    StructField("match_id", StringType()),
+    StructField("data_version", StringType()),
+    StructField("zip_crc", LongType()),
+    StructField("zip_size", LongType()),
+])
+
+
+def to_spark_dataframe(buffer, schema):
+    """Build a DataFrame from a (Compact)ColumnBuffer laid out after schema, via Arrow — no per-row dicts or pickling."""
+    arrow_schema = to_arrow_schema(schema)
+    table = pa.Table.from_arrays(buffer.arrow_arrays(arrow_schema), schema=arrow_schema)
+    if int(spark.version.split('.')[0]) >= 4:
+        return spark.createDataFrame(table)  # Spark 4 accepts pyarrow Tables directly
+    # Spark 3.x: the pandas frame is converted back to Arrow batches and streamed to the JVM
+    return spark.createDataFrame(table.to_pandas(), schema=schema)
+
+
+def match_id_predicate(match_ids):
+    quoted = ("'" + match_id.replace("'", "''") + "'" for match_id in sorted(match_ids))
+    return f"match_id IN ({', '.join(quoted)})"
+
+
+def matchup_key_predicate(keys):
+    """SQL predicate for a set of (match_type, season) pairs; either may be null."""
+    def literal(value):
+        return "NULL" if value is None else "'" + value.replace("'", "''") + "'"
+    return " OR ".join(f"(match_type <=> {literal(match_type)} AND season <=> {literal(season)})"
+                       for match_type, season in sorted(keys, key=repr))
+
+
+def create_clustered_table(table, schema, cluster_by):
+    """(Re)create table empty with liquid clustering — the keys are part of the table definition."""
+    columns = ", ".join(f"`{field.name}` {field.dataType.simpleString()}" for field in schema.fields)
+    spark.sql(f"CREATE OR REPLACE TABLE {table} ({columns}) USING DELTA CLUSTER BY ({', '.join(cluster_by)})")
+
+
+def save_clustered_rows(df, table, cluster_by, replace_where=None, partition_by=()):
+    """Write a derived table clustered on cluster_by the way DELIVERIES_LAYOUT clusters deliveries.
+
+    "liquid" creates it with CLUSTER BY (and no partitions); otherwise files are sorted on cluster_by
+    here and Z-ordered by the optimize step. replace_where replaces just those rows instead of
+    rebuilding the table.
+    """
+    liquid = DELIVERIES_LAYOUT == "liquid"
+    if not liquid:
+        df = df.sortWithinPartitions(*cluster_by)
+    writer = df.write.format("delta")
+    if partition_by and not liquid:
+        writer = writer.partitionBy(*partition_by)
+
+    if replace_where is not None:
+        writer.mode("overwrite").option("replaceWhere", replace_where).saveAsTable(table)
+    elif liquid:
+        create_clustered_table(table, df.schema, cluster_by)
+        writer.mode("append").saveAsTable(table)
+    else:
+        writer.mode("overwrite").option("overwriteSchema", "true").saveAsTable(table)
+
+
+# --- SLIM DELIVERIES ---
+# Keys are derived from the natural IDs, so every run and every incremental batch agrees on them
+# without a key registry: Cricsheet match IDs are numeric, player IDs are 8 hex digits.
+def match_key(column):
+    return column.cast("long")
+
+
+def player_key(column):
+    return F.conv(column, 16, 10).cast("long")
+
+
+def team_key(column):
+    return F.xxhash64(column)
+
+
+# Code = 1-based position; 0 marks a kind missing from the list (the validate cell fails on it)
+WICKET_KINDS = [
+    "bowled", "caught", "caught and bowled", "lbw", "stumped", "run out", "hit wicket",
+    "retired hurt", "retired not out", "retired out", "obstructing the field", "handled the ball",
+    "hit the ball twice", "timed out",
+]
+PHASES = ["powerplay", "middle", "death", "super over"]
+
+# Wide column -> slim column. The player name columns are dropped; names live in players.player_name
+SLIM_KEY_COLUMNS = {
+    "match_id": "match_key",
+    "batter_id": "batter_key",
+    "bowler_id": "bowler_key",
+    "non_striker_id": "non_striker_key",
+    "wicket_player_out_id": "wicket_player_out_key",
+    "batting_team": "batting_team_key",
+    "bowling_team": "bowling_team_key",
+    "wicket_kind": "wicket_kind_code",
+    "phase": "phase_code",
+}
+SLIM_PLAYER_ROLES = ["batter", "bowler", "non_striker", "wicket_player_out"]
+
+
+def code_of(values, column):
+    codes = F.create_map(*[F.lit(x) for code, value in enumerate(values, 1) for x in (value, code)])
+    return F.when(column.isNotNull(), F.coalesce(codes[column], F.lit(0))).cast("smallint")
+
+
+def value_of(values, code):
+    names = F.create_map(*[F.lit(x) for code, value in enumerate(values, 1) for x in (code, value)])
+    return names[code.cast("int")]
+
+
+def to_slim_deliveries(df):
+    """Swap deliveries' string IDs, names and low-cardinality strings for keys and codes, in place.
+
+    Fielder names stay: they have no registry ID in deliveries and are almost always null.
+    """
+    encode = {"match_id": match_key, "batting_team": team_key, "bowling_team": team_key,
+              "wicket_kind": lambda c: code_of(WICKET_KINDS, c), "phase": lambda c: code_of(PHASES, c)}
+    return df.select(*[
+        encode.get(c, player_key)(F.col(c)).alias(SLIM_KEY_COLUMNS[c]) if c in SLIM_KEY_COLUMNS else c
+        for c in df.columns if c not in SLIM_PLAYER_ROLES
+    ])
+
+
+def deliveries_match_predicate(match_ids):
+    """match_id_predicate for the deliveries table, which keys matches by match_key when slim."""
+    if not DELIVERIES_SLIM:
+        return match_id_predicate(match_ids)
+    return f"match_key IN ({', '.join(str(int(match_id)) for match_id in sorted(match_ids))})"
+
+
+def read_deliveries(match_ids=None):
+    """The deliveries table (only match_ids, if given) with its wide columns.
+
+    Slim deliveries are decoded back to IDs, names, teams and kinds through the players and teams
+    tables, so summaries and validation read both variants the same way. Player names are then the
+    players table's, not the spelling in each match file.
+    """
+    df = spark.table("deliveries")
+    if match_ids is not None:
+        df = df.where(deliveries_match_predicate(match_ids))
+    if not DELIVERIES_SLIM:
+        return df
+
+    slim_columns = df.columns
+    players = spark.table("players")
+    for role in SLIM_PLAYER_ROLES:
+        df = df.join(F.broadcast(players.select(F.col("player_key").alias(f"{role}_key"),
+                                                F.col("player_name").alias(role))), f"{role}_key", "left")
+    teams = spark.table("teams")
+    for side in ("batting_team", "bowling_team"):
+        df = df.join(F.broadcast(teams.select(F.col("team_key").alias(f"{side}_key"),
+                                              F.col("team_name").alias(side))), f"{side}_key", "left")
+
+    wide_names = {slim: wide for wide, slim in SLIM_KEY_COLUMNS.items()}
+    decode = {
+        "match_key": F.col("match_key").cast("string"),
+        "batting_team_key": F.col("batting_team"),
+        "bowling_team_key": F.col("bowling_team"),
+        "wicket_kind_code": value_of(WICKET_KINDS, F.col("wicket_kind_code")),
+        "phase_code": value_of(PHASES, F.col("phase_code")),
+    }
+    columns = []
+    for c in slim_columns:
+        if c in decode:
+            columns.append(decode[c].alias(wide_names[c]))
+        elif c in wide_names:
+            # A player key: the name column, then the 8-hex-digit ID
+            role = wide_names[c][:-len("_id")]
+            columns += [F.col(role), F.lpad(F.lower(F.conv(F.col(c), 10, 16)), 8, "0").alias(wide_names[c])]
+        else:
+            columns.append(F.col(c))
+    return df.select(*columns)
+
+
+# --- DELIVERIES LAYOUT ---
+DELIVERIES_LAYOUTS = ("none", "zorder", "liquid")
+if DELIVERIES_LAYOUT not in DELIVERIES_LAYOUTS:
+    raise ValueError(f"Unknown DELIVERIES_LAYOUT {DELIVERIES_LAYOUT!r}; expected one of {', '.join(DELIVERIES_LAYOUTS)}")
+if DELIVERIES_LAYOUT == "none":
+    # No clustering, so the cluster keys are neither sorted on nor carried onto deliveries
+    DELIVERIES_CLUSTER_BY = []
+if DELIVERIES_LAYOUT == "liquid" and DELIVERIES_PARTITION_BY:
+    raise ValueError("Liquid clustering replaces partitioning — set DELIVERIES_PARTITION_BY = [] for the liquid layout")
+if set(DELIVERIES_PARTITION_BY) & set(DELIVERIES_CLUSTER_BY):
+    raise ValueError("A column can't be both a partition and a cluster key of deliveries")
+# Layout columns that live on matches and are joined onto deliveries at write time
+match_layout_columns = [c for c in dict.fromkeys(DELIVERIES_PARTITION_BY + DELIVERIES_CLUSTER_BY)
+                        if c not in deliveries_schema.fieldNames()]
+unknown_layout_columns = [c for c in match_layout_columns if c not in matches_schema.fieldNames()]
+if unknown_layout_columns:
+    raise ValueError(f"Deliveries layout columns not in deliveries or matches: {unknown_layout_columns}")
+if DELIVERIES_SLIM:
+    if set(DELIVERIES_PARTITION_BY + DELIVERIES_CLUSTER_BY) & set(SLIM_PLAYER_ROLES):
+        raise ValueError("Slim deliveries have no player name columns to lay out by — use the *_id columns")
+    # Slim deliveries partition and cluster on the keys that replace the ID columns
+    DELIVERIES_PARTITION_BY = [SLIM_KEY_COLUMNS.get(c, c) for c in DELIVERIES_PARTITION_BY]
+    DELIVERIES_CLUSTER_BY = [SLIM_KEY_COLUMNS.get(c, c) for c in DELIVERIES_CLUSTER_BY]
+
+
+def prepare_deliveries(df, matches_df, innings_df):
+    """The deliveries rows as written: flags, match state, layout columns, slim form and sort order.
+
+    Adds the flag (with_delivery_flags) and match-state (with_match_state) columns; matches_df
+    supplies MATCH_STATE_INPUTS and match_layout_columns (joined on match_id), innings_df the
+    super-over innings. Every match in df must be complete, since the match-state window runs over
+    whole innings. DELIVERIES_SLIM gives the to_slim_deliveries form.
+    """
+    match_columns = list(dict.fromkeys(MATCH_STATE_INPUTS + match_layout_columns))
+    # Only the super overs are joined (the rest come out null, i.e. false): a few rows to broadcast
+    super_overs = innings_df.filter("is_super_over").select("match_id", "innings_number", "is_super_over")
+    df = (with_delivery_flags(df)
+          .join(F.broadcast(matches_df.select("match_id", *match_columns)), "match_id", "left")
+          .join(F.broadcast(super_overs), ["match_id", "innings_number"], "left"))
+    df = with_match_state(df)
+    # Match-state inputs are dropped again; layout columns stay, trailing
+    df = df.select(*[c for c in df.columns if c not in match_columns and c != "is_super_over"], *match_layout_columns)
+    if DELIVERIES_SLIM:
+        df = to_slim_deliveries(df)
+    if DELIVERIES_LAYOUT == "zorder" and DELIVERIES_CLUSTER_BY:
+        # Sorted files already have tight min/max stats before OPTIMIZE re-clusters them
+        df = df.sortWithinPartitions(*DELIVERIES_CLUSTER_BY)
+    return df
+
+
+def save_deliveries(df, matches_df, innings_df, match_ids, append=False):
+    """Write prepare_deliveries(df, matches_df, innings_df) with the configured layout; same full/incremental
+    semantics as save_match_rows. append=True adds a later chunk of a full ingest instead of
+    replacing the table.
+    """
+    df = prepare_deliveries(df, matches_df, innings_df)
+    writer = df.write.format("delta")
+    if DELIVERIES_PARTITION_BY:
+        writer = writer.partitionBy(*DELIVERIES_PARTITION_BY)
+
+    if incremental_run:
+        if match_ids:
+            writer.mode("overwrite").option("replaceWhere", deliveries_match_predicate(match_ids)).saveAsTable("deliveries")
+    elif append:
+        writer.mode("append").saveAsTable("deliveries")
+    elif DELIVERIES_LAYOUT == "liquid":
+        create_clustered_table("deliveries", df.schema, DELIVERIES_CLUSTER_BY)
+        writer.mode("append").saveAsTable("deliveries")
+    else:
+        writer.mode("overwrite").option("overwriteSchema", "true").saveAsTable("deliveries")
+
+
+def save_match_rows(df, table, match_ids):
+    """Overwrite table on a full ingest; on an incremental one replace only the rows of match_ids."""
+    if not incremental_run:
+        df.write.format("delta").mode("overwrite").option("overwriteSchema", "true").saveAsTable(table)
+    elif match_ids:
+        df.write.format("delta").mode("overwrite").option("replaceWhere", match_id_predicate(match_ids)).saveAsTable(table)
+
+
+# --- RUN METRICS ---
+# One etl_runs row per stage of a run, appended by the last cell, so trend queries can group by stage
+etl_runs_schema = StructType([
+    StructField("run_id", StringType()),
+    StructField("run_started_at", TimestampType()),
+    StructField("status", StringType()),             # "succeeded", or "failed" if any stage raised or never finished
+    StructField("ingest_mode", StringType()),        # as run: "full" or "incremental"
+    StructField("parse_mode", StringType()),
+    StructField("parse_backend", StringType()),
+    StructField("stage", StringType()),
+    StructField("stage_started_at", TimestampType()),
+    StructField("seconds", DoubleType()),
+    StructField("rows", LongType()),
+    StructField("bytes", LongType()),
+    StructField("peak_driver_rss_mb", DoubleType()),
+    StructField("errors", LongType()),
+    StructField("error", StringType()),
+])
+
+
+# One etl_validation row per check and scope (a match_type, "(no match)" for orphans, or "all")
+validation_results_schema = StructType([
+    StructField("run_id", StringType()),
+    StructField("checked_at", TimestampType()),
+    StructField("check", StringType()),
+    StructField("scope", StringType()),
+    StructField("value", DoubleType()),
+    StructField("max_value", DoubleType()),        # null for checks that only record a value
+    StructField("severity", StringType()),         # "hard" fails the run, "warn" is printed, "info" is recorded
+    StructField("passed", BooleanType()),
+])
 
-print("✓ deliveries table written")
+
+def driver_rss_mb():
+    """Resident set size of the driver process in MB (falls back to peak RSS off Linux)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def table_version(table):
+    """Latest Delta version of table, or -1 before it exists."""
+    if not spark.catalog.tableExists(table):
+        return -1
+    return DeltaTable.forName(spark, table).history(1).first()["version"]
+
+
+def commit_metrics(table, after_version):
+    """(rows, bytes) written by table's commits after after_version, from their Delta operationMetrics."""
+    history = DeltaTable.forName(spark, table)
+    latest = history.history(1).first()["version"]
+    commits = history.history(latest - after_version).collect() if latest > after_version else []
+    metrics = [commit["operationMetrics"] or {} for commit in commits]
+    return (sum(int(m.get("numOutputRows", 0)) for m in metrics),
+            sum(int(m.get("numOutputBytes", 0)) for m in metrics))
+
+
+class RunMetrics:
+    """Wall time, rows, bytes, peak driver RSS and error counts per stage of one ETL run.
+
+    start(stage) / end(stage, rows=..., bytes=..., errors=...) bracket a stage that spans a cell;
+    stage(name) and table_write(table) do the same around a block and record the exception if it
+    raises. A stage that runs again (each deliveries chunk) adds to its record. Stages can overlap:
+    in driver mode write_deliveries runs inside parse, so parse's time includes it. A background
+    thread samples driver RSS into every running stage.
+    """
+
+    def __init__(self, ingest_mode, parse_mode, parse_backend, sample_interval=0.5):
+        self.run_id = uuid.uuid4().hex
+        self.started_at = datetime.now()
+        self.ingest_mode = ingest_mode
+        self.parse_mode = parse_mode
+        self.parse_backend = parse_backend
+        self.stages = {}   # {stage: record}, in the order the stages first started
+        self.running = {}  # {stage: perf_counter() at start}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        threading.Thread(target=self.sample_loop, args=(sample_interval,), daemon=True).start()
+
+    def sample_loop(self, interval):
+        while not self.stopped.wait(interval):
+            self.sample()
+
+    def sample(self):
+        rss = driver_rss_mb()
+        with self.lock:
+            for stage in self.running:
+                record = self.stages[stage]
+                record["peak_driver_rss_mb"] = max(record["peak_driver_rss_mb"] or 0.0, rss)
+
+    def start(self, stage):
+        with self.lock:
+            self.stages.setdefault(stage, {
+                "stage": stage, "stage_started_at": datetime.now(), "seconds": 0.0, "rows": None,
+                "bytes": None, "peak_driver_rss_mb": None, "errors": 0, "error": None,
+            })
+            self.running[stage] = time.perf_counter()
+        self.sample()
+
+    def add(self, stage, rows=None, bytes=None, errors=0):
+        """Add to a stage's counts; None leaves a count as it is."""
+        with self.lock:
+            record = self.stages[stage]
+            if rows is not None:
+                record["rows"] = (record["rows"] or 0) + rows
+            if bytes is not None:
+                record["bytes"] = (record["bytes"] or 0) + bytes
+            record["errors"] += errors
+
+    def end(self, stage, rows=None, bytes=None, errors=0, error=None):
+        self.sample()
+        self.add(stage, rows, bytes, errors)
+        with self.lock:
+            record = self.stages[stage]
+            record["seconds"] += time.perf_counter() - self.running.pop(stage)
+            if error is not None:
+                record["error"] = error
+
+    @contextmanager
+    def stage(self, name):
+        self.start(name)
+        try:
+            yield
+        except Exception as e:
+            self.end(name, errors=1, error=f"{type(e).__name__}: {e}"[:1000])
+            raise
+        self.end(name)
+
+    @contextmanager
+    def table_write(self, table, stage=None):
+        """stage() around a Delta write; rows and bytes come from the commits the block made to table."""
+        stage = stage or f"write_{table}"
+        version = table_version(table)
+        with self.stage(stage):
+            yield
+        self.add(stage, *commit_metrics(table, version))
+
+    def finish(self):
+        """Stop sampling and return the run as a dict; a stage that is still running counts as failed."""
+        self.stopped.set()
+        for stage in list(self.running):
+            self.end(stage, errors=1, error="did not finish")
+        failed = any(record["error"] for record in self.stages.values())
+        return {
+            "run_id": self.run_id, "run_started_at": self.started_at, "status": "failed" if failed else "succeeded",
+            "ingest_mode": self.ingest_mode, "parse_mode": self.parse_mode, "parse_backend": self.parse_backend,
+            "stages": list(self.stages.values()),
+        }
+
+
+# --- CHECKPOINTS ---
+class RunCheckpoint:
+    """Progress of one ETL run under directory, so a rerun after a failure resumes where it stopped.
+
+    key identifies the run's input (archive members and table-shaping parameters); a checkpoint
+    left with another key is discarded. Driver-mode deliveries chunks are recorded with the
+    matches, innings, players and errors they parsed before they are committed, and committed with
+    userMetadata naming the checkpoint and chunk — a chunk only counts as done if that commit
+    exists. Other table writes are recorded as steps once they finish; a step redone after a crash
+    between its commit and its record is an overwrite, so redoing it is harmless. directory=None
+    turns checkpointing off.
+    """
+
+    def __init__(self, directory, key):
+        self.directory = directory
+        self.resumed = False
+        self.lock = threading.Lock()  # steps finish from write_steps' threads
+        self.state = {"key": key, "id": uuid.uuid4().hex, "chunks": [], "steps": [], "values": {}}
+        if directory is None:
+            return
+        self.state_path = os.path.join(directory, "checkpoint.json")
+        previous = read_json_file(self.state_path)
+        if previous and previous.get("key") == key:
+            self.state = previous
+            self.resumed = True
+        else:
+            shutil.rmtree(directory, ignore_errors=True)
+            os.makedirs(directory)
+            self.save()
+
+    def save(self):
+        if self.directory is not None:
+            write_json_file(self.state_path, self.state)
+
+    @contextmanager
+    def commit_metadata(self, **fields):
+        """Tag every Delta commit made in the block with this checkpoint and fields."""
+        if self.directory is None:
+            yield
+            return
+        spark.conf.set("spark.databricks.delta.commitInfo.userMetadata", json.dumps({"checkpoint": self.state["id"], **fields}))
+        try:
+            yield
+        finally:
+            spark.conf.unset("spark.databricks.delta.commitInfo.userMetadata")
+
+    def record_chunk(self, chunk, **parsed):
+        """Save a deliveries chunk's parsed rows (json_files, matches, innings, players, errors) before its commit."""
+        if self.directory is None:
+            return
+        write_json_file(os.path.join(self.directory, f"chunk-{chunk:05d}.json"), parsed)
+        self.state["chunks"].append(chunk)
+        self.save()
+
+    def committed_chunks(self):
+        """The recorded chunks whose deliveries commit exists, in order, with their parsed rows."""
+        if not self.resumed or not self.state["chunks"] or not spark.catalog.tableExists("deliveries"):
+            return []
+        committed = set()
+        for commit in DeltaTable.forName(spark, "deliveries").history().select("userMetadata", "operationMetrics").collect():
+            metadata = json.loads(commit["userMetadata"]) if commit["userMetadata"] else {}
+            # Liquid layouts also tag the empty CREATE; only a commit that wrote rows counts
+            if metadata.get("checkpoint") == self.state["id"] and "numOutputRows" in (commit["operationMetrics"] or {}):
+                committed.add(metadata["chunk"])
+        chunks = []
+        for chunk in self.state["chunks"]:
+            if chunk not in committed:
+                break
+            chunks.append(read_json_file(os.path.join(self.directory, f"chunk-{chunk:05d}.json")))
+        # Whatever came after the last committed chunk is parsed again
+        self.state["chunks"] = self.state["chunks"][:len(chunks)]
+        self.save()
+        return chunks
+
+    def step_done(self, step):
+        return step in self.state["steps"]
+
+    def finish_step(self, step):
+        if self.directory is not None:
+            with self.lock:
+                self.state["steps"].append(step)
+                self.save()
+
+    def clear(self):
+        if self.directory is not None:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def write_step(table, write, step=None):
+    """Run write(), a Delta write to table, as the checkpointed step step (default: table) and a run_metrics stage.
+
+    Returns False without writing if an interrupted run over the same input already finished it.
+    Steps aren't tagged with commit_metadata: that is a session-wide conf, which concurrent
+    write_steps would overwrite, and only deliveries chunks are checked against the table history.
+    """
+    step = step or table
+    if checkpoint.step_done(step):
+        print(f"⏭ {step} already written by the interrupted run — skipped")
+        return False
+    with run_metrics.table_write(table, stage=f"write_{step}"):
+        write()
+    checkpoint.finish_step(step)
+    return True
+
+
+def write_steps(steps, workers=1):
+    """write_step(table, write) for each (table, write) in steps, from up to workers threads at once.
+
+    PySpark runs each thread's jobs on its own JVM thread, so the scheduler runs the writes side
+    by side. Every step runs even if another fails; failures are printed per table and raised
+    together once all steps are done.
+    """
+    def timed_step(table, write):
+        started = time.perf_counter()
+        return write_step(table, write), time.perf_counter() - started
+
+    failures = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(steps)))) as pool:
+        futures = [(table, pool.submit(timed_step, table, write)) for table, write in steps]
+        for table, future in futures:
+            try:
+                written, seconds = future.result()
+            except Exception as e:
+                failures[table] = e
+                print(f"✗ {table} write failed: {type(e).__name__}: {e}")
+            else:
+                if written:
+                    # Rows from the commits' operationMetrics, recorded by run_metrics.table_write
+                    rows = run_metrics.stages[f"write_{table}"]["rows"]
+                    print(f"✓ {table} table written: {rows:,} rows ({seconds:.1f}s)")
+    if failures:
+        raise RuntimeError(f"{len(failures)} table write(s) failed: {', '.join(failures)}") from next(iter(failures.values()))
 
 # CELL ********************
 
 # MARKDOWN ********************
 
-# ## Step 4: Optimize tables with V-Order
+# ## Step 1: Download Cricsheet data
+#
+# The archive is cached under `DOWNLOAD_DIR` with a `.meta.json` sidecar holding the ETag and
+# Last-Modified it was fetched with. Each run sends a conditional request and reuses the cached
+# copy on `304 Not Modified`; otherwise the archive is fetched in parallel byte ranges into a
+# `.part` file whose progress sidecar lets a failed fetch resume, then checked for size and
+# member CRCs before it replaces the cached copy. Members are read straight from the in-memory
+# `ZipFile` — nothing is extracted to local disk.
+
+# CELL ********************
+
+# --- DOWNLOAD HELPERS ---
+
+def http_request(url, method="GET", headers=None, timeout=60):
+    return urllib.request.urlopen(urllib.request.Request(url, method=method, headers=headers or {}), timeout=timeout)
+
+
+def read_json_file(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_json_file(path, obj):
+    # Write-then-rename so an interrupted run never leaves a truncated sidecar
+    with open(path + ".tmp", "w") as f:
+        json.dump(obj, f)
+    os.replace(path + ".tmp", path)
+
+
+def verify_archive(path, expected_size):
+    """Raise IOError unless path has the expected size and every member's CRC-32 checks out."""
+    size = os.path.getsize(path)
+    if expected_size is not None and size != expected_size:
+        raise IOError(f"{path}: expected {expected_size:,} bytes, got {size:,}")
+    try:
+        with zipfile.ZipFile(path) as zf:
+            bad_member = zf.testzip()
+    except (zipfile.BadZipFile, zlib.error, EOFError) as e:
+        raise IOError(f"{path}: corrupt archive ({e})") from e
+    if bad_member is not None:
+        raise IOError(f"{path}: CRC mismatch in {bad_member}")
+
+
+def fetch_ranges(url, part_path, remote, workers, chunk_size, retries, timeout):
+    """Fill part_path with url's bytes using parallel Range requests, resuming from part_path + '.json'.
+
+    The progress sidecar records the version (ETag/Last-Modified/size) being fetched, the chunk size
+    and the start offset of every completed range; it is only reused when the server still reports
+    that version and the chunk size is unchanged, since the offsets only line up with the same chunks.
+    """
+    state_path = part_path + ".json"
+    size = remote["size"]
+    version = {k: remote[k] for k in ("etag", "last_modified", "size")}
+    version["chunk_size"] = chunk_size
+    state = read_json_file(state_path)
+    if not state or state.get("version") != version or not os.path.exists(part_path):
+        state = {"version": version, "done": []}
+        with open(part_path, "wb") as f:
+            f.truncate(size)
+        write_json_file(state_path, state)
+
+    done = set(state["done"])
+    pending = [(start, min(start + chunk_size, size) - 1) for start in range(0, size, chunk_size) if start not in done]
+    if done:
+        print(f"  Resuming: {len(done)} ranges already on disk, {len(pending)} to fetch")
+    # If-Range makes the server send the whole (new) file instead of a 206 if it changed mid-fetch
+    validator = remote["etag"] or remote["last_modified"]
+    lock = threading.Lock()
+
+    def fetch(byte_range):
+        start, end = byte_range
+        headers = {"Range": f"bytes={start}-{end}"}
+        if validator:
+            headers["If-Range"] = validator
+        for attempt in range(retries + 1):
+            try:
+                with http_request(url, headers=headers, timeout=timeout) as resp:
+                    if resp.status != 206:
+                        raise IOError(f"range {start}-{end}: expected 206, got {resp.status} (archive changed during fetch?)")
+                    data = resp.read()
+                if len(data) != end - start + 1:
+                    raise IOError(f"range {start}-{end}: got {len(data):,} bytes")
+                break
+            except OSError as e:
+                # Connection errors, short reads, 429 and 5xx are retried; other HTTP errors are not
+                retryable = not isinstance(e, urllib.error.HTTPError) or e.code == 429 or e.code >= 500
+                if not retryable or attempt == retries:
+                    raise
+                time.sleep(2 ** attempt)
+        os.pwrite(fd, data, start)
+        with lock:
+            state["done"].append(start)
+            write_json_file(state_path, state)
+
+    fd = os.open(part_path, os.O_WRONLY)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(fetch, pending))
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def fetch_archive(url, dest_path, workers=8, chunk_size=8 << 20, retries=3, timeout=60):
+    """Bring dest_path up to date with url; return True if a new copy was downloaded.
+
+    Sends If-None-Match/If-Modified-Since from dest_path + '.meta.json' and keeps the cached copy on
+    304 (or when the server ignores the headers but reports the same ETag and size). Servers that
+    don't advertise byte ranges or a length get a single-stream GET instead of parallel ranges.
+    """
+    meta_path = dest_path + ".meta.json"
+    part_path = dest_path + ".part"
+    cached = read_json_file(meta_path) if os.path.exists(dest_path) else None
+
+    headers = {}
+    if cached and cached.get("etag"):
+        headers["If-None-Match"] = cached["etag"]
+    if cached and cached.get("last_modified"):
+        headers["If-Modified-Since"] = cached["last_modified"]
+    try:
+        with http_request(url, "HEAD", headers, timeout) as resp:
+            length = resp.headers.get("Content-Length")
+            remote = {
+                "etag": resp.headers.get("ETag"),
+                "last_modified": resp.headers.get("Last-Modified"),
+                "size": int(length) if length else None,
+                "ranges": resp.headers.get("Accept-Ranges", "").lower() == "bytes",
+            }
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return False
+        raise
+    if cached and remote["etag"] and (remote["etag"], remote["size"]) == (cached.get("etag"), cached.get("size")):
+        return False
+
+    if remote["ranges"] and remote["size"]:
+        fetch_ranges(url, part_path, remote, workers, chunk_size, retries, timeout)
+    else:
+        with http_request(url, timeout=timeout) as resp, open(part_path, "wb") as f:
+            while chunk := resp.read(chunk_size):
+                f.write(chunk)
+
+    try:
+        verify_archive(part_path, remote["size"])
+    except IOError:
+        # Corrupt bytes can't be resumed from — the next attempt starts clean
+        for path in (part_path, part_path + ".json"):
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+    os.replace(part_path, dest_path)
+    write_json_file(meta_path, {"url": url, "etag": remote["etag"], "last_modified": remote["last_modified"],
+                                "size": os.path.getsize(dest_path), "fetched_at": datetime.now().isoformat()})
+    if os.path.exists(part_path + ".json"):
+        os.remove(part_path + ".json")
+    return True
 
 # CELL ********************
 
-tables = ["players", "matches", "innings", "deliveries"]
+# The run starts here: every later cell records its stage in run_metrics
+run_metrics = RunMetrics(INGEST_MODE, PARSE_MODE, PARSE_BACKEND)
+
+# Refresh the cached archive (conditional request, parallel ranges), then load it into memory
+os.makedirs(DOWNLOAD_DIR, exist_ok=True)
+zip_path = os.path.join(DOWNLOAD_DIR, os.path.basename(CRICSHEET_URL))
+print(f"Checking {CRICSHEET_URL}...")
+download_start = time.time()
+with run_metrics.stage("download"):
+    archive_changed = fetch_archive(CRICSHEET_URL, zip_path, workers=DOWNLOAD_WORKERS, chunk_size=DOWNLOAD_CHUNK_MB << 20)
+if archive_changed:
+    print(f"Downloaded new archive in {time.time() - download_start:.1f}s")
+    run_metrics.add("download", bytes=os.path.getsize(zip_path))
+else:
+    print(f"Archive unchanged since last fetch — using cached {zip_path}")
+    run_metrics.add("download", bytes=0)
+
+run_metrics.start("read_archive")
+with open(zip_path, 'rb') as f:
+    archive_bytes = f.read()
+zip_size_mb = len(archive_bytes) / (1024 * 1024)
+print(f"Archive size: {zip_size_mb:.1f} MB")
+
+# Members are decompressed on demand by the parser — no extraction step
+archive = zipfile.ZipFile(io.BytesIO(archive_bytes), 'r')
+json_files = [f for f in archive.namelist() if f.endswith('.json')]
+# {name: (crc32, size)} straight from the central directory
+zip_members = {i.filename: (i.CRC, i.file_size) for i in archive.infolist() if i.filename.endswith('.json')}
+json_sizes = {name: size for name, (_, size) in zip_members.items()}
+run_metrics.end("read_archive", rows=len(json_files), bytes=len(archive_bytes))
+
+print(f"Archive holds {len(json_files)} JSON files")
+
+# CELL ********************
+
+# MARKDOWN ********************
+
+# ## Step 2: Parse JSON files into structured rows
+# 
+# Each JSON file = 1 match. We parse into 4 sets of rows:
+# - players (from registry.people)
+# - matches (from info section)
+# - innings (from innings section)
+# - deliveries (from innings → overs → deliveries)
+#
+# `parse_match` fills column buffers laid out after the table schemas (no per-row dicts)
+# and is shared by both parse modes. In `distributed` mode the file list is
+# packed into shards of similar total size and each shard is parsed on an executor.
+# In `driver` mode matches are parsed lazily and deliveries are flushed to Delta in
+# memory-bounded chunks as they arrive, so the full 10.9M-row list never exists.
+#
+# With `INGEST_MODE = "incremental"` only ZIP members whose CRC-32/size differ from the
+# `etl_manifest` table are parsed, and each write replaces just those matches' rows.
 
+# CELL ********************
+
+def match_id_for(json_file):
+    # Match ID from filename (e.g., "1234567.json" → "1234567")
+    return os.path.splitext(os.path.basename(json_file))[0]
+
+
+class ColumnBuffer:
+    """Row buffer stored column-wise: one list per schema field, in schema order."""
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+        self.data = [[] for _ in self.columns]
+        # Bound list.append per column — the hot loop calls these directly
+        self.appenders = tuple(column.append for column in self.data)
+
+    def __len__(self):
+        return len(self.data[0])
+
+    def append(self, *values):
+        for append, value in zip(self.appenders, values):
+            append(value)
+
+    def column(self, name):
+        return self.data[self.columns.index(name)]
+
+    def rows(self, start=0):
+        return zip(*(column[start:] for column in self.data)) if start else zip(*self.data)
+
+    def arrow_arrays(self, arrow_schema):
+        return [pa.array(column, type=field.type) for column, field in zip(self.data, arrow_schema)]
+
+    def compact(self):
+        pass  # list columns already hold their final values
+
+    def truncate(self, length):
+        # del keeps each list (and its bound appender) alive
+        for column in self.data:
+            del column[length:]
+
+    def clear(self):
+        self.truncate(0)
+
+
+def arrow_from_array(values, arrow_type, validity=None):
+    # Copy out of the array.array so later truncates never hit an exported buffer
+    return pa.Array.from_buffers(arrow_type, len(values), [validity, pa.py_buffer(values.tobytes())])
+
+
+class DictionaryIndex(dict):
+    """{value: code} that gives each unseen value the next code and records it in values."""
+
+    def __init__(self):
+        super().__init__()
+        self.values = []
+
+    def __missing__(self, value):
+        code = self[value] = len(self.values)
+        self.values.append(value)
+        return code
+
+
+class DictionaryColumn:
+    """String column stored as int32 codes into the list of its distinct values.
+
+    The hot loop appends raw values to pending with list.append; compact() encodes them in a
+    single map() that only drops into Python for values the index hasn't seen. The dictionary
+    survives truncate(), so later chunks reuse the codes of names already seen.
+    """
+
+    def __init__(self):
+        self.index = DictionaryIndex()
+        self.codes = array('i')
+        self.pending = []
+        self.append = self.pending.append
+
+    def __len__(self):
+        return len(self.codes) + len(self.pending)
+
+    def compact(self):
+        if self.pending:
+            self.codes.extend(map(self.index.__getitem__, self.pending))
+            self.pending.clear()
+
+    def values(self):
+        self.compact()
+        return map(self.index.values.__getitem__, self.codes)
+
+    def to_arrow(self, arrow_type):
+        self.compact()
+        return pa.array(self.index.values, type=arrow_type).take(arrow_from_array(self.codes, pa.int32()))
+
+    def truncate(self, length):
+        encoded = len(self.codes)
+        if length >= encoded:
+            del self.pending[length - encoded:]
+        else:
+            del self.codes[length:]
+            self.pending.clear()
+
+
+class TypedColumn:
+    """Integer, double or boolean column in an array.array: 4 bytes per IntegerType value, 1 per BooleanType.
+
+    append is array.append, which rejects None. While nullable is set it is append_nullable
+    instead, which stores a None as 0 and records its position in nulls, the column's validity mask.
+    """
+
+    TYPECODES = {"integer": "i", "long": "q", "double": "d", "boolean": "b"}
+
+    def __init__(self, data_type):
+        self.boolean = data_type.typeName() == "boolean"
+        self.data = array(self.TYPECODES[data_type.typeName()])
+        self.nulls = []  # positions of None values, ascending
+        self.append = self.data.append
+
+    def __len__(self):
+        return len(self.data)
+
+    def set_nullable(self, nullable):
+        self.append = self.append_nullable if nullable else self.data.append
+
+    def append_nullable(self, value):
+        if value is None:
+            self.nulls.append(len(self.data))
+            value = 0
+        self.data.append(value)
+
+    def compact(self):
+        pass
+
+    def values(self):
+        values = map(bool, self.data) if self.boolean else iter(self.data)
+        if not self.nulls:
+            return values
+        nulls = set(self.nulls)
+        return (None if i in nulls else value for i, value in enumerate(values))
+
+    def validity(self):
+        if not self.nulls:
+            return None
+        bits = bytearray(b"\xff") * ((len(self.data) + 7) // 8)
+        for i in self.nulls:
+            bits[i >> 3] &= ~(1 << (i & 7))
+        return pa.py_buffer(bytes(bits))
+
+    def to_arrow(self, arrow_type):
+        if self.boolean:
+            return arrow_from_array(self.data, pa.int8(), self.validity()).cast(pa.bool_())
+        return arrow_from_array(self.data, arrow_type, self.validity())
+
+    def truncate(self, length):
+        del self.data[length:]
+        while self.nulls and self.nulls[-1] >= length:
+            self.nulls.pop()
+
+
+class CompactColumnBuffer:
+    """ColumnBuffer with dictionary-encoded strings and typed-array numbers, built from a StructType.
+
+    Used for deliveries on the driver, where each row would otherwise hold a pointer per field and
+    its own str copy of every name: a buffered row shrinks to about 100 bytes. Values must match
+    the field types; a None in a numeric field raises TypeError unless set_nullable(True) routes the
+    typed columns through their null-aware appends (see parse_member).
+    """
+
+    def __init__(self, schema):
+        self.columns = schema.fieldNames()
+        self.data = [DictionaryColumn() if isinstance(field.dataType, StringType) else TypedColumn(field.dataType)
+                     for field in schema.fields]
+        self.appenders = tuple(column.append for column in self.data)
+
+    def __len__(self):
+        return len(self.data[0])
+
+    def append(self, *values):
+        for append, value in zip(self.appenders, values):
+            append(value)
+
+    def set_nullable(self, nullable):
+        for column in self.data:
+            if isinstance(column, TypedColumn):
+                column.set_nullable(nullable)
+        self.appenders = tuple(column.append for column in self.data)
+
+    def rows(self):
+        return zip(*(column.values() for column in self.data))
+
+    def arrow_arrays(self, arrow_schema):
+        return [column.to_arrow(field.type) for column, field in zip(self.data, arrow_schema)]
+
+    def compact(self):
+        for column in self.data:
+            column.compact()
+
+    def truncate(self, length):
+        for column in self.data:
+            column.truncate(length)
+
+    def clear(self):
+        self.truncate(0)
+
+
+class MatchTables:
+    """Column buffers for the matches, innings and deliveries rows that parse_match emits.
+
+    With compact_deliveries the deliveries go into a CompactColumnBuffer; matches and innings
+    are small enough to stay in plain lists.
+    """
+
+    def __init__(self, matches_schema, innings_schema, deliveries_schema, compact_deliveries=False):
+        self.matches = ColumnBuffer(matches_schema.fieldNames())
+        self.innings = ColumnBuffer(innings_schema.fieldNames())
+        if compact_deliveries:
+            self.deliveries = CompactColumnBuffer(deliveries_schema)
+        else:
+            self.deliveries = ColumnBuffer(deliveries_schema.fieldNames())
+
+    def mark(self):
+        return len(self.matches), len(self.innings), len(self.deliveries)
+
+    def rollback(self, mark):
+        for buffer, length in zip((self.matches, self.innings, self.deliveries), mark):
+            buffer.truncate(length)
+
+    def compact(self):
+        self.deliveries.compact()
+
+    def clear(self):
+        self.rollback((0, 0, 0))
+
+
+def cricsheet_match_type():
+    """TypedDict shape of a Cricsheet match, limited to the keys parse_match reads.
+
+    The msgspec backend decodes against it and skips everything else (players, officials,
+    powerplays, reviews, ...). Leaves stay Any so a file decodes to exactly what json.loads
+    returns — msgspec never coerces or rejects a value the stdlib path accepts. The classes are
+    built per call because msgspec caches decoder state on them, which cloudpickle can't ship
+    to executors.
+    """
+    # Imported here: class bodies only see the enclosing scope, not cloudpickled globals
+    from typing import Any, Dict, List, TypedDict
+
+    class CricsheetWicket(TypedDict, total=False):
+        kind: Any
+        player_out: Any
+        fielders: List[Dict[str, Any]]
+
+    class CricsheetDelivery(TypedDict, total=False):
+        batter: Any
+        bowler: Any
+        non_striker: Any
+        runs: Dict[str, Any]
+        extras: Dict[str, Any]
+        wickets: List[CricsheetWicket]
+
+    class CricsheetOver(TypedDict, total=False):
+        over: Any
+        deliveries: List[CricsheetDelivery]
+
+    class CricsheetInnings(TypedDict, total=False):
+        team: Any
+        target: Dict[str, Any]
+        declared: Any
+        forfeited: Any
+        super_over: Any
+        overs: List[CricsheetOver]
+
+    class CricsheetRegistry(TypedDict, total=False):
+        people: Dict[str, Any]
+
+    class CricsheetInfo(TypedDict, total=False):
+        match_type: Any
+        match_type_number: Any
+        gender: Any
+        team_type: Any
+        overs: Any
+        balls_per_over: Any
+        venue: Any
+        city: Any
+        dates: List[Any]
+        teams: List[Any]
+        toss: Dict[str, Any]
+        outcome: Dict[str, Any]
+        player_of_match: List[Any]
+        event: Dict[str, Any]
+        season: Any
+        registry: CricsheetRegistry
+
+    class CricsheetMeta(TypedDict, total=False):
+        data_version: Any
+
+    class CricsheetMatch(TypedDict, total=False):
+        meta: CricsheetMeta
+        info: CricsheetInfo
+        innings: List[CricsheetInnings]
+
+    return CricsheetMatch
+
+
+PARSE_BACKENDS = ("json", "orjson", "msgspec")
+
+
+def make_json_decoder(backend):
+    """Return a bytes → match dict function for a PARSE_BACKENDS name."""
+    if backend == "json":
+        return json.loads
+    if backend == "orjson":
+        import orjson
+        return orjson.loads
+    if backend == "msgspec":
+        import msgspec
+        return msgspec.json.Decoder(cricsheet_match_type()).decode
+    raise ValueError(f"Unknown PARSE_BACKEND {backend!r}; expected one of {', '.join(PARSE_BACKENDS)}")
+
+
+def parse_match(match_id, data, tables):
+    """Parse one Cricsheet match into tables' column buffers and return its registry {name: player_id}.
+
+    Values are appended positionally, in the field order of matches_schema / innings_schema /
+    deliveries_schema. On an exception the caller rolls the buffers back (MatchTables.mark/rollback).
+    """
+    info = data.get('info', {})
+    meta = data.get('meta', {})
+
+    # --- PLAYERS (from registry) ---
+    registry = info.get('registry', {}).get('people', {})
+
+    # --- MATCH ---
+    teams = info.get('teams', [])
+    outcome = info.get('outcome', {})
+    outcome_by = outcome.get('by', {})
+    event = info.get('event', {})
+    toss = info.get('toss', {})
+    dates = info.get('dates', [])
+
+    tables.matches.append(
+        match_id,
+        meta.get('data_version'),
+        info.get('match_type'),
+        info.get('match_type_number'),
+        info.get('gender'),
+        info.get('team_type'),
+        info.get('overs'),                                  # overs_per_side
+        info.get('balls_per_over', 6),
+        info.get('venue'),
+        info.get('city'),
+        dates[0] if dates else None,                        # date_start
+        dates[-1] if dates else None,                       # date_end
+        teams[0] if len(teams) > 0 else None,               # team1
+        teams[1] if len(teams) > 1 else None,               # team2
+        toss.get('winner'),
+        toss.get('decision'),
+        outcome.get('winner'),
+        outcome.get('result'),
+        outcome.get('method'),
+        outcome_by.get('runs'),
+        outcome_by.get('wickets'),
+        outcome_by.get('innings'),
+        ','.join(info.get('player_of_match', [])),
+        event.get('name'),
+        event.get('match_number'),
+        str(event.get('group', '')) if event.get('group') is not None else None,
+        event.get('stage'),
+        info.get('season'),
+    )
+
+    (d_match_id, d_innings_number, d_over_number, d_ball_number,
+     d_batter, d_batter_id, d_bowler, d_bowler_id, d_non_striker, d_non_striker_id,
+     d_runs_batter, d_runs_extras, d_runs_total, d_runs_non_boundary,
+     d_extras_wides, d_extras_noballs, d_extras_byes, d_extras_legbyes, d_extras_penalty,
+     d_is_wicket, d_wicket_kind, d_wicket_player_out, d_wicket_player_out_id,
+     d_wicket_fielder1, d_wicket_fielder2, d_batting_team, d_bowling_team) = tables.deliveries.appenders
+
+    # --- INNINGS ---
+    for innings_idx, innings_data in enumerate(data.get('innings', [])):
+        innings_number = innings_idx + 1
+        batting_team = innings_data.get('team')
+        # Bowling team is the other team
+        bowling_team = None
+        if batting_team and len(teams) == 2:
+            bowling_team = teams[1] if batting_team == teams[0] else teams[0]
+
+        target = innings_data.get('target', {})
+
+        tables.innings.append(
+            match_id,
+            innings_number,
+            batting_team,
+            bowling_team,
+            target.get('runs'),
+            float(target['overs']) if 'overs' in target else None,
+            innings_data.get('declared', False),
+            innings_data.get('forfeited', False),
+            innings_data.get('super_over', False),
+        )
+
+        # --- DELIVERIES ---
+        if innings_data.get('forfeited'):
+            continue  # No deliveries in forfeited innings
+
+        for over_data in innings_data.get('overs', []):
+            over_number = over_data.get('over', 0)
+
+            for ball_idx, delivery in enumerate(over_data.get('deliveries', [])):
+                runs = delivery.get('runs', {})
+                extras = delivery.get('extras', {})
+                wickets = delivery.get('wickets', [])
+
+                # First wicket (most common — >99.99% have 0 or 1)
+                wicket = wickets[0] if wickets else {}
+                fielders = wicket.get('fielders', [])
+
+                # Resolve player IDs from registry
+                batter_name = delivery.get('batter')
+                bowler_name = delivery.get('bowler')
+                non_striker_name = delivery.get('non_striker')
+                player_out_name = wicket.get('player_out')
+
+                d_match_id(match_id)
+                d_innings_number(innings_number)
+                d_over_number(over_number)
+                d_ball_number(ball_idx + 1)
+                d_batter(batter_name)
+                d_batter_id(registry.get(batter_name))
+                d_bowler(bowler_name)
+                d_bowler_id(registry.get(bowler_name))
+                d_non_striker(non_striker_name)
+                d_non_striker_id(registry.get(non_striker_name))
+                d_runs_batter(runs.get('batter', 0))
+                d_runs_extras(runs.get('extras', 0))
+                d_runs_total(runs.get('total', 0))
+                d_runs_non_boundary(runs.get('non_boundary', False))
+                d_extras_wides(extras.get('wides', 0))
+                d_extras_noballs(extras.get('noballs', 0))
+                d_extras_byes(extras.get('byes', 0))
+                d_extras_legbyes(extras.get('legbyes', 0))
+                d_extras_penalty(extras.get('penalty', 0))
+                d_is_wicket(len(wickets) > 0)
+                d_wicket_kind(wicket.get('kind'))
+                d_wicket_player_out(player_out_name)
+                d_wicket_player_out_id(registry.get(player_out_name) if player_out_name else None)
+                d_wicket_fielder1(fielders[0].get('name') if fielders else None)
+                d_wicket_fielder2(fielders[1].get('name') if len(fielders) > 1 else None)
+                d_batting_team(batting_team)
+                d_bowling_team(bowling_team)
+
+    return registry
+
+
+def shard_by_size(files, num_shards):
+    """Pack (file_index, name, size) tuples into num_shards lists of similar total size (largest first)."""
+    heap = [(0, shard_idx, []) for shard_idx in range(num_shards)]
+    for file_index, name, size in sorted(files, key=lambda f: f[2], reverse=True):
+        total, shard_idx, shard = heapq.heappop(heap)
+        shard.append((file_index, name))
+        heapq.heappush(heap, (total + size, shard_idx, shard))
+    return [shard for _, _, shard in sorted(heap, key=lambda s: s[1]) if shard]
+
+
+def parse_member(json_file, archive, tables, decode):
+    """Decode one ZIP member and parse it into tables; returns its registry."""
+    match_id, data = match_id_for(json_file), decode(archive.read(json_file))
+    mark = tables.mark()
+    try:
+        registry = parse_match(match_id, data, tables)
+    except TypeError:
+        # A null number (e.g. runs.batter: null) in a typed-array column: parse the match again with
+        # null-aware appends, which are slower, so only matches with nulls pay for them
+        if not isinstance(tables.deliveries, CompactColumnBuffer):
+            raise
+        tables.rollback(mark)
+        tables.deliveries.set_nullable(True)
+        try:
+            registry = parse_match(match_id, data, tables)
+        finally:
+            tables.deliveries.set_nullable(False)
+    tables.compact()
+    return registry
+
+
+class ParseProfiler:
+    """Opt-in parse profile: wall time, JSON size and deliveries for every match, plus cProfile
+    over every sample_every-th match (0 = timings only).
+
+    wrap(parse) returns parse_member-shaped parse with the measuring around it. Timings measured
+    elsewhere (on the executors in distributed mode) are appended to .timings directly.
+    """
+
+    def __init__(self, sample_every=0):
+        self.sample_every = sample_every
+        self.timings = []  # (json_file, json_bytes, deliveries, seconds), failed matches included
+        self.profile = cProfile.Profile() if sample_every else None
+        self.sampled = 0
+
+    def wrap(self, parse):
+        def measured(json_file, archive, tables, decode):
+            sample = self.profile is not None and len(self.timings) % self.sample_every == 0
+            deliveries_before = len(tables.deliveries)
+            start = time.perf_counter()
+            if sample:
+                self.profile.enable()
+            try:
+                return parse(json_file, archive, tables, decode)
+            finally:
+                seconds = time.perf_counter() - start
+                if sample:
+                    self.profile.disable()
+                    self.sampled += 1
+                self.timings.append((json_file, archive.getinfo(json_file).file_size,
+                                     len(tables.deliveries) - deliveries_before, seconds))
+        return measured
+
+    def report(self, top_n):
+        """Print the top_n slowest matches and hottest functions; return them with a summary as a dict."""
+        seconds = sorted(timing[3] for timing in self.timings)
+        if not seconds:
+            print("Parse profile: no matches parsed")
+            return {"matches": 0}
+
+        def percentile_ms(p):
+            return seconds[min(len(seconds) - 1, int(p * len(seconds)))] * 1000
+
+        total_bytes = sum(timing[1] for timing in self.timings)
+        summary = {
+            "matches": len(seconds), "seconds": sum(seconds), "json_mb_per_s": total_bytes / (1024 * 1024) / sum(seconds),
+            "p50_ms": percentile_ms(0.5), "p90_ms": percentile_ms(0.9), "p99_ms": percentile_ms(0.99), "max_ms": seconds[-1] * 1000,
+        }
+        slowest = [{"json_file": json_file, "json_bytes": json_bytes, "deliveries": deliveries, "ms": secs * 1000}
+                   for json_file, json_bytes, deliveries, secs in sorted(self.timings, key=lambda t: t[3], reverse=True)[:top_n]]
+        hottest = []
+        if self.sampled:
+            # Sorted by own time: where the parser itself spends it, not its callers
+            stats = pstats.Stats(self.profile).stats
+            for (filename, line, function), (_, calls, own_s, cumulative_s, _) in sorted(
+                    stats.items(), key=lambda item: item[1][2], reverse=True)[:top_n]:
+                hottest.append({"function": f"{function} ({os.path.basename(filename)}:{line})", "calls": calls,
+                                "own_s": own_s, "cumulative_s": cumulative_s})
+
+        print(f"\n=== Parse profile: {summary['matches']:,} matches, {summary['json_mb_per_s']:,.1f} MB/s of JSON ===")
+        print(f"  p50 {summary['p50_ms']:.1f} ms, p90 {summary['p90_ms']:.1f} ms, p99 {summary['p99_ms']:.1f} ms, "
+              f"max {summary['max_ms']:.1f} ms")
+        print(f"  {len(slowest)} slowest matches:")
+        for match in slowest:
+            print(f"    {match['json_file']:<20} {match['ms']:>9.1f} ms  {match['json_bytes'] / 1024:>8,.0f} KB  "
+                  f"{match['deliveries']:>6,} deliveries")
+        if hottest:
+            print(f"  {len(hottest)} hottest functions (cProfile over {self.sampled:,} sampled matches):")
+            for entry in hottest:
+                print(f"    {entry['own_s']:>8.3f}s own  {entry['cumulative_s']:>8.3f}s cumulative  "
+                      f"{entry['calls']:>10,} calls  {entry['function']}")
+        return {"summary": summary, "slowest": slowest, "hottest": hottest, "sampled_matches": self.sampled}
+
+
+def iter_parsed_matches(json_files, archive, tables, decode=json.loads, profiler=None):
+    """Lazily parse ZIP members into tables, yielding (json_file, registry, error) per match.
+
+    decode turns a member's bytes into the match dict (see make_json_decoder); a ParseProfiler
+    measures every match.
+
+    A file that fails leaves no rows behind: its partial output is rolled back before the error is yielded.
+    """
+    parse = profiler.wrap(parse_member) if profiler is not None else parse_member
+    for json_file in json_files:
+        mark = tables.mark()
+        try:
+            registry = parse(json_file, archive, tables, decode)
+        except Exception as e:
+            tables.rollback(mark)
+            yield json_file, None, e
+        else:
+            yield json_file, registry, None
+
+
+class DeliveryChunkWriter:
+    """Hands a deliveries ColumnBuffer to write_chunk(buffer, chunk_number, match_ids) in memory-bounded chunks.
+
+    The row target starts at min_rows and is re-derived after every flush from the RSS growth
+    the chunk caused, so it settles at roughly budget_mb worth of rows. An RSS check on every
+    maybe_flush() flushes early if the estimate was too optimistic.
+    """
+
+    def __init__(self, buffer, write_chunk, budget_mb, min_rows, max_rows, chunks_written=0, rows_written=0):
+        self.buffer = buffer
+        self.write_chunk = write_chunk
+        self.budget_mb = budget_mb
+        self.min_rows = min_rows
+        self.max_rows = max_rows
+        self.chunk_rows = min_rows
+        self.match_ids = []  # matches in the current chunk, including any without deliveries
+        # Non-zero when resuming after chunks an earlier run committed
+        self.chunks_written = chunks_written
+        self.rows_written = rows_written
+        self.baseline_rss_mb = driver_rss_mb()
+        self.chunk_start_rss_mb = self.baseline_rss_mb
+        self.peak_rss_mb = self.baseline_rss_mb
+
+    def maybe_flush(self, match_id):
+        # Called after each match, so chunks always end on a match boundary
+        self.match_ids.append(match_id)
+        buffered = len(self.buffer)
+        if buffered >= self.chunk_rows:
+            self.flush()
+        elif buffered >= self.min_rows:
+            if driver_rss_mb() - self.baseline_rss_mb > self.budget_mb:
+                self.flush()
+
+    def flush(self):
+        rows = len(self.buffer)
+        if not rows and self.chunks_written > 0:
+            return
+        rss = driver_rss_mb()
+        self.peak_rss_mb = max(self.peak_rss_mb, rss)
+        growth_mb = rss - self.chunk_start_rss_mb
+        if rows and growth_mb > 0:
+            self.chunk_rows = max(self.min_rows, min(self.max_rows, int(self.budget_mb * rows / growth_mb)))
+
+        self.write_chunk(self.buffer, self.chunks_written, self.match_ids)
+        self.buffer.clear()
+        self.match_ids = []
+        self.chunks_written += 1
+        self.rows_written += rows
+        self.chunk_start_rss_mb = driver_rss_mb()
+        print(f"  Chunk {self.chunks_written}: wrote {rows:,} rows ({self.rows_written:,} total), "
+              f"driver RSS {rss:,.0f} MB, next chunk {self.chunk_rows:,} rows")
+
+    def close(self):
+        # Always flush once so an empty parse still overwrites the table
+        self.flush()
+        return self.rows_written
+
+
+def parse_partition(shards, archive_bytes, schemas, backend, profile=False):
+    """mapPartitions worker: parse every match in the partition's shards, yield (kind, row) tuples.
+
+    archive_bytes is a broadcast of the ZIP. Rows are tuples in schema order; schemas is the
+    (matches, innings, deliveries) StructTypes. backend names the JSON decoder, which is built
+    on the executor. profile=True also yields a ("timing", ParseProfiler timing) row per match.
+    """
+    tables = MatchTables(*schemas)
+    decode = make_json_decoder(backend)
+    profiler = ParseProfiler() if profile else None
+    parse = profiler.wrap(parse_member) if profile else parse_member
+    with zipfile.ZipFile(io.BytesIO(archive_bytes.value), 'r') as zf:
+        for shard in shards:
+            for file_index, json_file in shard:
+                tables.clear()
+                try:
+                    registry = parse(json_file, zf, tables, decode)
+                except Exception as e:
+                    yield ("error", (json_file, str(e)))
+                    continue
+                # (file_index, registry position) lets the driver keep the first-seen name per player
+                for pos, (name, player_id) in enumerate(registry.items()):
+                    yield ("player", (player_id, (file_index, pos, name)))
+                for row in tables.matches.rows():
+                    yield ("match", row)
+                for row in tables.innings.rows():
+                    yield ("innings", row)
+                for row in tables.deliveries.rows():
+                    yield ("delivery", row)
+    if profiler is not None:
+        for timing in profiler.timings:
+            yield ("timing", timing)
+
+# CELL ********************
+
+# --- CHANGE DETECTION ---
+# Compare each ZIP member's CRC-32 and size with the manifest written by the previous run
+run_metrics.start("changes")
+previous_manifest = {}  # {match_id: (data_version, zip_crc, zip_size)}
+incremental_run = False
+if INGEST_MODE == "incremental":
+    if spark.catalog.tableExists("etl_manifest"):
+        previous_manifest = {r.match_id: (r.data_version, r.zip_crc, r.zip_size) for r in spark.table("etl_manifest").collect()}
+        incremental_run = True
+    else:
+        print("No etl_manifest table yet — running a full ingest to create one")
+
+all_json_files = json_files
+removed_match_ids = []
+if incremental_run:
+    def is_new_or_changed(json_file):
+        previous = previous_manifest.get(match_id_for(json_file))
+        return previous is None or previous[1:] != zip_members[json_file]
+
+    json_files = [f for f in all_json_files if is_new_or_changed(f)]
+    removed_match_ids = sorted(set(previous_manifest) - {match_id_for(f) for f in all_json_files})
+    print(f"Incremental ingest: {len(json_files):,} new or changed of {len(all_json_files):,} matches, "
+          f"{len(removed_match_ids):,} removed from the archive")
+else:
+    print(f"Full ingest: {len(json_files):,} matches")
+
+if DELIVERIES_SLIM:
+    # match_key is the numeric Cricsheet match ID
+    non_numeric_ids = [match_id_for(f) for f in json_files if not match_id_for(f).isdigit()]
+    if non_numeric_ids:
+        raise ValueError(f"DELIVERIES_SLIM needs numeric match IDs; got {non_numeric_ids[:5]}")
+
+# Everything that decides what this run writes — a checkpoint left with another key was another run's
+checkpoint_key = hashlib.sha256(json.dumps([
+    incremental_run, [(f, *zip_members[f]) for f in json_files], removed_match_ids, PARSE_MODE,
+    DELIVERIES_LAYOUT, DELIVERIES_PARTITION_BY, DELIVERIES_CLUSTER_BY, DELIVERIES_SLIM,
+    BUILD_MATCHUPS, BUILD_DELIVERIES_WIDE, DELIVERIES_WIDE_COLUMNS,
+]).encode()).hexdigest()
+checkpoint = RunCheckpoint(CHECKPOINT_DIR or None, checkpoint_key)
+if checkpoint.resumed:
+    print(f"Resuming an interrupted run: {len(checkpoint.state['chunks'])} deliveries chunks and "
+          f"{len(checkpoint.state['steps'])} table writes recorded")
+
+# (match_type, season) pairs the changed and removed matches had before this run — their matchups
+# rows are recomputed even if a match moved to another format or season
+previous_matchup_keys = set()
+if "previous_matchup_keys" in checkpoint.state["values"]:
+    # The interrupted run may already have overwritten these matches' rows
+    previous_matchup_keys = {tuple(key) for key in checkpoint.state["values"]["previous_matchup_keys"]}
+elif incremental_run and BUILD_MATCHUPS:
+    previous_match_ids = [match_id_for(f) for f in json_files] + removed_match_ids
+    if previous_match_ids:
+        previous_matchup_keys = {tuple(r) for r in spark.table("matches").where(match_id_predicate(previous_match_ids))
+                                 .select("match_type", "season").distinct().collect()}
+checkpoint.state["values"]["previous_matchup_keys"] = sorted(previous_matchup_keys, key=repr)
+checkpoint.save()
+
+run_metrics.ingest_mode = "incremental" if incremental_run else "full"
+run_metrics.end("changes", rows=len(json_files))
+
+# CELL ********************
+
+run_metrics.start("parse")
+# Accumulators for all tables
+all_players = {}  # {player_id: name} — deduplicated across all matches
+# Column buffers for matches/innings/deliveries, laid out after the StructType schemas.
+# Driver-mode deliveries are dictionary-encoded/typed-array backed (CompactColumnBuffer).
+parsed_tables = MatchTables(matches_schema, innings_schema, deliveries_schema, compact_deliveries=PARSE_MODE != "distributed")
+# Built here in both modes so an unknown or uninstalled backend fails before any work starts
+decode_match = make_json_decoder(PARSE_BACKEND)
+print(f"JSON backend: {PARSE_BACKEND}")
+# cProfile only samples the driver loop; executors send back timings
+parse_profiler = ParseProfiler(PARSE_PROFILE_SAMPLE_EVERY if PARSE_MODE == "driver" else 0) if PARSE_PROFILE else None
+
+error_files = []
+processed = 0
+resumed_deliveries = 0  # deliveries rows in the chunks an interrupted run committed
+
+if PARSE_MODE == "distributed":
+    sc = spark.sparkContext
+    num_shards = PARSE_SHARDS or sc.defaultParallelism * 2
+    shards = shard_by_size([(i, f, json_sizes[f]) for i, f in enumerate(json_files)], num_shards)
+    print(f"Parsing {len(json_files)} matches on executors in {len(shards)} shards...")
+
+    # Executors read members from the broadcast archive, same as the driver loop
+    archive_broadcast = sc.broadcast(archive_bytes)
+    schemas = (matches_schema, innings_schema, deliveries_schema)
+    parsed_rdd = (
+        sc.parallelize(shards, len(shards))
+        .mapPartitions(lambda it: parse_partition(it, archive_broadcast, schemas, PARSE_BACKEND, PARSE_PROFILE))
+        .persist(StorageLevel.MEMORY_AND_DISK)
+    )
+
+    def rows_of(kind):
+        return parsed_rdd.filter(lambda r: r[0] == kind).map(lambda r: r[1])
+
+    # First-seen name per player_id, same as the driver loop's file-order dedup
+    players_rdd = (
+        rows_of("player")
+        .reduceByKey(min)
+        .map(lambda kv: (kv[0], kv[1][2], None, None, None, None))
+    )
+    players_df = spark.createDataFrame(players_rdd, schema=players_schema)
+    matches_df = spark.createDataFrame(rows_of("match"), schema=matches_schema)
+    innings_df = spark.createDataFrame(rows_of("innings"), schema=innings_schema)
+    deliveries_df = spark.createDataFrame(rows_of("delivery"), schema=deliveries_schema)
+
+    # One pass over the cached partitions for all the counts
+    kind_counts = parsed_rdd.map(lambda r: r[0]).countByValue()
+    error_files = rows_of("error").collect()
+    processed = kind_counts.get("match", 0)
+    n_matches = processed
+    n_innings = kind_counts.get("innings", 0)
+    n_deliveries = kind_counts.get("delivery", 0)
+    n_players = players_rdd.count()
+    if parse_profiler is not None:
+        parse_profiler.timings = rows_of("timing").collect()
+else:
+    # Chunks an interrupted run committed: restore what they parsed and only parse the rest
+    resumed_chunks = checkpoint.committed_chunks()
+    resumed_files = set()
+    for chunk in resumed_chunks:
+        for row in chunk["matches"]:
+            parsed_tables.matches.append(*row)
+        for row in chunk["innings"]:
+            parsed_tables.innings.append(*row)
+        for player_id, name in chunk["players"]:
+            all_players.setdefault(player_id, name)
+        error_files.extend(tuple(error) for error in chunk["errors"])
+        resumed_files.update(chunk["json_files"])
+    files_to_parse = [f for f in json_files if f not in resumed_files]
+    file_of = {match_id_for(f): f for f in files_to_parse}
+    resumed_deliveries = sum(chunk["deliveries"] for chunk in resumed_chunks)
+    # Where the current chunk's matches, innings, players and errors start
+    chunk_marks = [len(parsed_tables.matches), len(parsed_tables.innings), len(all_players), len(error_files)]
+
+    def write_deliveries_chunk(buffer, chunk_number, match_ids):
+        matches_mark, innings_mark, players_mark, errors_mark = chunk_marks
+        chunk_errors = error_files[errors_mark:]
+        checkpoint.record_chunk(
+            chunk_number,
+            json_files=[file_of[match_id] for match_id in match_ids] + [f for f, _ in chunk_errors],
+            matches=list(parsed_tables.matches.rows(matches_mark)),
+            innings=list(parsed_tables.innings.rows(innings_mark)),
+            players=list(all_players.items())[players_mark:],
+            errors=chunk_errors,
+            deliveries=len(buffer),
+        )
+        chunk_marks[:] = [len(parsed_tables.matches), len(parsed_tables.innings), len(all_players), len(error_files)]
+
+        chunk_df = to_spark_dataframe(buffer, deliveries_schema)
+        # Every match in the chunk has already been parsed into parsed_tables.matches / innings
+        chunk_matches_df = to_spark_dataframe(parsed_tables.matches, matches_schema)
+        chunk_innings_df = to_spark_dataframe(parsed_tables.innings, innings_schema)
+        # Full ingest: first chunk replaces the table, the rest append. Incremental: replace just this chunk's matches
+        with run_metrics.table_write("deliveries"), checkpoint.commit_metadata(chunk=chunk_number):
+            save_deliveries(chunk_df, chunk_matches_df, chunk_innings_df, match_ids, append=chunk_number > 0)
+
+    deliveries_writer = DeliveryChunkWriter(
+        parsed_tables.deliveries,
+        write_deliveries_chunk,
+        budget_mb=DELIVERIES_MEMORY_BUDGET_MB,
+        min_rows=DELIVERIES_MIN_CHUNK_ROWS,
+        max_rows=DELIVERIES_MAX_CHUNK_ROWS,
+        chunks_written=len(resumed_chunks),
+        rows_written=resumed_deliveries,
+    )
+    if resumed_chunks:
+        print(f"Resumed {len(resumed_chunks)} committed deliveries chunks ({len(resumed_files):,} matches, "
+              f"{deliveries_writer.rows_written:,} deliveries)")
+    print(f"Parsing {len(files_to_parse)} matches, streaming deliveries to Delta "
+          f"(budget {DELIVERIES_MEMORY_BUDGET_MB:,} MB over {deliveries_writer.baseline_rss_mb:,.0f} MB baseline)...")
+
+    for json_file, registry, error in iter_parsed_matches(files_to_parse, archive, parsed_tables, decode_match, parse_profiler):
+        if error is not None:
+            error_files.append((json_file, str(error)))
+            continue
+
+        for name, player_id in registry.items():
+            if player_id not in all_players:
+                all_players[player_id] = name
+        deliveries_writer.maybe_flush(match_id_for(json_file))
+
+        processed += 1
+        if processed % 5000 == 0:
+            parsed_deliveries = deliveries_writer.rows_written + len(deliveries_writer.buffer)
+            print(f"Processed {processed}/{len(files_to_parse)} matches ({parsed_deliveries:,} deliveries)")
+
+    n_matches = len(parsed_tables.matches)
+    n_innings = len(parsed_tables.innings)
+    n_deliveries = deliveries_writer.close()
+    n_players = len(all_players)
+
+# Matches that parsed cleanly — the only ones an incremental run replaces
+parsed_match_ids = {match_id_for(f) for f in json_files} - {match_id_for(f) for f, _ in error_files}
+# rows: deliveries parsed; bytes: uncompressed JSON parsed
+run_metrics.end("parse", rows=n_deliveries, bytes=sum(json_sizes[f] for f in json_files), errors=len(error_files))
+
+print(f"\n=== Parsing Complete ===")
+print(f"  Matches:    {n_matches:,}")
+print(f"  Innings:    {n_innings:,}")
+print(f"  Deliveries: {n_deliveries:,}")
+print(f"  Players:    {n_players:,}")
+print(f"  Errors:     {len(error_files)}")
+if error_files:
+    print(f"  First 5 errors:")
+    for ef, err in error_files[:5]:
+        print(f"    {ef}: {err}")
+
+if parse_profiler is not None:
+    parse_profile = parse_profiler.report(PARSE_PROFILE_TOP_N)
+    os.makedirs(RUN_METRICS_DIR, exist_ok=True)
+    profile_path = os.path.join(RUN_METRICS_DIR, f"{run_metrics.run_id}-parse-profile")
+    with open(profile_path + ".json", "w") as f:
+        json.dump(parse_profile, f)
+    if parse_profiler.sampled:
+        # The raw cProfile stats, for pstats / snakeviz
+        parse_profiler.profile.dump_stats(profile_path + ".prof")
+    print(f"  Saved to {profile_path}.json")
+
+# CELL ********************
+
+# MARKDOWN ********************
+
+# ## Step 3: Create DataFrames and write Delta tables
+# 
+# Player name ↔ ID mapping uses Cricsheet's registry (8-char hex IDs).
+# These are stable across all matches — the same player always has the same ID.
+
+# CELL ********************
+
+# --- PLAYERS TABLE ---
+if PARSE_MODE == "driver":
+    players_buffer = ColumnBuffer(players_schema.fieldNames())
+    for pid, name in all_players.items():
+        players_buffer.append(pid, name, None, None, None, None)
+    players_df = to_spark_dataframe(players_buffer, players_schema)
+if DELIVERIES_SLIM:
+    players_df = players_df.withColumn("player_key", player_key(F.col("player_id")))
+
+print(f"Players: {n_players:,} rows")
+def write_players():
+    if incremental_run:
+        # Only add players we haven't seen — existing rows keep their enrichment columns
+        (DeltaTable.forName(spark, "players").alias("p")
+            .merge(players_df.alias("n"), "p.player_id = n.player_id")
+            .whenNotMatchedInsertAll()
+            .execute())
+    else:
+        players_df.write.format("delta").mode("overwrite").option("overwriteSchema", "true").saveAsTable("players")
+
+# CELL ********************
+
+# --- MATCHES TABLE ---
+if PARSE_MODE == "driver":
+    matches_df = to_spark_dataframe(parsed_tables.matches, matches_schema)
+
+print(f"Matches: {n_matches:,} rows")
+
+# CELL ********************
+
+# --- INNINGS TABLE ---
+if PARSE_MODE == "driver":
+    innings_df = to_spark_dataframe(parsed_tables.innings, innings_schema)
+
+print(f"Innings: {n_innings:,} rows")
+
+# CELL ********************
+
+# --- WRITE PLAYERS, MATCHES, INNINGS AND DELIVERIES ---
+# The small tables are submitted first so their jobs start before deliveries takes the executors
+table_writes = [
+    ("players", write_players),
+    ("matches", lambda: save_match_rows(
+        matches_df.withColumn("match_key", match_key(F.col("match_id"))) if DELIVERIES_SLIM else matches_df,
+        "matches", parsed_match_ids)),
+    ("innings", lambda: save_match_rows(innings_df, "innings", parsed_match_ids)),
+]
+if PARSE_MODE == "distributed":
+    # Executors write their own partitions — nothing to batch on the driver
+    print(f"Writing {n_deliveries:,} deliveries from {deliveries_df.rdd.getNumPartitions()} partitions...")
+    table_writes.append(("deliveries", lambda: save_deliveries(deliveries_df, matches_df, innings_df, parsed_match_ids)))
+else:
+    # Already streamed to Delta chunk by chunk during the parse
+    print(f"Streamed {n_deliveries:,} deliveries in {deliveries_writer.chunks_written} chunks "
+          f"(peak driver RSS {deliveries_writer.peak_rss_mb:,.0f} MB)")
+
+write_started = time.perf_counter()
+write_steps(table_writes, TABLE_WRITE_WORKERS)
+if PARSE_MODE == "distributed":
+    parsed_rdd.unpersist()
+    archive_broadcast.unpersist()
+print(f"✓ {', '.join(table for table, _ in table_writes)} written in {time.perf_counter() - write_started:.1f}s")
+
+if DELIVERIES_SLIM:
+    # Lookups for the slim keys and codes: every team in matches, and the fixed code lists
+    teams_df = (spark.table("matches")
+                .select(F.explode(F.array("team1", "team2")).alias("team_name"))
+                .where(F.col("team_name").isNotNull()).distinct()
+                .select(team_key(F.col("team_name")).alias("team_key"), "team_name"))
+    wicket_kinds_df = spark.createDataFrame(list(enumerate(WICKET_KINDS, 1)), "wicket_kind_code SMALLINT, wicket_kind STRING")
+    phases_df = spark.createDataFrame(list(enumerate(PHASES, 1)), "phase_code SMALLINT, phase STRING")
+    write_steps([(table, lambda table=table, df=df: df.write.format("delta").mode("overwrite").option("overwriteSchema", "true").saveAsTable(table))
+                 for table, df in (("teams", teams_df), ("wicket_kinds", wicket_kinds_df), ("phases", phases_df))],
+                TABLE_WRITE_WORKERS)
+
+# CELL ********************
+
+# --- SUMMARY TABLES ---
+# batting_innings / bowling_innings: one row per player per innings, read back from the deliveries
+# table and summed from its flag columns, so they follow the same rules as the measures.
+summary_source = read_deliveries(parsed_match_ids if incremental_run and parsed_match_ids else None)
+
+keys = ["match_id", "innings_number"]
+fours = ((F.col("runs_batter") == 4) & (F.col("is_boundary") == 1)).cast("int")
+sixes = ((F.col("runs_batter") == 6) & (F.col("is_boundary") == 1)).cast("int")
+
+
+def batting_part(player_id, player_name, runs, balls_faced, fours, sixes, is_out, dismissal_kind, wicket_ball):
+    return F.struct(
+        F.col(player_id).alias("player_id"), F.col(player_name).alias("player_name"),
+        runs.alias("runs"), balls_faced.alias("balls_faced"), fours.alias("fours"), sixes.alias("sixes"),
+        is_out.alias("is_out"), dismissal_kind.alias("dismissal_kind"), wicket_ball.alias("wicket_ball"),
+    )
+
+
+zero, no_kind, no_ball = F.lit(0), F.lit(None).cast("string"), F.lit(None).cast("int")
+# Orders a player's wickets within the innings: a batter who retires hurt and comes back can be out later
+wicket_ball = F.col("over_number") * 1000 + F.col("ball_number")
+# Each ball credits the striker, shows the non-striker batted, and records who (if anyone) was out —
+# one scan, exploded into up to three player rows
+batting_innings_df = (
+    summary_source
+    .select(*keys, "batting_team", F.inline(F.array(
+        batting_part("batter_id", "batter", F.col("runs_batter"), F.col("is_ball_faced"), fours, sixes,
+                     F.lit(False), no_kind, no_ball),
+        batting_part("non_striker_id", "non_striker", zero, zero, zero, zero, F.lit(False), no_kind, no_ball),
+        batting_part("wicket_player_out_id", "wicket_player_out", zero, zero, zero, zero,
+                     F.col("wicket_player_out").isNotNull() & (F.col("is_batter_dismissal") == 1),
+                     F.col("wicket_kind"), F.when(F.col("wicket_player_out").isNotNull(), wicket_ball)),
+    )))
+    .where(F.col("player_name").isNotNull())
+    .groupBy(*keys, "player_id", "player_name")
+    .agg(
+        F.max("batting_team").alias("batting_team"),
+        F.sum("runs").alias("runs"),
+        F.sum("balls_faced").alias("balls_faced"),
+        F.sum("fours").alias("fours"),
+        F.sum("sixes").alias("sixes"),
+        F.max("is_out").alias("is_out"),
+        F.max_by("dismissal_kind", "wicket_ball").alias("dismissal_kind"),  # latest wicket
+    )
+    .select([F.col(f.name).cast(f.dataType) for f in batting_innings_schema.fields])
+)
+
+bowling_innings_df = (
+    summary_source
+    .groupBy(*keys, F.col("bowler_id").alias("player_id"), F.col("bowler").alias("player_name"))
+    .agg(
+        F.max("bowling_team").alias("bowling_team"),
+        F.sum("is_legal_ball").alias("legal_balls"),
+        F.sum("bowler_runs").alias("runs_conceded"),
+        F.sum("is_bowler_wicket").alias("wickets"),
+        F.sum((F.col("runs_total") == 0).cast("int")).alias("dots"),
+        F.sum(fours).alias("fours"),
+        F.sum(sixes).alias("sixes"),
+        F.sum("extras_wides").alias("wides"),
+        F.sum("extras_noballs").alias("noballs"),
+    )
+    .select([F.col(f.name).cast(f.dataType) for f in bowling_innings_schema.fields])
+)
+
+write_step("batting_innings", lambda: save_match_rows(batting_innings_df, "batting_innings", parsed_match_ids))
+write_step("bowling_innings", lambda: save_match_rows(bowling_innings_df, "bowling_innings", parsed_match_ids))
+print("✓ batting_innings and bowling_innings written")
+
+# CELL ********************
+
+# --- MATCHUPS ---
+# Batter vs bowler totals per (match_type, season), so a head-to-head lookup reads a few rows of a
+# table clustered on batter_id, bowler_id instead of scanning deliveries. A full ingest rebuilds it;
+# an incremental run recomputes only the pairs the changed and removed matches belong to.
+if BUILD_MATCHUPS:
+    matchup_source = read_deliveries().drop(*match_layout_columns).join(
+        F.broadcast(spark.table("matches").select("match_id", "match_type", "season")), "match_id")
+    matchup_keys = None
+    if incremental_run:
+        matchup_keys = set(previous_matchup_keys)
+        if parsed_match_ids:
+            matchup_keys |= {tuple(r) for r in spark.table("matches").where(match_id_predicate(parsed_match_ids))
+                             .select("match_type", "season").distinct().collect()}
+        if removed_match_ids:
+            # Still in deliveries until the manifest step deletes them
+            matchup_source = matchup_source.where(~F.col("match_id").isin(removed_match_ids))
+        if matchup_keys:
+            matchup_source = matchup_source.where(matchup_key_predicate(matchup_keys))
+
+    matchups_df = (
+        matchup_source
+        .groupBy("batter_id", "bowler_id", "match_type", "season")
+        .agg(
+            F.max("batter").alias("batter"),
+            F.max("bowler").alias("bowler"),
+            F.sum("is_ball_faced").alias("balls"),
+            F.sum("runs_batter").alias("runs"),
+            F.sum("is_bowler_wicket").alias("dismissals"),
+            F.sum((F.col("runs_total") == 0).cast("int")).alias("dots"),
+            F.sum(fours).alias("fours"),
+            F.sum(sixes).alias("sixes"),
+        )
+        .select([F.col(f.name).cast(f.dataType) for f in matchups_schema.fields])
+    )
+
+    if matchup_keys is None:
+        write_step("matchups", lambda: save_clustered_rows(matchups_df, "matchups", MATCHUPS_CLUSTER_BY))
+        print("✓ matchups written")
+    elif matchup_keys:
+        write_step("matchups", lambda: save_clustered_rows(matchups_df, "matchups", MATCHUPS_CLUSTER_BY,
+                                                           matchup_key_predicate(matchup_keys)))
+        print(f"✓ matchups refreshed for {len(matchup_keys):,} (match_type, season) pairs")
+    else:
+        print("No changed matches — matchups unchanged")
+else:
+    print("BUILD_MATCHUPS is off — skipping matchups")
+
+# CELL ********************
+
+# --- DELIVERIES WIDE ---
+# deliveries with the match attributes most queries filter on, joined once here (broadcast — matches
+# is small) instead of shuffle-joining 10.9M rows on every query. Same incremental rules as deliveries.
+if BUILD_DELIVERIES_WIDE:
+    wide_match_ids = parsed_match_ids if incremental_run else None
+    if wide_match_ids is None or wide_match_ids:
+        deliveries_wide_df = read_deliveries(wide_match_ids).drop(*match_layout_columns).join(
+            F.broadcast(spark.table("matches").select("match_id", *deliveries_wide_columns)), "match_id", "left")
+        write_step("deliveries_wide", lambda: save_clustered_rows(
+            deliveries_wide_df, "deliveries_wide", DELIVERIES_WIDE_CLUSTER_BY,
+            match_id_predicate(wide_match_ids) if wide_match_ids else None,
+            partition_by=DELIVERIES_WIDE_PARTITION_BY))
+        print(f"✓ deliveries_wide written ({'all' if wide_match_ids is None else f'{len(wide_match_ids):,}'} matches)")
+    else:
+        print("No changed matches — deliveries_wide unchanged")
+else:
+    print("BUILD_DELIVERIES_WIDE is off — skipping deliveries_wide")
+
+# CELL ********************
+
+# --- MANIFEST ---
+# Written last, so a failed run is simply re-done by the next incremental run
+if removed_match_ids:
+    with run_metrics.stage("delete_removed"):
+        for table in ["matches", "innings", "batting_innings", "bowling_innings"]:
+            spark.sql(f"DELETE FROM {table} WHERE {match_id_predicate(removed_match_ids)}")
+        spark.sql(f"DELETE FROM deliveries WHERE {deliveries_match_predicate(removed_match_ids)}")
+        if BUILD_DELIVERIES_WIDE:
+            spark.sql(f"DELETE FROM deliveries_wide WHERE {match_id_predicate(removed_match_ids)}")
+    run_metrics.add("delete_removed", rows=len(removed_match_ids))
+    print(f"Removed {len(removed_match_ids):,} matches no longer in the archive")
+
+if PARSE_MODE == "distributed":
+    parsed_versions = dict(matches_df.select("match_id", "data_version").collect())
+else:
+    parsed_versions = dict(zip(parsed_tables.matches.column("match_id"), parsed_tables.matches.column("data_version")))
+
+manifest_buffer = ColumnBuffer(manifest_schema.fieldNames())
+for json_file in all_json_files:
+    match_id = match_id_for(json_file)
+    if match_id in parsed_versions:
+        manifest_buffer.append(match_id, parsed_versions[match_id], *zip_members[json_file])
+    elif match_id in previous_manifest:
+        # Unchanged, or changed but failed to parse — keep the old entry so it is retried next run
+        manifest_buffer.append(match_id, *previous_manifest[match_id])
+
+manifest_df = to_spark_dataframe(manifest_buffer, manifest_schema)
+with run_metrics.table_write("etl_manifest", stage="write_manifest"):
+    manifest_df.write.format("delta").mode("overwrite").option("overwriteSchema", "true").saveAsTable("etl_manifest")
+print(f"✓ etl_manifest written: {len(manifest_buffer):,} matches")
+# Every table is complete — the next run starts fresh
+checkpoint.clear()
+
+# CELL ********************
+
+# MARKDOWN ********************
+
+# ## Step 4: Optimize tables with V-Order
+
+# CELL ********************
+
+tables = ["players", "matches", "innings", "deliveries", "batting_innings", "bowling_innings"]
+if BUILD_MATCHUPS:
+    tables.append("matchups")
+if BUILD_DELIVERIES_WIDE:
+    tables.append("deliveries_wide")
+# Tables written by save_clustered_rows, with their clustering keys
+clustered_tables = {"matchups": MATCHUPS_CLUSTER_BY, "deliveries_wide": DELIVERIES_WIDE_CLUSTER_BY}
+
+# Rows per table as this run wrote them: the write stages' operationMetrics, plus the deliveries
+# chunks an interrupted run committed (their rows are in the checkpoint sidecars), or the parse
+# counts for a write an interrupted run had already finished — the report needs no COUNT(*) scan
+parsed_rows = {"players": n_players, "matches": n_matches, "innings": n_innings, "deliveries": n_deliveries}
+restored_rows = {"deliveries": resumed_deliveries}
+
+run_metrics.start("optimize")
 for table in tables:
     print(f"Optimizing {table}...")
-    spark.sql(f"OPTIMIZE {table} VORDER")
-    
-    # Get table stats
-    count = spark.sql(f"SELECT COUNT(*) as cnt FROM {table}").collect()[0][0]
-    print(f"  {table}: {count:,} rows")
+    if table == "deliveries" and DELIVERIES_LAYOUT == "zorder" and DELIVERIES_CLUSTER_BY:
+        spark.sql(f"OPTIMIZE deliveries ZORDER BY ({', '.join(DELIVERIES_CLUSTER_BY)}) VORDER")
+    elif table in clustered_tables and DELIVERIES_LAYOUT != "liquid":
+        spark.sql(f"OPTIMIZE {table} ZORDER BY ({', '.join(clustered_tables[table])}) VORDER")
+    elif (table == "deliveries" or table in clustered_tables) and DELIVERIES_LAYOUT == "liquid":
+        # Clusters incrementally on the table's CLUSTER BY keys
+        spark.sql(f"OPTIMIZE {table}")
+    else:
+        spark.sql(f"OPTIMIZE {table} VORDER")
+
+    rows = (run_metrics.stages.get(f"write_{table}") or {}).get("rows")
+    if rows is None:
+        rows = parsed_rows.get(table)
+    else:
+        rows += restored_rows.get(table, 0)
+    # Files and size from the Delta log — no scan of the data files
+    detail = spark.sql(f"DESCRIBE DETAIL {table}").first()
+    rows_text = f"{rows:,} rows" if rows is not None else "no rows written this run"
+    print(f"  {table}: {rows_text}, {detail['numFiles']:,} files, {detail['sizeInBytes'] / (1024 * 1024):,.1f} MB")
+    # bytes: the optimized tables' total size (their rows are in the write_* stages)
+    run_metrics.add("optimize", bytes=detail["sizeInBytes"])
+run_metrics.end("optimize")
 
 print("\n=== ETL Complete ===")
 print(f"End time: {datetime.now().isoformat()}")
@@ -417,53 +2330,188 @@ print(f"End time: {datetime.now().isoformat()}")
 
 # MARKDOWN ********************
 
-# ## Step 5: Validation queries
+# ## Step 5: Validation
+#
+# Declared checks — row counts per format, null rates of the player ID columns, orphan match IDs,
+# runs_total = runs_batter + runs_extras, innings without deliveries, the flag and match-state
+# columns — computed in one pass over deliveries. Every result goes to the `etl_validation` table;
+# a failed "hard" check fails the run.
 
 # CELL ********************
 
-# Quick validation
+# Validation: the checks over deliveries all come out of one aggregated pass
 print("=== Validation ===\n")
-
-# Match type distribution
-print("Match types:")
-spark.sql("""
-    SELECT match_type, COUNT(*) as matches 
-    FROM matches 
-    GROUP BY match_type 
-    ORDER BY matches DESC
-""").show()
-
-# Delivery count by format
-print("Deliveries by format:")
-spark.sql("""
-    SELECT m.match_type, COUNT(*) as deliveries
-    FROM deliveries d
-    JOIN matches m ON d.match_id = m.match_id
-    GROUP BY m.match_type
-    ORDER BY deliveries DESC
-""").show()
-
-# Top 10 batters by runs
-print("Top 10 batters by total runs:")
+run_metrics.start("validate")
+
+ID_COLUMNS = [f"{role}_id" for role in SLIM_PLAYER_ROLES]
+
+# Slim deliveries are checked in place: only their keys' nulls matter, and kinds decode without a join
+validation_source = spark.table("deliveries")
+unknown_codes = "0"
+if DELIVERIES_SLIM:
+    validation_source = validation_source.withColumns({
+        "match_id": F.col("match_key").cast("string"),
+        **{c: F.col(SLIM_KEY_COLUMNS[c]) for c in ID_COLUMNS},
+        "wicket_kind": value_of(WICKET_KINDS, F.col("wicket_kind_code")),
+    })
+    unknown_codes = "COUNT_IF(wicket_kind_code = 0 OR phase_code = 0)"
+validation_source.createOrReplaceTempView("deliveries_checked")
+
+# Flag columns vs the FILTER/SUMX expressions the measures used before they became plain SUMs.
+# A blank wicket_kind passes NOT(... IN {...}) in DAX, hence the COALESCE.
+def kinds_list(kinds):
+    return ", ".join(f"'{kind}'" for kind in kinds)
+
+flag_filters = {
+    "is_ball_faced": "COUNT_IF(extras_wides = 0)",
+    "is_legal_ball": "COUNT_IF(extras_wides = 0 AND extras_noballs = 0)",
+    "is_batter_dismissal": f"COUNT_IF(is_wicket AND NOT (COALESCE(wicket_kind, '') IN ({kinds_list(NON_DISMISSAL_KINDS)})))",
+    "is_bowler_wicket": f"COUNT_IF(is_wicket AND NOT (COALESCE(wicket_kind, '') IN ({kinds_list(NON_BOWLER_WICKET_KINDS)})))",
+    "bowler_runs": "COALESCE(SUM(runs_total - extras_byes - extras_legbyes), 0)",
+    "is_boundary": "COUNT_IF(runs_batter IN (4, 6) AND NOT runs_non_boundary)",
+}
+
+# The one pass over deliveries: partial counts per innings. Matches and innings are small, so the
+# partials are joined to them and rolled up per format (scope) and overall ("all").
+innings_checked = spark.sql(f"""
+    SELECT match_id, innings_number,
+           COUNT(*) AS deliveries,
+           COUNT_IF(is_wicket) AS wickets,
+           {", ".join(f"COUNT_IF({c} IS NULL) AS null_{c}" for c in ID_COLUMNS if c != "wicket_player_out_id")},
+           COUNT_IF(is_wicket AND wicket_player_out_id IS NULL) AS null_wicket_player_out_id,
+           COUNT_IF(runs_total <> runs_batter + runs_extras) AS runs_total_mismatch,
+           {unknown_codes} AS unknown_codes,
+           SUM(runs_batter) AS runs_batter,
+           {", ".join(f"COALESCE(SUM({column}), 0) AS {column}, {expr} AS {column}_filter" for column, expr in flag_filters.items())},
+           -- The last ball of every innings must carry the innings totals
+           MAX_BY(STRUCT(running_runs, legal_ball_index, running_wickets, balls_remaining),
+                  over_number * 1000 + ball_number) AS last_ball,
+           SUM(runs_total) AS runs, SUM(is_legal_ball) AS legal_balls,
+           COUNT_IF(is_wicket AND NOT (COALESCE(wicket_kind, '') IN ({kinds_list(NON_TEAM_WICKET_KINDS)}))) AS team_wickets
+    FROM deliveries_checked
+    GROUP BY match_id, innings_number
+""")
+innings_checked.createOrReplaceTempView("innings_checked")
+
+scope_rows = spark.sql(f"""
+    WITH checked AS (
+        SELECT COALESCE(s.match_id, i.match_id) AS checked_match_id, s.*,
+               i.match_id IS NOT NULL AS in_innings, COALESCE(i.forfeited, FALSE) AS forfeited,
+               COALESCE(i.is_super_over, FALSE) AS is_super_over
+        FROM innings_checked s
+        FULL JOIN innings i ON s.match_id = i.match_id AND s.innings_number = i.innings_number
+    ), scoped AS (
+        SELECT c.*, m.match_id AS matches_match_id, m.overs_per_side, m.balls_per_over,
+               CASE WHEN m.match_id IS NULL THEN '(no match)' ELSE COALESCE(m.match_type, '(unknown)') END AS match_scope
+        FROM checked c
+        FULL JOIN matches m ON c.checked_match_id = m.match_id
+    )
+    SELECT IF(GROUPING(match_scope) = 1, 'all', match_scope) AS scope,
+           COUNT(DISTINCT matches_match_id) AS matches,
+           COUNT_IF(in_innings) AS innings,
+           COALESCE(SUM(deliveries), 0) AS deliveries,
+           COALESCE(SUM(wickets), 0) AS wickets,
+           {", ".join(f"COALESCE(SUM(null_{c}), 0) AS null_{c}" for c in ID_COLUMNS)},
+           COUNT(DISTINCT IF(matches_match_id IS NULL, checked_match_id, NULL)) AS orphan_match_ids,
+           COALESCE(SUM(runs_total_mismatch), 0) AS runs_total_mismatch,
+           COALESCE(SUM(unknown_codes), 0) AS unknown_codes,
+           COUNT_IF(in_innings AND NOT forfeited AND deliveries IS NULL) AS empty_innings,
+           COALESCE(SUM(is_ball_faced), 0) AS balls_faced,
+           COALESCE(SUM(runs_batter), 0) AS runs_batter,
+           {", ".join(f"ABS(COALESCE(SUM({column}), 0) - COALESCE(SUM({column}_filter), 0)) AS {column}_mismatch" for column in flag_filters)},
+           COUNT_IF(last_ball.running_runs <> runs OR last_ball.legal_ball_index <> legal_balls
+                    OR last_ball.running_wickets <> team_wickets) AS match_state_mismatch,
+           -- A super over is allotted one over; null allocations (unlimited overs) stay null
+           COUNT_IF(deliveries IS NOT NULL AND last_ball.balls_remaining IS DISTINCT FROM
+                    IF(is_super_over, 1, overs_per_side) * balls_per_over - legal_balls) AS balls_remaining_mismatch
+    FROM scoped
+    GROUP BY ROLLUP(match_scope)
+""").collect()
+# Formats by size, then "all"
+scopes = {row["scope"]: row.asDict() for row in sorted(scope_rows, key=lambda row: (row["scope"] == "all", -row["deliveries"]))}
+
+# Checks only the whole run can answer
+overall = scopes["all"]
+if BUILD_MATCHUPS:
+    # Every ball lands in exactly one matchup, so the totals must agree with deliveries
+    matchup_totals = spark.sql("SELECT COALESCE(SUM(balls), 0) AS balls, COALESCE(SUM(runs), 0) AS runs FROM matchups").first()
+    overall["matchups_mismatch"] = abs(matchup_totals["balls"] - overall["balls_faced"]) + abs(matchup_totals["runs"] - overall["runs_batter"])
+if DELIVERIES_SLIM:
+    # player_key only round-trips for 8-hex-digit IDs
+    overall["ambiguous_player_keys"] = spark.sql("""
+        SELECT COUNT_IF(LPAD(LOWER(CONV(player_key, 10, 16)), 8, '0') <> player_id) AS n FROM players
+    """).first()["n"]
+
+
+def null_rate(column, over="deliveries"):
+    return lambda scope: scope[f"null_{column}"] / scope[over] if scope[over] else 0.0
+
+
+# check: (value of a scope, largest passing value or None to only record it, severity). A check whose
+# value a scope doesn't have (the whole-run ones) is skipped there.
+validation_checks = {
+    "matches": (lambda scope: scope["matches"], None, "info"),
+    "innings": (lambda scope: scope["innings"], None, "info"),
+    "deliveries": (lambda scope: scope["deliveries"], None, "info"),
+    **{f"{c}_null_rate": (null_rate(c, "wickets" if c == "wicket_player_out_id" else "deliveries"),
+                          VALIDATION_MAX_ID_NULL_RATE, "hard") for c in ID_COLUMNS},
+    "orphan_match_ids": (lambda scope: scope["orphan_match_ids"], 0, "hard"),
+    "runs_total_mismatch": (lambda scope: scope["runs_total_mismatch"], 0, "hard"),
+    # Not always wrong: a side can declare before facing a ball
+    "empty_innings": (lambda scope: scope["empty_innings"], 0, "warn"),
+    **{f"{column}_mismatch": (lambda scope, column=column: scope[f"{column}_mismatch"], 0, "hard") for column in flag_filters},
+    "match_state_mismatch": (lambda scope: scope["match_state_mismatch"], 0, "hard"),
+    "balls_remaining_mismatch": (lambda scope: scope["balls_remaining_mismatch"], 0, "hard"),
+    "unknown_codes": (lambda scope: scope["unknown_codes"], 0, "hard"),
+    "matchups_mismatch": (lambda scope: scope["matchups_mismatch"], 0, "hard"),
+    "ambiguous_player_keys": (lambda scope: scope["ambiguous_player_keys"], 0, "hard"),
+}
+
+checked_at = datetime.now()
+validation_results = []
+for scope_name, scope in scopes.items():
+    for check, (value_of_scope, max_value, severity) in validation_checks.items():
+        try:
+            value = float(value_of_scope(scope))
+        except KeyError:
+            continue
+        passed = max_value is None or value <= max_value
+        validation_results.append((run_metrics.run_id, checked_at, check, scope_name, value,
+                                   None if max_value is None else float(max_value), severity, passed))
+
+spark.createDataFrame(validation_results, schema=validation_results_schema) \
+    .write.format("delta").mode("append").saveAsTable("etl_validation")
+os.makedirs(RUN_METRICS_DIR, exist_ok=True)
+with open(os.path.join(RUN_METRICS_DIR, f"{run_metrics.run_id}-validation.json"), "w") as f:
+    json.dump([dict(zip(validation_results_schema.fieldNames(), result)) for result in validation_results], f, default=str)
+
+print(f"{'scope':<14} {'matches':>9} {'innings':>9} {'deliveries':>12}")
+for scope_name, scope in scopes.items():
+    print(f"{scope_name:<14} {scope['matches']:>9,} {scope['innings']:>9,} {scope['deliveries']:>12,}")
+
+failed = [result for result in validation_results if not result[7]]
+for _, _, check, scope_name, value, max_value, severity, _ in failed:
+    print(f"{'✗' if severity == 'hard' else '⚠'} {check} [{scope_name}]: {value:,.4g} (max {max_value:,.4g})")
+hard_failures = [f"{check} [{scope_name}]" for _, _, check, scope_name, _, _, severity, _ in failed if severity == "hard"]
+print(f"\n{len(validation_results) - len(failed)} of {len(validation_results)} checks passed — results in etl_validation")
+
+# Top 10 batters by runs — from the per-innings summary instead of the deliveries table
+print("\nTop 10 batters by total runs:")
 spark.sql("""
-    SELECT d.batter, SUM(d.runs_batter) as total_runs, 
-           COUNT(CASE WHEN d.extras_wides = 0 THEN 1 END) as balls_faced
-    FROM deliveries d
-    WHERE d.extras_wides = 0 OR d.runs_batter > 0
-    GROUP BY d.batter
+    SELECT b.player_id, MAX(b.player_name) as batter, SUM(b.runs) as total_runs,
+           SUM(b.balls_faced) as balls_faced, SUM(CAST(b.is_out AS INT)) as dismissals
+    FROM batting_innings b
+    GROUP BY b.player_id
     ORDER BY total_runs DESC
     LIMIT 10
 """).show(truncate=False)
 
-# Wicket kind distribution
-print("Wicket types:")
-spark.sql("""
-    SELECT wicket_kind, COUNT(*) as count
-    FROM deliveries
-    WHERE is_wicket = true
-    GROUP BY wicket_kind
-    ORDER BY count DESC
-""").show()
+if hard_failures:
+    run_metrics.end("validate", rows=overall["deliveries"], errors=len(hard_failures),
+                    error=f"Failed checks: {', '.join(hard_failures)}"[:1000])
+    raise AssertionError(f"{len(hard_failures)} hard validation check(s) failed: {', '.join(hard_failures)}")
+run_metrics.end("validate", rows=overall["deliveries"])
+
 
 # CELL ********************
 
@@ -476,6 +2524,8 @@ spark.sql("""
 #
 # This step merges that data into the `players` table so cricket-mcp tools like
 # `get_style_matchup` can query enrichment columns directly on the players table.
+# It is a Delta MERGE that only rewrites the files holding players whose enrichment
+# columns changed, and commits nothing when none did — DirectLake keeps its framing.
 #
 # Join key: `player_enrichment.cricsheet_id = players.player_id`
 
@@ -483,47 +2533,75 @@ spark.sql("""
 
 # Merge player_enrichment into players table
 # Only runs if player_enrichment table exists (created by PlayerEnrichment dataflow)
-try:
-    enrichment_df = spark.table("player_enrichment")
-    enrichment_count = enrichment_df.count()
-    print(f"Found player_enrichment table: {enrichment_count:,} rows")
-
-    # Read current players table
-    players_current = spark.table("players")
-    players_count = players_current.count()
-    print(f"Current players table: {players_count:,} rows")
-
-    # Left join players with enrichment on cricsheet_id = player_id
-    # Use enrichment values where available, keep NULLs where not
-    merged_df = players_current.alias("p").join(
-        enrichment_df.alias("e"),
-        F.col("p.player_id") == F.col("e.cricsheet_id"),
-        "left"
-    ).select(
-        F.col("p.player_id"),
-        F.col("p.player_name"),
-        F.coalesce(F.col("e.batting_style"), F.col("p.batting_style")).alias("batting_style"),
-        F.coalesce(F.col("e.bowling_style"), F.col("p.bowling_style")).alias("bowling_style"),
-        F.coalesce(F.col("e.playing_role"), F.col("p.playing_role")).alias("playing_role"),
-        F.coalesce(F.col("e.country"), F.col("p.country")).alias("country"),
-    )
+ENRICHMENT_COLUMNS = ["batting_style", "bowling_style", "playing_role", "country"]
 
-    # Overwrite players table with enriched data
-    merged_df.write.format("delta").mode("overwrite").option("overwriteSchema", "true").saveAsTable("players")
+with run_metrics.table_write("players", stage="enrich"):
+    try:
+        enrichment_df = spark.table("player_enrichment")
+        print(f"Found player_enrichment table: {enrichment_df.count():,} rows")
+
+        # One enrichment row per player — MERGE rejects several source rows for one target row
+        enrichment_rows = (enrichment_df
+                           .select(F.col("cricsheet_id").alias("player_id"), *ENRICHMENT_COLUMNS)
+                           .dropDuplicates(["player_id"]))
+
+        # Players an enrichment value would change; a null enrichment value keeps the current one
+        changed = F.lit(False)
+        for c in ENRICHMENT_COLUMNS:
+            changed = changed | (F.col(f"e.{c}").isNotNull() & ~F.col(f"e.{c}").eqNullSafe(F.col(f"p.{c}")))
+        changes_df = (spark.table("players").alias("p")
+                      .join(F.broadcast(enrichment_rows).alias("e"), "player_id")
+                      .where(changed)
+                      .select("player_id", *[F.col(f"e.{c}") for c in ENRICHMENT_COLUMNS])
+                      .cache())
+        changed_count = changes_df.count()
+
+        if changed_count == 0:
+            print("✓ players table already up to date — nothing to merge")
+        else:
+            (DeltaTable.forName(spark, "players").alias("p")
+                .merge(F.broadcast(changes_df).alias("e"), "p.player_id = e.player_id")
+                .whenMatchedUpdate(set={c: F.coalesce(F.col(f"e.{c}"), F.col(f"p.{c}")) for c in ENRICHMENT_COLUMNS})
+                .execute())
+            print(f"✓ players table updated: {changed_count:,} players with new enrichment data")
+        changes_df.unpersist()
 
-    # Report enrichment stats
-    enriched_count = merged_df.filter(F.col("batting_style").isNotNull()).count()
-    print(f"✓ players table updated: {merged_df.count():,} rows ({enriched_count:,} with enrichment data)")
+    except Exception as e:
+        if "Table or view not found" in str(e) or "is not a Delta table" in str(e):
+            print("⏭ player_enrichment table not found — skipping merge (run PlayerEnrichment dataflow first)")
+        else:
+            raise e
 
-except Exception as e:
-    if "Table or view not found" in str(e) or "is not a Delta table" in str(e):
-        print("⏭ player_enrichment table not found — skipping merge (run PlayerEnrichment dataflow first)")
-    else:
-        raise e
+# CELL ********************
+
+# MARKDOWN ********************
+
+# ## Step 7: Record run metrics
+#
+# Appends one row per stage — wall time, rows, bytes, peak driver RSS and error counts — to the
+# `etl_runs` table and prints the run as JSON (also saved under `RUN_METRICS_DIR`). Run it after a
+# failed cell too: stages that never finished are recorded as failed.
 
 # CELL ********************
 
-# Clean up temp files
-import shutil
-shutil.rmtree(tmp_dir, ignore_errors=True)
-print(f"Cleaned up temporary directory: {tmp_dir}")
+# --- RUN METRICS ---
+run = run_metrics.finish()
+run_fields = [run[name] for name in ("run_id", "run_started_at", "status", "ingest_mode", "parse_mode", "parse_backend")]
+etl_runs_df = spark.createDataFrame(
+    [(*run_fields, *(record[f.name] for f in etl_runs_schema.fields[len(run_fields):])) for record in run["stages"]],
+    schema=etl_runs_schema,
+)
+etl_runs_df.write.format("delta").mode("append").saveAsTable("etl_runs")
+
+run_json = json.dumps(run, default=str)
+os.makedirs(RUN_METRICS_DIR, exist_ok=True)
+with open(os.path.join(RUN_METRICS_DIR, f"{run['run_id']}.json"), "w") as f:
+    f.write(run_json)
+print(run_json)
+
+print(f"\n=== Run {run['run_id']} {run['status']} ===")
+for record in run["stages"]:
+    print(f"  {record['stage']:<22} {record['seconds']:>9.1f}s  {record['rows'] or 0:>12,} rows  "
+          f"{(record['bytes'] or 0) / (1024 * 1024):>10,.1f} MB  peak RSS {record['peak_driver_rss_mb'] or 0:>7,.0f} MB"
+          + (f"  {record['errors']} errors" if record["errors"] else "")
+          + (f"  {record['error']}" if record["error"] else ""))
@@ -0,0 +1,596 @@
+#!/usr/bin/env python3
+"""Benchmark CricketETL stages locally against a synthetic Cricsheet archive.
+
+Runs the notebook's own parameter, imports, schema and parser cells (no Fabric needed, only a
+local pyspark, pyarrow and delta-spark install — the imports cell imports delta.tables, though
+nothing is written as Delta) against a generated archive of realistic matches — a Test/ODI/T20
+mix with super overs, forfeited innings, declarations and multi-wicket balls — at any scale
+(--matches 1000 … 100000), or against an existing Cricsheet ZIP (--archive).
+
+Stages, each reported with wall time, matches/s, rows/s and peak RSS of the driver (Python)
+and JVM processes while it ran:
+
+  generate           - write the synthetic archive
+  parse              - driver-mode parse loop (iter_parsed_matches into a compact MatchTables),
+                       deliveries flushed in DeliveryChunkWriter chunks as in the notebook
+  write_deliveries   - those chunks: Arrow hand-off, prepare_deliveries, Parquet write
+  write_matches / write_innings
+  parse_distributed  - (--distributed) parse_partition in mapPartitions over the broadcast ZIP
+
+Writes go to Parquet in a temp directory: Delta isn't needed locally, and a Delta write is the
+same Parquet files plus a log commit. The results are saved as JSON (--output, by default a
+timestamped file in benchmark-results/), and --baseline prints each stage's change against an
+earlier result file.
+
+--compare also runs the A/B comparisons:
+  backends - the JSON backends (PARSE_BACKEND): matches/s each, checked for identical output
+  stores   - plain list columns (ColumnBuffer) against dictionary-encoded, typed-array columns
+             (CompactColumnBuffer): parse time, buffered memory and Arrow hand-off
+  handoff  - list of dicts per row → spark.createDataFrame(rows, schema) (pickled row by row)
+             against ColumnBuffer → to_spark_dataframe(buffer, schema) (Arrow record batches)
+
+Usage:
+  python3 scripts/benchmark_etl.py [--matches 2000] [--mix T20=0.5,ODI=0.3,Test=0.2]
+                                  [--archive path/to/all_json.zip] [--save-archive path.zip]
+                                  [--backends json,orjson,msgspec] [--compare backends,stores,handoff]
+                                  [--distributed] [--output results.json] [--baseline earlier.json]
+"""
+import argparse, json, os, platform, random, subprocess, sys, tempfile, threading, time, tracemalloc, zipfile
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+
+REPO = Path(__file__).resolve().parent.parent
+NOTEBOOK = REPO / 'notebooks' / 'CricketETL.py'
+RESULTS_DIR = REPO / 'benchmark-results'
+
+
+def load_notebook_cells(*prefixes):
+    """Return the notebook's code cells whose source starts with one of the given prefixes, in notebook order."""
+    raw_cells = NOTEBOOK.read_text().split('# CELL ********************')
+    code_cells = []
+    for raw in raw_cells:
+        raw = raw.strip()
+        if not raw or raw.startswith('# Fabric notebook') or raw.startswith('# METADATA') or raw.startswith('# MARKDOWN'):
+            continue
+        if raw.startswith(prefixes):
+            code_cells.append(raw)
+    return code_cells
+
+
+# --- SYNTHETIC ARCHIVE ---
+# Overs per side (None = unlimited) and the chance a legal ball takes a wicket, per format
+FORMATS = {'T20': (20, 1 / 20), 'ODI': (50, 1 / 32), 'Test': (None, 1 / 55)}
+# Runs off the bat per legal ball, per format
+RUN_WEIGHTS = {'T20': [33, 37, 9, 1, 13, 7], 'ODI': [45, 33, 8, 1, 10, 3], 'Test': [62, 22, 6, 2, 7, 1]}
+RUN_VALUES = [0, 1, 2, 3, 4, 6]
+WICKET_KINDS = (['caught'] * 55 + ['bowled'] * 18 + ['lbw'] * 13 + ['run out'] * 7 + ['stumped'] * 3
+                + ['caught and bowled'] * 2 + ['hit wicket', 'retired hurt'])
+SUPER_OVER_RATE = 0.01      # of limited-overs matches
+FORFEIT_RATE = 0.005        # of Tests (third innings forfeited)
+MULTI_WICKET_RATE = 0.002   # of wicket balls: the non-striker is out on the same ball
+N_TEAMS, SQUAD_SIZE = 24, 18
+VENUES = [(f'Ground {i}', f'City {i % 17}') for i in range(40)]
+
+
+def parse_mix(mix):
+    """'T20=0.5,ODI=0.3,Test=0.2' → {'T20': 0.5, ...}"""
+    weights = {}
+    for part in mix.split(','):
+        match_type, _, weight = part.partition('=')
+        if match_type not in FORMATS:
+            raise ValueError(f'Unknown match type {match_type!r} in --mix; expected {", ".join(FORMATS)}')
+        weights[match_type] = float(weight)
+    return weights
+
+
+def squad(team_idx):
+    team = f'Team {team_idx:02d}'
+    people = {f'{team} Player {i:02d}': f'{(team_idx + 1) << 12 | i:08x}' for i in range(SQUAD_SIZE)}
+    return team, people
+
+
+def synthetic_innings(rng, match_type, team, batters, bowlers, max_overs, target=None):
+    """Ball-by-ball innings until the overs run out, the side is out or the target is reached."""
+    wicket_chance = FORMATS[match_type][1]
+    weights = RUN_WEIGHTS[match_type]
+    order = list(batters)
+    striker, non_striker, next_in = order[0], order[1], 2
+    runs = wickets = 0
+    overs = []
+    over_count = max_overs if max_overs else rng.randint(35, 150)
+    done = False
+    for over in range(over_count):
+        bowler = bowlers[over % len(bowlers)]
+        deliveries = []
+        legal = 0
+        while legal < 6 and not done:
+            delivery = {'batter': striker, 'bowler': bowler, 'non_striker': non_striker}
+            extras = {}
+            roll = rng.random()
+            if roll < 0.025:
+                extras['wides'] = 1 if rng.random() < 0.9 else 5
+                batter_runs = 0
+            else:
+                if roll < 0.033:
+                    extras['noballs'] = 1
+                else:
+                    legal += 1
+                batter_runs = rng.choices(RUN_VALUES, weights)[0]
+                if batter_runs == 0 and rng.random() < 0.04:
+                    extras['byes' if rng.random() < 0.3 else 'legbyes'] = rng.choice([1, 1, 1, 2, 4])
+            if rng.random() < 0.0005:
+                extras['penalty'] = 5
+            extra_runs = sum(extras.values())
+            delivery['runs'] = {'batter': batter_runs, 'extras': extra_runs, 'total': batter_runs + extra_runs}
+            if batter_runs in (4, 6) and rng.random() < 0.01:
+                delivery['runs']['non_boundary'] = True
+            if extras:
+                delivery['extras'] = extras
+            runs += batter_runs + extra_runs
+
+            if 'wides' not in extras and rng.random() < wicket_chance:
+                kind = rng.choice(WICKET_KINDS)
+                out = [(non_striker if kind == 'run out' and rng.random() < 0.3 else striker, kind)]
+                if rng.random() < MULTI_WICKET_RATE:
+                    # A second dismissal on the same ball (the other batter, usually run out)
+                    other = non_striker if out[0][0] == striker else striker
+                    out.append((other, 'run out'))
+                delivery['wickets'] = []
+                for player_out, kind in out:
+                    wicket = {'player_out': player_out, 'kind': kind}
+                    if kind in ('caught', 'run out', 'stumped'):
+                        wicket['fielders'] = [{'name': rng.choice(bowlers)}]
+                    delivery['wickets'].append(wicket)
+                    if kind != 'retired hurt':
+                        wickets += 1
+                    replacement = order[next_in] if next_in < len(order) else None
+                    next_in += 1
+                    if player_out == striker:
+                        striker = replacement
+                    else:
+                        non_striker = replacement
+                if striker is None or non_striker is None:
+                    done = True
+            deliveries.append(delivery)
+            if target is not None and runs >= target:
+                done = True
+            if not done and batter_runs % 2 == 1:
+                striker, non_striker = non_striker, striker
+        overs.append({'over': over, 'deliveries': deliveries})
+        if done:
+            break
+        striker, non_striker = non_striker, striker
+    return {'team': team, 'overs': overs}, runs, wickets
+
+
+def synthetic_match(rng, match_id, match_type):
+    """A schema-complete Cricsheet match of the given format, simulated ball by ball."""
+    max_overs = FORMATS[match_type][0]
+    (team1, people1), (team2, people2) = (squad(i) for i in rng.sample(range(N_TEAMS), 2))
+    xi = {team1: rng.sample(sorted(people1), 11), team2: rng.sample(sorted(people2), 11)}
+    teams = [team1, team2]
+    toss_winner = rng.choice(teams)
+    first = toss_winner if rng.random() < 0.5 else (team2 if toss_winner == team1 else team1)
+    order = [first, team2 if first == team1 else team1]
+
+    def play(batting, target=None, overs=max_overs, **flags):
+        bowling = order[1] if batting == order[0] else order[0]
+        entry, runs, wickets = synthetic_innings(rng, match_type, batting, xi[batting], xi[bowling][-6:], overs, target)
+        entry.update(flags)
+        if match_type != 'Test':
+            entry['powerplays'] = [{'from': 0.1, 'to': (max_overs // 5 if overs == max_overs else 1) - 0.4,
+                                    'type': 'mandatory'}]
+        return entry, runs, wickets
+
+    innings = []
+    if match_type == 'Test':
+        totals = {team1: 0, team2: 0}
+        for innings_idx, batting in enumerate(order * 2):
+            if innings_idx == 2 and rng.random() < FORFEIT_RATE:
+                innings.append({'team': batting, 'forfeited': True})
+                continue
+            entry, runs, wickets = play(batting)
+            if wickets < 10 and innings_idx < 3 and rng.random() < 0.5:
+                entry['declared'] = True
+            innings.append(entry)
+            totals[batting] += runs
+        days = 5
+        if rng.random() < 0.3:
+            outcome = {'result': 'draw'}
+        else:
+            winner = max(totals, key=totals.get)
+            outcome = {'winner': winner, 'by': {'runs': abs(totals[team1] - totals[team2]) or 1}}
+    else:
+        entry, first_runs, _ = play(order[0])
+        innings.append(entry)
+        entry, second_runs, second_wickets = play(order[1], target=first_runs + 1)
+        entry['target'] = {'overs': max_overs, 'runs': first_runs + 1}
+        innings.append(entry)
+        days = 1
+        if rng.random() < SUPER_OVER_RATE:
+            entry, so_runs, _ = play(order[1], overs=1, super_over=True)
+            innings.append(entry)
+            entry, _, _ = play(order[0], target=so_runs + 1, overs=1, super_over=True)
+            innings.append(entry)
+            outcome = {'result': 'tie', 'eliminator': rng.choice(teams)}
+        elif second_runs > first_runs:
+            outcome = {'winner': order[1], 'by': {'wickets': 10 - second_wickets}}
+        else:
+            outcome = {'winner': order[0], 'by': {'runs': max(first_runs - second_runs, 1)}}
+
+    start = date(2005, 1, 1) + timedelta(days=rng.randrange(20 * 365))
+    venue, city = rng.choice(VENUES)
+    info = {
+        'balls_per_over': 6, 'city': city,
+        'dates': [(start + timedelta(days=d)).isoformat() for d in range(days)],
+        'gender': 'male' if rng.random() < 0.8 else 'female',
+        'match_type': match_type, 'match_type_number': int(match_id) % 5000 + 1,
+        'season': str(start.year), 'team_type': 'international' if rng.random() < 0.6 else 'club',
+        'teams': teams, 'venue': venue,
+        'toss': {'decision': 'bat' if first == toss_winner else 'field', 'winner': toss_winner},
+        'outcome': outcome,
+        'event': {'name': f'Synthetic {match_type} Series {start.year}', 'match_number': int(match_id) % 60 + 1},
+        'player_of_match': [rng.choice(xi[rng.choice(teams)])],
+        'registry': {'people': {name: pid for people in (people1, people2) for name, pid in people.items()
+                                if name in xi[team1] or name in xi[team2]}},
+        'players': xi,
+        'officials': {'umpires': ['Umpire 1', 'Umpire 2'], 'match_referees': ['Referee']},
+    }
+    if max_overs:
+        info['overs'] = max_overs
+    return {'meta': {'data_version': '1.1.0', 'created': '2024-01-01', 'revision': 1}, 'info': info, 'innings': innings}
+
+
+def write_synthetic_archive(path, n_matches, mix, seed=42):
+    """Write n_matches synthetic matches to a Cricsheet-style ZIP; returns (matches per format, deliveries)."""
+    rng = random.Random(seed)
+    types, weights = zip(*mix.items())
+    counts = dict.fromkeys(types, 0)
+    deliveries = 0
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for i in range(n_matches):
+            match_id = str(1_000_000 + i)
+            match_type = rng.choices(types, weights)[0]
+            match = synthetic_match(rng, match_id, match_type)
+            counts[match_type] += 1
+            deliveries += sum(len(over['deliveries']) for inn in match['innings'] for over in inn.get('overs', []))
+            zf.writestr(f'{match_id}.json', json.dumps(match))
+        zf.writestr('README.txt', 'Synthetic Cricsheet archive for benchmarking')
+    return counts, deliveries
+
+
+# --- MEASUREMENT ---
+def rss_mb(pid='self'):
+    """Resident set size of a process in MB, from /proc (None where that isn't available)."""
+    try:
+        with open(f'/proc/{pid}/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError):
+        return None
+
+
+class RssSampler:
+    """Samples driver (Python) and JVM RSS on a background thread, keeping the peak per stage label.
+
+    Set .stage to attribute the following samples to another stage; None pauses attribution.
+    """
+
+    def __init__(self, jvm_pid, interval=0.05):
+        self.jvm_pid = jvm_pid
+        self.interval = interval
+        self.stage = None
+        self.peaks = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.sample()
+            self._stop.wait(self.interval)
+
+    def sample(self):
+        stage = self.stage
+        if stage is None:
+            return
+        peak = self.peaks.setdefault(stage, {'driver': 0.0, 'jvm': 0.0})
+        for key, pid in (('driver', 'self'), ('jvm', self.jvm_pid)):
+            value = rss_mb(pid) if pid is not None else None
+            if value is not None:
+                peak[key] = max(peak[key], value)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+class Stages:
+    """Collects one record per stage: wall time, matches/s, rows/s and peak driver/JVM RSS."""
+
+    def __init__(self, sampler):
+        self.sampler = sampler
+        self.seconds = {}
+        self.records = []
+
+    def run(self, stage, fn):
+        """Time fn() as stage (adding to its time if the stage already ran) and return its result."""
+        previous, self.sampler.stage = self.sampler.stage, stage
+        self.sampler.sample()
+        start = time.perf_counter()
+        try:
+            return fn()
+        finally:
+            self.seconds[stage] = self.seconds.get(stage, 0.0) + time.perf_counter() - start
+            self.sampler.sample()
+            self.sampler.stage = previous
+
+    def record(self, stage, matches, rows, **extra):
+        seconds = self.seconds[stage]
+        peak = self.sampler.peaks.get(stage, {})
+        record = {
+            'stage': stage, 'seconds': round(seconds, 3), 'matches': matches, 'rows': rows,
+            'matches_per_s': round(matches / seconds, 1) if seconds else None,
+            'rows_per_s': round(rows / seconds, 1) if seconds else None,
+            'peak_driver_rss_mb': round(peak['driver'], 1) if peak.get('driver') else None,
+            'peak_jvm_rss_mb': round(peak['jvm'], 1) if peak.get('jvm') else None,
+            **extra,
+        }
+        self.records.append(record)
+        print(f'{stage:>18}: {seconds:8.2f}s | {record["matches_per_s"] or 0:>10,.0f} matches/s '
+              f'| {record["rows_per_s"] or 0:>12,.0f} rows/s | peak RSS driver {record["peak_driver_rss_mb"] or 0:,.0f} MB, '
+              f'JVM {record["peak_jvm_rss_mb"] or 0:,.0f} MB')
+        return record
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def dir_bytes(path):
+    return sum(f.stat().st_size for f in Path(path).rglob('*') if f.is_file())
+
+
+# --- STAGES ---
+def run_pipeline(ns, stages, json_files, archive, archive_bytes, out_dir, distributed):
+    """The notebook's driver-mode parse → write path, stage by stage, with Parquet in place of Delta."""
+    spark = ns['spark']
+    schemas = (ns['matches_schema'], ns['innings_schema'], ns['deliveries_schema'])
+    tables = ns['MatchTables'](*schemas, compact_deliveries=True)
+    decode = ns['make_json_decoder'](ns['PARSE_BACKEND'])
+    deliveries_path = os.path.join(out_dir, 'deliveries')
+
+    def write_chunk(buffer, chunk_number, match_ids):
+        def write():
+            chunk_df = ns['to_spark_dataframe'](buffer, ns['deliveries_schema'])
+            chunk_matches_df = ns['to_spark_dataframe'](tables.matches, ns['matches_schema'])
+            chunk_innings_df = ns['to_spark_dataframe'](tables.innings, ns['innings_schema'])
+            writer = ns['prepare_deliveries'](chunk_df, chunk_matches_df, chunk_innings_df).write.mode('append' if chunk_number else 'overwrite')
+            if ns['DELIVERIES_PARTITION_BY']:
+                writer = writer.partitionBy(*ns['DELIVERIES_PARTITION_BY'])
+            writer.parquet(deliveries_path)
+        stages.run('write_deliveries', write)
+
+    writer = ns['DeliveryChunkWriter'](tables.deliveries, write_chunk, budget_mb=ns['DELIVERIES_MEMORY_BUDGET_MB'],
+                                        min_rows=ns['DELIVERIES_MIN_CHUNK_ROWS'], max_rows=ns['DELIVERIES_MAX_CHUNK_ROWS'])
+    errors = 0
+
+    def parse():
+        nonlocal errors
+        for json_file, _, error in ns['iter_parsed_matches'](json_files, archive, tables, decode):
+            if error is not None:
+                errors += 1
+                continue
+            writer.maybe_flush(ns['match_id_for'](json_file))
+        return writer.close()
+
+    deliveries_rows = stages.run('parse', parse)
+    # The chunk writes ran inside the parse loop; parse time excludes them
+    stages.seconds['parse'] -= stages.seconds.get('write_deliveries', 0.0)
+    n_matches = len(tables.matches)
+    stages.record('parse', n_matches, deliveries_rows, errors=errors, backend=ns['PARSE_BACKEND'])
+    stages.record('write_deliveries', n_matches, deliveries_rows, chunks=writer.chunks_written,
+                  bytes=dir_bytes(deliveries_path))
+
+    for table in ('matches', 'innings'):
+        path = os.path.join(out_dir, table)
+        buffer = getattr(tables, table)
+        stages.run(f'write_{table}', lambda: ns['to_spark_dataframe'](buffer, ns[f'{table}_schema']).write.mode('overwrite').parquet(path))
+        stages.record(f'write_{table}', n_matches, len(buffer), bytes=dir_bytes(path))
+
+    if distributed:
+        def parse_distributed():
+            sc = spark.sparkContext
+            sizes = {info.filename: info.file_size for info in archive.infolist()}
+            shards = ns['shard_by_size']([(i, f, sizes[f]) for i, f in enumerate(json_files)], sc.defaultParallelism * 2)
+            archive_broadcast = sc.broadcast(archive_bytes)
+            backend, parse_partition = ns['PARSE_BACKEND'], ns['parse_partition']
+            counts = (sc.parallelize(shards, len(shards))
+                      .mapPartitions(lambda it: parse_partition(it, archive_broadcast, schemas, backend))
+                      .map(lambda r: r[0]).countByValue())
+            archive_broadcast.unpersist()
+            return counts
+        counts = stages.run('parse_distributed', parse_distributed)
+        stages.record('parse_distributed', counts.get('match', 0), counts.get('delivery', 0), errors=counts.get('error', 0))
+
+
+# --- A/B COMPARISONS ---
+def compare_backends(ns, json_files, archive, backends):
+    """Parse the archive once per JSON backend; the first backend's output is the reference."""
+    schemas = (ns['matches_schema'], ns['innings_schema'], ns['deliveries_schema'])
+    reference = None
+    results = {}
+    for backend in backends:
+        try:
+            decode = ns['make_json_decoder'](backend)
+        except ImportError as e:
+            print(f'{backend:>10}: skipped ({e})')
+            results[backend] = {'skipped': str(e)}
+            continue
+        tables = ns['MatchTables'](*schemas, compact_deliveries=True)
+        outcomes, parse_s = timed(lambda: [(json_file, registry, error is None) for json_file, registry, error
+                                           in ns['iter_parsed_matches'](json_files, archive, tables, decode)])
+        output = (outcomes, [list(getattr(tables, table).rows()) for table in ('matches', 'innings', 'deliveries')])
+        if reference is None:
+            reference = output
+        identical = output == reference
+        results[backend] = {'parse_s': parse_s, 'matches_per_s': len(json_files) / parse_s, 'identical': identical}
+        print(f'{backend:>10}: parsed {len(json_files):,} matches in {parse_s:.2f}s '
+              f'({len(json_files) / parse_s:,.0f} matches/s){"" if identical else "  OUTPUT DIFFERS"}')
+    return results
+
+
+def compare_stores(ns, json_files, archive):
+    """Parse into plain list columns and into the compact store: parse time and buffered memory."""
+    schemas = (ns['matches_schema'], ns['innings_schema'], ns['deliveries_schema'])
+
+    def parse(compact):
+        tables = ns['MatchTables'](*schemas, compact_deliveries=compact)
+        for _ in ns['iter_parsed_matches'](json_files, archive, tables):
+            pass
+        return tables
+
+    stores = {}
+    for store, compact in (('lists', False), ('compact', True)):
+        tables, parse_s = timed(lambda: parse(compact))
+        # Separate traced run: tracemalloc slows parsing down too much to time it
+        tracemalloc.start()
+        traced = parse(compact)
+        buffered_mb = tracemalloc.get_traced_memory()[0] / (1024 * 1024)
+        tracemalloc.stop()
+        del traced
+        stores[store] = {'tables': tables, 'parse_s': parse_s, 'buffered_mb': buffered_mb}
+        print(f'{store:>10}: parsed {len(json_files):,} matches in {parse_s:.2f}s '
+              f'({len(json_files) / parse_s:,.0f} matches/s), {buffered_mb:,.1f} MB buffered')
+    return stores
+
+
+def compare_handoff(ns, stores):
+    """createDataFrame from per-row dicts against the Arrow hand-off, per table (noop sink)."""
+    spark = ns['spark']
+    results = {}
+    for table in ('matches', 'innings', 'deliveries'):
+        buffer = getattr(stores['lists']['tables'], table)
+        schema = ns[f'{table}_schema']
+        dict_rows, dicts_s = timed(lambda: [dict(zip(buffer.columns, row)) for row in buffer.rows()])
+
+        # noop sink forces every row through createDataFrame without measuring a real write
+        _, rows_s = timed(lambda: spark.createDataFrame(dict_rows, schema=schema).write.format('noop').mode('overwrite').save())
+        del dict_rows
+        _, arrow_s = timed(lambda: ns['to_spark_dataframe'](buffer, schema).write.format('noop').mode('overwrite').save())
+
+        results[table] = {'rows': len(buffer), 'dict_build_s': dicts_s, 'rows_s': rows_s, 'arrow_s': arrow_s}
+        print(f'{table:>10}: {len(buffer):>10,} rows | rows {rows_s:7.2f}s (+{dicts_s:.2f}s building dicts) '
+              f'| arrow {arrow_s:7.2f}s | {rows_s / arrow_s:5.1f}x')
+
+    compact_buffer = stores['compact']['tables'].deliveries
+    _, compact_arrow_s = timed(lambda: ns['to_spark_dataframe'](compact_buffer, ns['deliveries_schema']).write.format('noop').mode('overwrite').save())
+    results['deliveries']['compact_arrow_s'] = compact_arrow_s
+    print(f'{"":>10}  compact deliveries store | arrow {compact_arrow_s:7.2f}s')
+    return results
+
+
+def print_baseline_diff(stages, baseline_path):
+    """Per-stage rows/s change against an earlier results file."""
+    baseline = {r['stage']: r for r in json.loads(Path(baseline_path).read_text())['stages']}
+    print(f'\nAgainst {baseline_path}:')
+    for record in stages:
+        before = baseline.get(record['stage'])
+        if not before or not before.get('rows_per_s') or not record['rows_per_s']:
+            continue
+        change = (record['rows_per_s'] / before['rows_per_s'] - 1) * 100
+        print(f'{record["stage"]:>18}: {before["rows_per_s"]:>12,.0f} → {record["rows_per_s"]:>12,.0f} rows/s ({change:+.1f}%)')
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--matches', type=int, default=2000, help='synthetic archive size (ignored with --archive)')
+    parser.add_argument('--mix', default='T20=0.5,ODI=0.3,Test=0.2', help='synthetic match type weights')
+    parser.add_argument('--seed', type=int, default=42, help='synthetic archive seed')
+    parser.add_argument('--archive', help='existing Cricsheet-style ZIP to use instead of a synthetic one')
+    parser.add_argument('--save-archive', help='keep the generated archive at this path for later runs')
+    parser.add_argument('--backends', default='json,orjson,msgspec',
+                        help='comma-separated PARSE_BACKEND values to compare (the first is the reference '
+                             'output and the backend the stages use)')
+    parser.add_argument('--compare', default='backends,stores,handoff',
+                        help="comma-separated A/B comparisons to run after the stages ('' for none)")
+    parser.add_argument('--distributed', action='store_true', help='also time the distributed (mapPartitions) parse')
+    parser.add_argument('--output', help=f'results JSON path (default: a timestamped file in {RESULTS_DIR.name}/)')
+    parser.add_argument('--baseline', help='earlier results JSON to compare the stages against')
+    args = parser.parse_args()
+    backends = args.backends.split(',')
+    comparisons = [c for c in args.compare.split(',') if c]
+
+    from pyspark.sql import SparkSession
+    SparkSession.builder.config('spark.ui.showConsoleProgress', 'false').getOrCreate()
+
+    # The parameter cell first: the schema cell validates the layout parameters
+    ns = {}
+    for cell in load_notebook_cells('# PARAMETERS', 'import ', '# --- TABLE SCHEMAS', 'def match_id_for'):
+        exec(cell, ns)
+        if cell.startswith('# PARAMETERS'):
+            ns['PARSE_BACKEND'] = backends[0]
+    spark = ns['spark']
+    # Warm up the JVM so the first measured job doesn't pay for it
+    spark.range(1000).write.format('noop').mode('overwrite').save()
+    jvm_pid = spark.sparkContext._jvm.java.lang.ProcessHandle.current().pid()
+    sampler = RssSampler(jvm_pid).start()
+    stages = Stages(sampler)
+
+    results = {
+        'run': {
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'), 'commit': git_commit(),
+            'python': platform.python_version(), 'pyspark': spark.version, 'platform': platform.platform(),
+            'cpus': os.cpu_count(), 'args': vars(args),
+        },
+    }
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        zip_path = args.archive or args.save_archive or os.path.join(tmp_dir, 'synthetic.zip')
+        if not args.archive:
+            mix = parse_mix(args.mix)
+            (counts, generated_rows) = stages.run('generate', lambda: write_synthetic_archive(zip_path, args.matches, mix, args.seed))
+            stages.record('generate', args.matches, generated_rows, match_types=counts)
+        with open(zip_path, 'rb') as f:
+            archive_bytes = f.read()
+        archive = zipfile.ZipFile(zip_path)
+        json_files = [f for f in archive.namelist() if f.endswith('.json')]
+        results['archive'] = {'path': args.archive, 'matches': len(json_files), 'bytes': len(archive_bytes)}
+
+        run_pipeline(ns, stages, json_files, archive, archive_bytes, os.path.join(tmp_dir, 'tables'), args.distributed)
+        sampler.stop()
+        results['stages'] = stages.records
+
+        comparison_results = {}
+        if 'backends' in comparisons:
+            comparison_results['backends'] = compare_backends(ns, json_files, archive, backends)
+        if 'stores' in comparisons or 'handoff' in comparisons:
+            stores = compare_stores(ns, json_files, archive)
+            if 'handoff' in comparisons:
+                comparison_results['handoff'] = compare_handoff(ns, stores)
+            comparison_results['stores'] = {store: {k: v for k, v in r.items() if k != 'tables'} for store, r in stores.items()}
+            del stores
+        results['comparisons'] = comparison_results
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f'{datetime.now():%Y%m%d-%H%M%S}-{len(json_files)}.json'
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+    print(f'\nResults written to {output}')
+    if args.baseline:
+        print_baseline_diff(results['stages'], args.baseline)
+    # Non-zero exit if a backend changed the parsed output
+    return 0 if all(r.get('identical', True) for r in comparison_results.get('backends', {}).values()) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -8,15 +8,7 @@ Required env vars (or .env file):
 import json, os, sys
 from pathlib import Path
 
-# Load .env if present
-def load_dotenv():
-    env_path = Path(__file__).resolve().parent.parent / '.env'
-    if env_path.exists():
-        for line in env_path.read_text().splitlines():
-            line = line.strip()
-            if line and not line.startswith('#') and '=' in line:
-                k, v = line.split('=', 1)
-                os.environ.setdefault(k.strip(), v.strip())
+from fabric_client import load_dotenv
 
 load_dotenv()
 
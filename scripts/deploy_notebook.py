@@ -5,18 +5,10 @@ Required env vars (or .env file):
   FABRIC_WORKSPACE_ID  - Fabric workspace GUID
   FABRIC_NOTEBOOK_ID   - Notebook item GUID
 """
-import json, base64, os, sys, urllib.request, subprocess
+import json, base64, os, sys
 from pathlib import Path
 
-# Load .env if present
-def load_dotenv():
-    env_path = Path(__file__).resolve().parent.parent / '.env'
-    if env_path.exists():
-        for line in env_path.read_text().splitlines():
-            line = line.strip()
-            if line and not line.startswith('#') and '=' in line:
-                k, v = line.split('=', 1)
-                os.environ.setdefault(k.strip(), v.strip())
+from fabric_client import FabricClient, FabricError, load_dotenv
 
 load_dotenv()
 
@@ -27,14 +19,6 @@ if not all([workspace_id, notebook_id]):
     print('Error: Set FABRIC_WORKSPACE_ID, FABRIC_NOTEBOOK_ID in .env or environment')
     sys.exit(1)
 
-# Get token via Azure CLI
-result = subprocess.run(
-    ['az', 'account', 'get-access-token', '--resource', 'https://api.fabric.microsoft.com', '--query', 'accessToken', '-o', 'tsv'],
-    capture_output=True, text=True
-)
-token = result.stdout.strip()
-print(f"Token length: {len(token)}")
-
 # Read notebook
 nb_path = Path(__file__).resolve().parent.parent / 'notebooks' / 'CricketETL.ipynb'
 with open(nb_path, 'r') as f:
@@ -57,19 +41,12 @@ payload = {
     }
 }
 
-url = f"https://api.fabric.microsoft.com/v1/workspaces/{workspace_id}/notebooks/{notebook_id}/updateDefinition"
-
-data = json.dumps(payload).encode('utf-8')
-req = urllib.request.Request(url, data=data, method='POST')
-req.add_header('Authorization', f'Bearer {token}')
-req.add_header('Content-Type', 'application/json')
-
+client = FabricClient()
 try:
-    resp = urllib.request.urlopen(req)
+    # updateDefinition is a long-running operation: 202 Accepted, then poll until it finishes
+    resp = client.post_and_wait(f"/workspaces/{workspace_id}/notebooks/{notebook_id}/updateDefinition", payload)
     print(f"Status: {resp.status}")
-    body = resp.read().decode('utf-8')
-    print(f"Response: {body[:500] if body else '(empty - success)'}")
-except urllib.error.HTTPError as e:
-    print(f"Error: {e.code}")
-    body = e.read().decode('utf-8')
-    print(f"Response: {body[:500]}")
+    print(f"Response: {resp.body[:500] if resp.body else '(empty - success)'}")
+except (FabricError, TimeoutError) as e:
+    print(f"Error: {e}")
+    sys.exit(1)
@@ -7,20 +7,9 @@ Required env vars (or .env file):
   FABRIC_NOTEBOOK_ID   - Notebook item GUID
   FABRIC_DATAFLOW_ID   - Dataflow item GUID
 """
-import json, base64, os, subprocess, ssl, sys, urllib.request
-from pathlib import Path
+import json, base64, os, sys
 
-ssl._create_default_https_context = ssl._create_unverified_context
-
-# Load .env if present
-def load_dotenv():
-    env_path = Path(__file__).resolve().parent.parent / '.env'
-    if env_path.exists():
-        for line in env_path.read_text().splitlines():
-            line = line.strip()
-            if line and not line.startswith('#') and '=' in line:
-                k, v = line.split('=', 1)
-                os.environ.setdefault(k.strip(), v.strip())
+from fabric_client import FabricClient, FabricError, load_dotenv
 
 load_dotenv()
 
@@ -33,10 +22,6 @@ if not all([WS, PIPELINE_ID, NOTEBOOK_ID, DATAFLOW_ID]):
     print('Error: Set FABRIC_WORKSPACE_ID, FABRIC_PIPELINE_ID, FABRIC_NOTEBOOK_ID, FABRIC_DATAFLOW_ID in .env or environment')
     sys.exit(1)
 
-# Get token
-r = subprocess.run(['az', 'account', 'get-access-token', '--resource', 'https://api.fabric.microsoft.com', '--query', 'accessToken', '-o', 'tsv'], capture_output=True, text=True)
-token = r.stdout.strip()
-
 # Pipeline definition
 pipeline = {
     "properties": {
@@ -69,7 +54,7 @@ pipeline = {
 }
 
 payload_b64 = base64.b64encode(json.dumps(pipeline).encode()).decode()
-body = json.dumps({
+body = {
     "definition": {
         "parts": [
             {
@@ -79,17 +64,12 @@ body = json.dumps({
             }
         ]
     }
-}).encode()
-
-url = f"https://api.fabric.microsoft.com/v1/workspaces/{WS}/items/{PIPELINE_ID}/updateDefinition"
-req = urllib.request.Request(url, data=body, method='POST')
-req.add_header('Authorization', f'Bearer {token}')
-req.add_header('Content-Type', 'application/json')
+}
 
+client = FabricClient()
 try:
-    resp = urllib.request.urlopen(req, timeout=30)
+    resp = client.post_and_wait(f"/workspaces/{WS}/items/{PIPELINE_ID}/updateDefinition", body)
     print(f"OK: {resp.status}")
-except urllib.error.HTTPError as e:
-    print(f"HTTP {e.code}: {e.read().decode()[:500]}")
-except Exception as e:
+except (FabricError, OSError) as e:  # error status or failed operation; connection failure or timeout
     print(f"Error: {e}")
+    sys.exit(1)
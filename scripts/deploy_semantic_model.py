@@ -5,36 +5,26 @@ Required env vars (or .env file):
   FABRIC_WORKSPACE_ID     - Fabric workspace GUID
   FABRIC_SQL_ENDPOINT     - Lakehouse SQL endpoint hostname
   FABRIC_SQL_ENDPOINT_ID  - SQL endpoint GUID
-"""
-import json, base64, os, subprocess, ssl, sys, urllib.request
-from pathlib import Path
 
-ssl._create_default_https_context = ssl._create_unverified_context
+Optional:
+  DELIVERIES_SLIM=1       - model the slim deliveries table the notebook writes with
+                            DELIVERIES_SLIM = True (integer keys, teams / wicket_kinds / phases lookups)
+"""
+import json, base64, os, sys
 
-# Load .env if present
-def load_dotenv():
-    env_path = Path(__file__).resolve().parent.parent / '.env'
-    if env_path.exists():
-        for line in env_path.read_text().splitlines():
-            line = line.strip()
-            if line and not line.startswith('#') and '=' in line:
-                k, v = line.split('=', 1)
-                os.environ.setdefault(k.strip(), v.strip())
+from fabric_client import FabricClient, FabricError, load_dotenv
 
 load_dotenv()
 
 WS = os.environ.get('FABRIC_WORKSPACE_ID', '')
 SQL_ENDPOINT = os.environ.get('FABRIC_SQL_ENDPOINT', '')
 SQL_ENDPOINT_ID = os.environ.get('FABRIC_SQL_ENDPOINT_ID', '')
+SLIM = os.environ.get('DELIVERIES_SLIM', '').lower() in ('1', 'true', 'yes')
 
 if not all([WS, SQL_ENDPOINT, SQL_ENDPOINT_ID]):
     print('Error: Set FABRIC_WORKSPACE_ID, FABRIC_SQL_ENDPOINT, FABRIC_SQL_ENDPOINT_ID in .env or environment')
     sys.exit(1)
 
-def get_token():
-    r = subprocess.run(['az', 'account', 'get-access-token', '--resource', 'https://api.fabric.microsoft.com', '--query', 'accessToken', '-o', 'tsv'], capture_output=True, text=True)
-    return r.stdout.strip()
-
 # Build the TMDL model definition with proper DirectLake expressions
 model_bim = {
     "compatibilityLevel": 1604,
@@ -93,22 +83,44 @@ def col(name, dtype="string"):
 deliveries_measures = [
     {"name": "Total Runs", "expression": "SUM(deliveries[runs_total])", "formatString": "#,##0"},
     {"name": "Batter Runs", "expression": "SUM(deliveries[runs_batter])", "formatString": "#,##0"},
-    {"name": "Balls Faced", "expression": "COUNTROWS(FILTER(deliveries, deliveries[extras_wides] = 0))", "formatString": "#,##0"},
+    {"name": "Balls Faced", "expression": "SUM(deliveries[is_ball_faced])", "formatString": "#,##0"},
     {"name": "Strike Rate", "expression": "DIVIDE([Batter Runs], [Balls Faced], 0) * 100", "formatString": "#,##0.00"},
-    {"name": "Dismissals", "expression": "COUNTROWS(FILTER(deliveries, deliveries[is_wicket] = TRUE() && NOT(deliveries[wicket_kind] IN {\"retired hurt\", \"retired not out\", \"retired out\"})))", "formatString": "#,##0"},
+    {"name": "Dismissals", "expression": "SUM(deliveries[is_batter_dismissal])", "formatString": "#,##0"},
     {"name": "Batting Average", "expression": "DIVIDE([Batter Runs], [Dismissals], 0)", "formatString": "#,##0.00"},
-    {"name": "Wickets", "expression": "COUNTROWS(FILTER(deliveries, deliveries[is_wicket] = TRUE() && NOT(deliveries[wicket_kind] IN {\"run out\", \"retired hurt\", \"retired not out\", \"retired out\", \"obstructing the field\"})))", "formatString": "#,##0"},
-    {"name": "Bowler Runs", "expression": "SUMX(deliveries, deliveries[runs_total] - deliveries[extras_byes] - deliveries[extras_legbyes])", "formatString": "#,##0"},
-    {"name": "Legal Deliveries", "expression": "COUNTROWS(FILTER(deliveries, deliveries[extras_wides] = 0 && deliveries[extras_noballs] = 0))", "formatString": "#,##0"},
+    {"name": "Wickets", "expression": "SUM(deliveries[is_bowler_wicket])", "formatString": "#,##0"},
+    {"name": "Bowler Runs", "expression": "SUM(deliveries[bowler_runs])", "formatString": "#,##0"},
+    {"name": "Legal Deliveries", "expression": "SUM(deliveries[is_legal_ball])", "formatString": "#,##0"},
     {"name": "Economy Rate", "expression": "DIVIDE([Bowler Runs], [Legal Deliveries], 0) * 6", "formatString": "#,##0.00"},
     {"name": "Bowling Average", "expression": "DIVIDE([Bowler Runs], [Wickets], 0)", "formatString": "#,##0.00"},
     {"name": "Bowling Strike Rate", "expression": "DIVIDE([Legal Deliveries], [Wickets], 0)", "formatString": "#,##0.00"},
     {"name": "Dot Ball %", "expression": "DIVIDE(COUNTROWS(FILTER(deliveries, deliveries[runs_total] = 0)), COUNTROWS(deliveries), 0) * 100", "formatString": "#,##0.0"},
-    {"name": "Boundary %", "expression": "DIVIDE(COUNTROWS(FILTER(deliveries, deliveries[runs_batter] IN {4, 6} && deliveries[runs_non_boundary] = FALSE())), [Balls Faced], 0) * 100", "formatString": "#,##0.0"},
+    {"name": "Boundary %", "expression": "DIVIDE(SUM(deliveries[is_boundary]), [Balls Faced], 0) * 100", "formatString": "#,##0.0"},
 ]
 
-model_bim["model"]["tables"] = [
-    make_table("deliveries", [
+# Flag and match-state columns are the same in both deliveries variants
+deliveries_derived_columns = [
+    # Additive flags written by the ETL — the measures SUM these instead of iterating FILTER
+    col("is_legal_ball", "int64"), col("is_ball_faced", "int64"), col("is_batter_dismissal", "int64"),
+    col("is_bowler_wicket", "int64"), col("bowler_runs", "int64"), col("is_boundary", "int64"),
+    # Match state at each ball (with_match_state)
+    col("legal_ball_index", "int64"), col("balls_remaining", "int64"),
+    col("running_runs", "int64"), col("running_wickets", "int64"),
+]
+
+if SLIM:
+    # Integer keys into the dimensions; names and kinds come from players / teams / wicket_kinds / phases
+    deliveries_columns = [
+        col("match_key", "int64"), col("innings_number", "int64"), col("over_number", "int64"), col("ball_number", "int64"),
+        col("batter_key", "int64"), col("bowler_key", "int64"), col("non_striker_key", "int64"),
+        col("runs_batter", "int64"), col("runs_extras", "int64"), col("runs_total", "int64"),
+        col("runs_non_boundary", "boolean"),
+        col("extras_wides", "int64"), col("extras_noballs", "int64"), col("extras_byes", "int64"), col("extras_legbyes", "int64"),
+        col("is_wicket", "boolean"), col("wicket_kind_code", "int64"), col("wicket_player_out_key", "int64"), col("wicket_fielder1"),
+        col("batting_team_key", "int64"), col("bowling_team_key", "int64"),
+        col("phase_code", "int64"),
+    ] + deliveries_derived_columns
+else:
+    deliveries_columns = [
         col("match_id"), col("innings_number", "int64"), col("over_number", "int64"), col("ball_number", "int64"),
         col("batter"), col("batter_id"), col("bowler"), col("bowler_id"), col("non_striker"),
         col("runs_batter", "int64"), col("runs_extras", "int64"), col("runs_total", "int64"),
@@ -116,8 +128,14 @@ model_bim["model"]["tables"] = [
         col("extras_wides", "int64"), col("extras_noballs", "int64"), col("extras_byes", "int64"), col("extras_legbyes", "int64"),
         col("is_wicket", "boolean"), col("wicket_kind"), col("wicket_player_out"), col("wicket_fielder1"),
         col("batting_team"), col("bowling_team"),
-    ], deliveries_measures),
-    make_table("matches", [
+        col("phase"),
+    ] + deliveries_derived_columns
+
+slim_key = lambda name: [col(name, "int64")] if SLIM else []
+
+model_bim["model"]["tables"] = [
+    make_table("deliveries", deliveries_columns, deliveries_measures),
+    make_table("matches", slim_key("match_key") + [
         col("match_id"), col("match_type"), col("gender"), col("team_type"),
         col("venue"), col("city"), col("date_start"), col("team1"), col("team2"),
         col("toss_winner"), col("toss_decision"), col("outcome_winner"), col("outcome_result"),
@@ -127,7 +145,7 @@ model_bim["model"]["tables"] = [
         col("match_id"), col("innings_number", "int64"), col("batting_team"), col("bowling_team"),
         col("target_runs", "int64"), col("declared", "boolean"), col("forfeited", "boolean"), col("is_super_over", "boolean"),
     ]),
-    make_table("players", [
+    make_table("players", slim_key("player_key") + [
         col("player_id"), col("player_name"), col("batting_style"), col("bowling_style"), col("playing_role"), col("country"),
     ]),
     make_table("player_enrichment", [
@@ -135,14 +153,32 @@ model_bim["model"]["tables"] = [
         col("country"), col("dob"), col("batting_style"), col("bowling_style"), col("playing_role"),
     ]),
 ]
+if SLIM:
+    model_bim["model"]["tables"] += [
+        make_table("teams", [col("team_key", "int64"), col("team_name")]),
+        make_table("wicket_kinds", [col("wicket_kind_code", "int64"), col("wicket_kind")]),
+        make_table("phases", [col("phase_code", "int64"), col("phase")]),
+    ]
 
 # Relationships
-model_bim["model"]["relationships"] = [
-    {"name": "deliveries_to_matches", "fromTable": "deliveries", "fromColumn": "match_id", "toTable": "matches", "toColumn": "match_id"},
-    {"name": "deliveries_batter_to_players", "fromTable": "deliveries", "fromColumn": "batter_id", "toTable": "players", "toColumn": "player_id"},
-    {"name": "deliveries_bowler_to_players", "fromTable": "deliveries", "fromColumn": "bowler_id", "toTable": "players", "toColumn": "player_id", "isActive": False},
-    {"name": "players_to_enrichment", "fromTable": "players", "fromColumn": "player_id", "toTable": "player_enrichment", "toColumn": "cricsheet_id"},
-]
+if SLIM:
+    model_bim["model"]["relationships"] = [
+        {"name": "deliveries_to_matches", "fromTable": "deliveries", "fromColumn": "match_key", "toTable": "matches", "toColumn": "match_key"},
+        {"name": "deliveries_batter_to_players", "fromTable": "deliveries", "fromColumn": "batter_key", "toTable": "players", "toColumn": "player_key"},
+        {"name": "deliveries_bowler_to_players", "fromTable": "deliveries", "fromColumn": "bowler_key", "toTable": "players", "toColumn": "player_key", "isActive": False},
+        {"name": "deliveries_batting_team_to_teams", "fromTable": "deliveries", "fromColumn": "batting_team_key", "toTable": "teams", "toColumn": "team_key"},
+        {"name": "deliveries_bowling_team_to_teams", "fromTable": "deliveries", "fromColumn": "bowling_team_key", "toTable": "teams", "toColumn": "team_key", "isActive": False},
+        {"name": "deliveries_to_wicket_kinds", "fromTable": "deliveries", "fromColumn": "wicket_kind_code", "toTable": "wicket_kinds", "toColumn": "wicket_kind_code"},
+        {"name": "deliveries_to_phases", "fromTable": "deliveries", "fromColumn": "phase_code", "toTable": "phases", "toColumn": "phase_code"},
+        {"name": "players_to_enrichment", "fromTable": "players", "fromColumn": "player_id", "toTable": "player_enrichment", "toColumn": "cricsheet_id"},
+    ]
+else:
+    model_bim["model"]["relationships"] = [
+        {"name": "deliveries_to_matches", "fromTable": "deliveries", "fromColumn": "match_id", "toTable": "matches", "toColumn": "match_id"},
+        {"name": "deliveries_batter_to_players", "fromTable": "deliveries", "fromColumn": "batter_id", "toTable": "players", "toColumn": "player_id"},
+        {"name": "deliveries_bowler_to_players", "fromTable": "deliveries", "fromColumn": "bowler_id", "toTable": "players", "toColumn": "player_id", "isActive": False},
+        {"name": "players_to_enrichment", "fromTable": "players", "fromColumn": "player_id", "toTable": "player_enrichment", "toColumn": "cricsheet_id"},
+    ]
 
 # Encode as base64
 bim_json = json.dumps(model_bim)
@@ -155,7 +191,7 @@ pbism_b64 = base64.b64encode(json.dumps(pbism).encode()).decode()
 # Create the semantic model with definition
 payload = {
     "displayName": "CricketAnalytics",
-    "description": "Cricket analytics - 14 DAX measures, 4 relationships, DirectLake on CricketLakehouse",
+    "description": f"Cricket analytics - 14 DAX measures, {len(model_bim['model']['relationships'])} relationships, DirectLake on CricketLakehouse",
     "definition": {
         "parts": [
             {
@@ -172,30 +208,21 @@ payload = {
     }
 }
 
-token = get_token()
-url = f"https://api.fabric.microsoft.com/v1/workspaces/{WS}/semanticModels"
-data = json.dumps(payload).encode()
-req = urllib.request.Request(url, data=data, method='POST')
-req.add_header('Authorization', f'Bearer {token}')
-req.add_header('Content-Type', 'application/json')
+client = FabricClient()
 
 print(f"Creating CricketAnalytics semantic model...")
-print(f"Payload size: {len(data)} bytes")
+print(f"Payload size: {len(json.dumps(payload))} bytes")
 
 try:
-    resp = urllib.request.urlopen(req, timeout=60)
+    resp = client.request('POST', f"/workspaces/{WS}/semanticModels", payload)
     print(f"OK: {resp.status}")
-    loc = resp.getheader('Location')
-    if loc:
-        print(f"Operation URL: {loc}")
-    body = resp.read().decode()
-    if body:
-        result = json.loads(body)
-        print(f"ID: {result.get('id')}")
-        print(f"Name: {result.get('displayName')}")
-    else:
-        print("Accepted (async) - check workspace for new semantic model")
-except urllib.error.HTTPError as e:
-    print(f"HTTP {e.code}: {e.read().decode()[:500]}")
-except Exception as e:
+    if resp.status == 202:
+        # Creation runs as a long-running operation; follow it to the new item
+        print(f"Operation URL: {resp.headers.get('Location')}")
+        resp = client.wait(resp)
+    result = resp.json()
+    print(f"ID: {result.get('id')}")
+    print(f"Name: {result.get('displayName')}")
+except (FabricError, OSError) as e:  # error status or failed operation; connection failure or timeout
     print(f"Error: {e}")
+    sys.exit(1)
@@ -0,0 +1,228 @@
+"""Shared Fabric REST client for the scripts under scripts/.
+
+- load_dotenv(): fills os.environ from the repo's .env without overriding what is already set.
+- get_token(): bearer token from `az account get-access-token`, cached until five minutes before it
+  expires (FABRIC_ACCESS_TOKEN overrides it).
+- FabricClient: JSON requests over pooled keep-alive connections, one per host and thread, retried
+  with backoff on 429/5xx (honouring Retry-After), and wait() to follow a 202 long-running operation
+  through its Location / Operation-Location header to the result.
+
+FABRIC_API_URL points the client at another endpoint, such as a local stand-in server.
+"""
+import http.client, json, os, ssl, subprocess, threading, time
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from urllib.parse import urlsplit
+
+REPO = Path(__file__).resolve().parent.parent
+FABRIC_API = "https://api.fabric.microsoft.com/v1"
+FABRIC_RESOURCE = "https://api.fabric.microsoft.com"
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# A POST rejected with one of these never ran, so it is safe to send again
+POST_RETRY_STATUSES = (429, 503)
+# Raised when a kept-alive connection was closed by the server while idle
+STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError)
+
+
+# Load .env if present
+def load_dotenv():
+    env_path = REPO / '.env'
+    if env_path.exists():
+        for line in env_path.read_text().splitlines():
+            line = line.strip()
+            if line and not line.startswith('#') and '=' in line:
+                k, v = line.split('=', 1)
+                os.environ.setdefault(k.strip(), v.strip())
+
+
+class FabricError(OSError):
+    """A request that failed with an HTTP error status, or a long-running operation that failed."""
+
+    def __init__(self, status, body, url, reason=None):
+        self.status, self.body, self.url = status, body, url
+        super().__init__(f"{reason or f'HTTP {status}'} from {url}: {body[:500]}")
+
+
+class Response:
+    def __init__(self, status, headers, body):
+        self.status, self.headers, self.body = status, headers, body
+
+    def json(self):
+        return json.loads(self.body) if self.body else {}
+
+
+_token = {"value": None, "expires": 0.0}
+_token_lock = threading.Lock()
+
+
+def get_token(refresh=False):
+    """Bearer token for the Fabric API, fetched with the Azure CLI and reused until near expiry."""
+    if os.environ.get('FABRIC_ACCESS_TOKEN'):
+        return os.environ['FABRIC_ACCESS_TOKEN']
+    with _token_lock:
+        if not refresh and _token["value"] and time.time() < _token["expires"] - 300:
+            return _token["value"]
+        r = subprocess.run(['az', 'account', 'get-access-token', '--resource', FABRIC_RESOURCE, '-o', 'json'],
+                           capture_output=True, text=True)
+        if r.returncode != 0:
+            raise RuntimeError(f"az account get-access-token failed: {r.stderr.strip()}")
+        token = json.loads(r.stdout)
+        _token["value"] = token["accessToken"]
+        # expires_on (epoch seconds) on current CLIs, expiresOn (local time) on older ones
+        if token.get("expires_on"):
+            _token["expires"] = float(token["expires_on"])
+        elif token.get("expiresOn"):
+            _token["expires"] = datetime.fromisoformat(token["expiresOn"]).timestamp()
+        else:
+            _token["expires"] = time.time() + 3600
+        return _token["value"]
+
+
+def retry_after(response, default):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date), else default."""
+    value = response.headers.get('Retry-After') if response is not None else None
+    if not value:
+        return default
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        try:
+            return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+        except (TypeError, ValueError):
+            return default
+
+
+class FabricClient:
+    """JSON client for the Fabric REST API (or any endpoint under base_url).
+
+    Paths starting with "/" are appended to base_url; absolute URLs, such as operation Location
+    headers, are used as they are. Connections are kept alive and reused per host and thread.
+    """
+
+    def __init__(self, base_url=None, retries=5, timeout=60):
+        self.base_url = (base_url or os.environ.get('FABRIC_API_URL') or FABRIC_API).rstrip('/')
+        self.retries = retries
+        self.timeout = timeout
+        self.local = threading.local()
+        # The scripts have always skipped certificate verification (corporate proxies re-sign TLS)
+        self.ssl_context = ssl._create_unverified_context()
+
+    def url(self, path):
+        return path if '://' in path else f"{self.base_url}{path}"
+
+    def connection(self, scheme, netloc):
+        """The kept-alive connection for (scheme, netloc) on this thread, and whether it is reused."""
+        pool = self.local.__dict__.setdefault('pool', {})
+        conn = pool.get((scheme, netloc))
+        if conn is not None:
+            return conn, True
+        if scheme == 'https':
+            conn = http.client.HTTPSConnection(netloc, timeout=self.timeout, context=self.ssl_context)
+        else:
+            conn = http.client.HTTPConnection(netloc, timeout=self.timeout)
+        pool[(scheme, netloc)] = conn
+        return conn, False
+
+    def discard(self, scheme, netloc):
+        conn = self.local.__dict__.get('pool', {}).pop((scheme, netloc), None)
+        if conn is not None:
+            conn.close()
+
+    def send(self, method, url, data, headers):
+        """One round trip over the pooled connection; reconnects once if it went stale while idle."""
+        parts = urlsplit(url)
+        target = parts.path + (f"?{parts.query}" if parts.query else '')
+        while True:
+            conn, reused = self.connection(parts.scheme, parts.netloc)
+            try:
+                conn.request(method, target or '/', body=data, headers=headers)
+                resp = conn.getresponse()
+                body = resp.read().decode()
+            except STALE_CONNECTION_ERRORS:
+                self.discard(parts.scheme, parts.netloc)
+                if reused:
+                    continue
+                raise
+            except OSError:
+                self.discard(parts.scheme, parts.netloc)
+                raise
+            if resp.will_close:
+                self.discard(parts.scheme, parts.netloc)
+            return Response(resp.status, resp.headers, body)
+
+    def request(self, method, path, body=None, idempotent=None):
+        """Send a JSON request and return the Response, raising FabricError on an error status.
+
+        Idempotent requests (GETs by default) are retried on 429/5xx and connection errors; other
+        requests only on 429 and 503, which reject a request before it runs, so it never runs twice.
+        A 401 fetches a fresh token and retries once.
+        """
+        url = self.url(path)
+        data = json.dumps(body).encode() if body is not None else None
+        if idempotent is None:
+            idempotent = method in ('GET', 'HEAD', 'PUT', 'DELETE')
+        retry_statuses = RETRY_STATUSES if idempotent else POST_RETRY_STATUSES
+        refresh, refreshed = False, False
+        attempt = 0
+        while True:
+            headers = {'Authorization': f'Bearer {get_token(refresh)}'}
+            refresh = False
+            if data is not None:
+                headers['Content-Type'] = 'application/json'
+            try:
+                response = self.send(method, url, data, headers)
+            except OSError:
+                if not idempotent or attempt == self.retries:
+                    raise
+                response = None
+            else:
+                if response.status < 400:
+                    return response
+                if response.status == 401 and not refreshed and not os.environ.get('FABRIC_ACCESS_TOKEN'):
+                    refresh = refreshed = True
+                    continue
+                if response.status not in retry_statuses or attempt == self.retries:
+                    raise FabricError(response.status, response.body, url)
+            time.sleep(retry_after(response, min(2 ** attempt, 30)))
+            attempt += 1
+
+    def get(self, path):
+        return self.request('GET', path).json()
+
+    def post(self, path, body=None, idempotent=None):
+        return self.request('POST', path, {} if body is None else body, idempotent)
+
+    def wait(self, response, timeout=600, poll=5):
+        """Follow a 202 long-running operation to its end and return the final Response.
+
+        Polls the Location (or Operation-Location) header, waiting Retry-After seconds between
+        polls, until the operation reports Succeeded, then fetches its result if the last poll
+        points at one. Anything other than a 202 with a polling URL is returned unchanged. Raises
+        FabricError if the operation fails and TimeoutError if it outlasts timeout seconds.
+        """
+        location = response.headers.get('Location') or response.headers.get('Operation-Location')
+        if response.status != 202 or not location:
+            return response
+        deadline = time.monotonic() + timeout
+        while True:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"operation {location} still running after {timeout}s")
+            time.sleep(retry_after(response, poll))
+            response = self.request('GET', location)
+            try:
+                status = response.json().get('status')
+            except (ValueError, AttributeError):
+                status = None
+            if response.status == 202 or status in ('NotStarted', 'Running'):
+                location = response.headers.get('Location') or location
+                continue
+            if status == 'Failed':
+                raise FabricError(response.status, response.body, location, 'Operation failed')
+            if status == 'Succeeded' and response.headers.get('Location'):
+                return self.request('GET', response.headers['Location'])
+            return response
+
+    def post_and_wait(self, path, body=None, timeout=600):
+        """POST, then follow the operation if it was accepted as a long-running one."""
+        return self.wait(self.request('POST', path, {} if body is None else body), timeout)
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""Local stand-in for the Fabric REST API, to exercise the deploy scripts without Fabric.
+
+Every POST is accepted as a long-running operation: 202 with Location (/v1/operations/<id>),
+x-ms-operation-id and Retry-After: 1. Polling the operation answers Running for --seconds seconds,
+then Succeeded (or Failed, if the request path contains a --fail pattern). An operation that
+created an item (POST to a collection such as .../semanticModels) also points at its result,
+/v1/operations/<id>/result, with the new item's id and displayName. --throttle N answers every
+Nth request with 429 and Retry-After: 1, --error-every N every Nth with 500, and --token answers
+401 to any other bearer token. Connections are kept alive (HTTP/1.1).
+
+Usage:
+  python3 scripts/mock_fabric.py [--port 8999] [--seconds 2] [--fail updateDefinition] [--throttle 5]
+                                 [--error-every 7] [--token mock]
+  FABRIC_API_URL=http://127.0.0.1:8999/v1 FABRIC_ACCESS_TOKEN=mock python3 scripts/deploy_semantic_model.py
+"""
+import argparse, json, re, threading, time, uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class Operations:
+    """Accepted requests and when each one finishes."""
+
+    def __init__(self, seconds, fail_patterns):
+        self.seconds = seconds
+        self.fail_patterns = fail_patterns
+        self.operations = {}
+        self.lock = threading.Lock()
+
+    def start(self, path, body):
+        op_id = str(uuid.uuid4())
+        result = None
+        if not path.endswith("/updateDefinition"):
+            result = {"id": str(uuid.uuid4()), "displayName": body.get("displayName"), "type": path.rsplit("/", 1)[-1]}
+        failed = next((p for p in self.fail_patterns if p in path), None)
+        with self.lock:
+            self.operations[op_id] = {"path": path, "done_at": time.monotonic() + self.seconds,
+                                      "failed": failed, "result": result}
+        return op_id
+
+    def state(self, op_id):
+        with self.lock:
+            operation = self.operations.get(op_id)
+        if operation is None:
+            return None, None
+        if time.monotonic() < operation["done_at"]:
+            return {"status": "Running", "percentComplete": None}, None
+        if operation["failed"]:
+            return {"status": "Failed", "error": {"errorCode": "MockFailure",
+                                                  "message": f"path contains {operation['failed']!r}"}}, None
+        return {"status": "Succeeded", "percentComplete": 100}, operation["result"]
+
+
+def make_handler(operations, throttle=0, error_every=0, token=None, retry_after="1"):
+    requests = {"count": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # (method, path, status, client port) of every request answered, for callers to inspect
+        log = []
+
+        def log_message(self, *args):
+            pass
+
+        def reply(self, status, body=None, headers=()):
+            payload = json.dumps(body).encode() if body is not None else b""
+            self.log.append((self.command, self.path, status, self.client_address[1]))
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for key, value in headers:
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def throttled(self):
+            """Answer the request with an injected 401 / 429 / 500 instead, if one is due."""
+            requests["count"] += 1
+            if token and self.headers.get("Authorization") != f"Bearer {token}":
+                self.reply(401, {"errorCode": "TokenExpired"})
+                return True
+            if throttle and requests["count"] % throttle == 0:
+                self.reply(429, {"errorCode": "RequestBlocked"}, [("Retry-After", retry_after)])
+                return True
+            if error_every and requests["count"] % error_every == 0:
+                self.reply(500, {"errorCode": "InternalError"})
+                return True
+            return False
+
+        def base(self):
+            return f"http://{self.headers.get('Host')}/v1"
+
+        def do_GET(self):
+            if self.throttled():
+                return
+            match = re.search(r"/operations/([\w-]+)(/result)?$", self.path)
+            state, result = operations.state(match.group(1)) if match else (None, None)
+            if state is None:
+                return self.reply(404, {"errorCode": "EntityNotFound"})
+            if match.group(2):
+                return self.reply(200, result) if result else self.reply(400, {"errorCode": "OperationHasNoResult"})
+            headers = [("Retry-After", "1")] if state["status"] == "Running" else []
+            if state["status"] == "Succeeded" and result:
+                headers.append(("Location", f"{self.base()}/operations/{match.group(1)}/result"))
+            self.reply(200, state, headers)
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+            if self.throttled():
+                return
+            op_id = operations.start(self.path, body)
+            self.reply(202, None, [("Location", f"{self.base()}/operations/{op_id}"),
+                                   ("x-ms-operation-id", op_id), ("Retry-After", "1")])
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8999)
+    parser.add_argument("--seconds", type=float, default=2.0, help="how long each operation runs")
+    parser.add_argument("--fail", action="append", default=[], help="fail operations whose path contains this (repeatable)")
+    parser.add_argument("--throttle", type=int, default=0, help="answer every Nth request with 429")
+    parser.add_argument("--error-every", type=int, default=0, help="answer every Nth request with 500")
+    parser.add_argument("--token", help="answer 401 unless the request carries this bearer token")
+    args = parser.parse_args()
+
+    operations = Operations(args.seconds, args.fail)
+    handler = make_handler(operations, args.throttle, args.error_every, args.token)
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), handler)
+    print(f"Mock Fabric API at http://127.0.0.1:{args.port}/v1")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
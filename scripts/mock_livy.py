@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""Local stand-in for a Fabric Livy session, to exercise run_livy.py without Fabric.
+
+Serves the statement endpoints of one session under any path ending in /statements:
+POST .../statements, GET .../statements/<id>, POST .../statements/<id>/cancel. Statements run one
+at a time in submission order, as in a real session. Each one passes through waiting → running
+(with rising progress) → available over --seconds seconds. Nothing is executed: a statement fails
+if its code contains a --fail pattern, and otherwise its output is its first line. --throttle N
+answers every Nth request with 429 and Retry-After: 1.
+
+Usage:
+  python3 scripts/mock_livy.py [--port 8998] [--seconds 2] [--fail 'run_metrics.start("validate")'] [--throttle 7]
+  FABRIC_LIVY_URL=http://127.0.0.1:8998/sessions/0 FABRIC_ACCESS_TOKEN=mock python3 scripts/run_livy.py all
+"""
+import argparse, json, re, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class Session:
+    """Statements of one session, run in order by a worker thread."""
+
+    def __init__(self, seconds, fail_patterns):
+        self.seconds = seconds
+        self.fail_patterns = fail_patterns
+        self.statements = []
+        self.lock = threading.Lock()
+        self.ready = threading.Condition(self.lock)
+        threading.Thread(target=self.run_loop, daemon=True).start()
+
+    def submit(self, code):
+        with self.ready:
+            statement = {"id": len(self.statements), "code": code, "state": "waiting", "progress": 0.0, "output": None}
+            self.statements.append(statement)
+            self.ready.notify()
+            return self.view(statement)
+
+    def cancel(self, stmt_id):
+        with self.lock:
+            statement = self.statements[stmt_id]
+            if statement["state"] in ("waiting", "running"):
+                statement["state"] = "cancelled"
+
+    def get(self, stmt_id):
+        with self.lock:
+            return self.view(self.statements[stmt_id])
+
+    @staticmethod
+    def view(statement):
+        return {key: statement[key] for key in ("id", "code", "state", "progress", "output")}
+
+    def next_waiting(self):
+        return next((s for s in self.statements if s["state"] == "waiting"), None)
+
+    def run_loop(self):
+        while True:
+            with self.ready:
+                while self.next_waiting() is None:
+                    self.ready.wait()
+                statement = self.next_waiting()
+                statement["state"] = "running"
+            steps = 10
+            for step in range(1, steps + 1):
+                time.sleep(self.seconds / steps)
+                with self.lock:
+                    if statement["state"] == "cancelled":
+                        break
+                    statement["progress"] = step / steps
+            with self.lock:
+                if statement["state"] == "cancelled":
+                    continue
+                failed = next((p for p in self.fail_patterns if p in statement["code"]), None)
+                if failed:
+                    statement["output"] = {"status": "error", "execution_count": statement["id"], "ename": "MockError",
+                                           "evalue": f"code contains {failed!r}", "traceback": ["Traceback (mock)"]}
+                else:
+                    first_line = statement["code"].splitlines()[0] if statement["code"] else ""
+                    statement["output"] = {"status": "ok", "execution_count": statement["id"],
+                                           "data": {"text/plain": f"ran: {first_line}"}}
+                statement["state"] = "available"
+
+
+def make_handler(session, throttle):
+    requests = {"count": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def reply(self, status, body=None, headers=()):
+            payload = json.dumps(body).encode() if body is not None else b""
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for key, value in headers:
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def throttled(self):
+            requests["count"] += 1
+            if throttle and requests["count"] % throttle == 0:
+                self.reply(429, {"error": "throttled"}, [("Retry-After", "1")])
+                return True
+            return False
+
+        def do_GET(self):
+            if self.throttled():
+                return
+            match = re.search(r"/statements/(\d+)$", self.path)
+            if not match or int(match.group(1)) >= len(session.statements):
+                return self.reply(404, {"error": "not found"})
+            self.reply(200, session.get(int(match.group(1))))
+
+        def do_POST(self):
+            if self.throttled():
+                return
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+            if self.path.endswith("/statements"):
+                return self.reply(201, session.submit(body.get("code", "")))
+            match = re.search(r"/statements/(\d+)/cancel$", self.path)
+            if match and int(match.group(1)) < len(session.statements):
+                session.cancel(int(match.group(1)))
+                return self.reply(200, {"msg": "canceled"})
+            self.reply(404, {"error": "not found"})
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8998)
+    parser.add_argument("--seconds", type=float, default=2.0, help="how long each statement runs")
+    parser.add_argument("--fail", action="append", default=[], help="fail statements whose code contains this (repeatable)")
+    parser.add_argument("--throttle", type=int, default=0, help="answer every Nth request with 429")
+    args = parser.parse_args()
+
+    session = Session(args.seconds, args.fail)
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(session, args.throttle))
+    print(f"Mock Livy session at http://127.0.0.1:{args.port}/sessions/0")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,140 +1,203 @@
 #!/usr/bin/env python3
-"""Submit a code cell to the Fabric Livy session and poll for result.
+"""Submit CricketETL code cells to the Fabric Livy session and follow them to completion.
+
+Cells run one at a time, in notebook order: each is submitted once the one before it has finished
+successfully. The cells share the session's Python state, and a session runs one statement at a
+time, so there is nothing to gain from queueing ahead — and a cell queued behind one that fails
+would still run. Work that can run side by side does so inside a cell (the deliveries cell writes
+players, matches and innings concurrently). Statements are polled with adaptive backoff
+(--poll-min up to --poll-max seconds, reset whenever the statement changes state or progress).
+Progress is printed while a cell runs, and its output as soon as it finishes. If a cell fails, the
+run stops there, so a run that failed (say, a hard validation check) never goes on to change
+tables. With "all", the metrics cell then records the failed run.
+
+Usage:
+  python3 scripts/run_livy.py <cell> [<cell> ...] [--timeout 600]
+  python3 scripts/run_livy.py all      # every cell, in notebook order, then metrics
+  python3 scripts/run_livy.py list     # cell names with a preview of each
 
 Required env vars (or .env file):
   FABRIC_WORKSPACE_ID  - Fabric workspace GUID
   FABRIC_LAKEHOUSE_ID  - Lakehouse GUID
   FABRIC_LIVY_SESSION  - Livy session GUID
+or, for another Livy endpoint such as scripts/mock_livy.py:
+  FABRIC_LIVY_URL      - session URL, e.g. http://127.0.0.1:8998/sessions/0
+Optional:
+  FABRIC_ACCESS_TOKEN  - bearer token to use instead of `az account get-access-token`
 """
-import json, os, subprocess, sys, time, ssl, urllib.request
-from pathlib import Path
-
-ssl._create_default_https_context = ssl._create_unverified_context
-
-# Load .env if present
-def load_dotenv():
-    env_path = Path(__file__).resolve().parent.parent / '.env'
-    if env_path.exists():
-        for line in env_path.read_text().splitlines():
-            line = line.strip()
-            if line and not line.startswith('#') and '=' in line:
-                k, v = line.split('=', 1)
-                os.environ.setdefault(k.strip(), v.strip())
-
-load_dotenv()
-
-WS = os.environ.get('FABRIC_WORKSPACE_ID', '')
-LH = os.environ.get('FABRIC_LAKEHOUSE_ID', '')
-SESSION = os.environ.get('FABRIC_LIVY_SESSION', '')
-
-if not all([WS, LH, SESSION]):
-    print('Error: Set FABRIC_WORKSPACE_ID, FABRIC_LAKEHOUSE_ID, FABRIC_LIVY_SESSION in .env or environment')
-    sys.exit(1)
-
-BASE = f"https://api.fabric.microsoft.com/v1/workspaces/{WS}/lakehouses/{LH}/livyApi/versions/2023-12-01/sessions/{SESSION}"
-
-def get_token():
-    r = subprocess.run(['az', 'account', 'get-access-token', '--resource', 'https://api.fabric.microsoft.com', '--query', 'accessToken', '-o', 'tsv'], capture_output=True, text=True)
-    return r.stdout.strip()
-
-def submit(code, kind="pyspark"):
-    token = get_token()
-    data = json.dumps({"code": code, "kind": kind}).encode()
-    req = urllib.request.Request(f"{BASE}/statements", data=data, method='POST')
-    req.add_header('Authorization', f'Bearer {token}')
-    req.add_header('Content-Type', 'application/json')
-    resp = urllib.request.urlopen(req, timeout=30)
-    return json.loads(resp.read().decode())
-
-def poll(stmt_id, max_wait=600):
-    token = get_token()
-    for i in range(max_wait // 5):
-        time.sleep(5)
-        req = urllib.request.Request(f"{BASE}/statements/{stmt_id}")
-        req.add_header('Authorization', f'Bearer {token}')
-        resp = urllib.request.urlopen(req, timeout=30)
-        d = json.loads(resp.read().decode())
-        state = d.get("state", "?")
-        if state == "available":
-            output = d.get("output", {})
-            status = output.get("status")
-            data = output.get("data", {})
-            traceback = output.get("traceback", [])
-            print(f"[Statement {stmt_id}] {status}")
-            for v in data.values():
-                print(v[:2000])
-            for line in traceback[:10]:
-                print(line)
-            return status == "ok"
-        if i % 6 == 0:
-            print(f"  ...waiting ({i*5}s, state={state})")
-    print(f"TIMEOUT after {max_wait}s")
-    return False
+import argparse, json, os, sys, time
 
-if __name__ == "__main__":
-    cell_name = sys.argv[1] if len(sys.argv) > 1 else "parse"
-    
-    # Read the notebook
-    with open("notebooks/CricketETL.py", "r") as f:
-        content = f.read()
-    
-    # Parse cells
-    raw_cells = content.split("# CELL ********************")
+from fabric_client import FABRIC_API, REPO, FabricClient, load_dotenv
+
+NOTEBOOK = REPO / 'notebooks' / 'CricketETL.py'
+
+# Cell name -> code cell index in the notebook
+CELL_MAP = {
+    "params": 0,      # CRICSHEET_URL
+    "imports": 1,      # import json...
+    "schemas": 2,      # StructType schemas for the 4 tables
+    "downloader": 3,   # Conditional / ranged download helpers
+    "download": 4,     # Download ZIP
+    "parser": 5,       # parse_match + shard helpers
+    "changes": 6,      # Incremental change detection against etl_manifest
+    "parse": 7,        # Parse loop (driver) or mapPartitions (distributed)
+    "players": 8,      # Build players DataFrame
+    "matches": 9,      # Build matches DataFrame
+    "innings": 10,     # Build innings DataFrame
+    "deliveries": 11,  # Write players, matches, innings (+ distributed deliveries) concurrently
+    "summaries": 12,   # Write batting_innings / bowling_innings
+    "matchups": 13,    # Write matchups (BUILD_MATCHUPS)
+    "wide": 14,        # Write deliveries_wide (BUILD_DELIVERIES_WIDE)
+    "manifest": 15,    # Write etl_manifest
+    "optimize": 16,    # OPTIMIZE
+    "validate": 17,    # Data-quality checks → etl_validation
+    "enrich": 18,      # Merge player_enrichment into players
+    "metrics": 19,     # Append per-stage run metrics to etl_runs
+}
+
+TERMINAL_STATES = ("available", "error", "cancelled")
+
+
+def read_code_cells():
+    raw_cells = NOTEBOOK.read_text().split("# CELL ********************")
     code_cells = []
     for raw in raw_cells:
         raw = raw.strip()
         if not raw or raw.startswith("# Fabric notebook") or raw.startswith("# METADATA") or raw.startswith("# MARKDOWN"):
             continue
         code_cells.append(raw)
-    
-    # Cell mapping
-    cell_map = {
-        "params": 0,      # CRICSHEET_URL
-        "imports": 1,      # import json...
-        "download": 2,     # Download ZIP
-        "parse": 3,        # Big parse loop
-        "players": 4,      # Write players
-        "matches": 5,      # Write matches
-        "innings": 6,      # Write innings
-        "deliveries": 7,   # Write deliveries
-        "optimize": 8,     # OPTIMIZE
-        "validate": 9,     # Validation queries
-        "enrich": 10,      # Merge player_enrichment into players
-        "cleanup": 11,     # Clean up
-    }
-    
-    if cell_name == "list":
-        for name, idx in cell_map.items():
+    return code_cells
+
+
+def session_url():
+    """The Livy session's URL from the environment (.env included); exits if it isn't configured."""
+    load_dotenv()
+    url = os.environ.get('FABRIC_LIVY_URL', '').rstrip('/')
+    if url:
+        return url
+    ws = os.environ.get('FABRIC_WORKSPACE_ID', '')
+    lh = os.environ.get('FABRIC_LAKEHOUSE_ID', '')
+    session = os.environ.get('FABRIC_LIVY_SESSION', '')
+    if not all([ws, lh, session]):
+        print('Error: Set FABRIC_WORKSPACE_ID, FABRIC_LAKEHOUSE_ID, FABRIC_LIVY_SESSION (or FABRIC_LIVY_URL) in .env or environment')
+        sys.exit(1)
+    return f"{FABRIC_API}/workspaces/{ws}/lakehouses/{lh}/livyApi/versions/2023-12-01/sessions/{session}"
+
+
+# Statement requests go through a FabricClient on the session URL: GETs are retried on 429/5xx and
+# connection errors, POSTs only on 429/503, so a statement is never submitted twice
+def submit(client, code, kind="pyspark"):
+    return client.post("/statements", {"code": code, "kind": kind}).json()
+
+
+def get_statement(client, stmt_id):
+    return client.get(f"/statements/{stmt_id}")
+
+
+def cancel(client, stmt_id):
+    try:
+        client.post(f"/statements/{stmt_id}/cancel")
+    except OSError as e:
+        print(f"  (cancel of statement {stmt_id} failed: {e})")
+
+
+def print_output(name, statement):
+    output = statement.get("output") or {}
+    status = output.get("status") or statement.get("state")
+    print(f"\n[{name}] statement {statement.get('id')} {status}")
+    for v in (output.get("data") or {}).values():
+        print(v[:2000] if isinstance(v, str) else json.dumps(v)[:2000])
+    if output.get("ename"):
+        print(f"{output['ename']}: {output.get('evalue', '')}")
+    for line in (output.get("traceback") or [])[:10]:
+        print(line.rstrip())
+    return status == "ok"
+
+
+def run_cell(client, name, code, timeout=600, poll_min=1.0, poll_max=15.0):
+    """Submit one cell and follow it until it finishes; returns True if it succeeded."""
+    statement = submit(client, code)
+    stmt_id = statement.get("id")
+    print(f"[{name}] submitted as statement {stmt_id} ({len(code)} chars)")
+    state, progress, started = statement.get("state", "waiting"), 0.0, None
+    interval = poll_min
+    while True:
+        time.sleep(interval)
+        statement = get_statement(client, stmt_id)
+        previous = state, progress
+        state, progress = statement.get("state", "?"), float(statement.get("progress") or 0.0)
+        changed = (state, progress) != previous
+        if state == "running" and started is None:
+            started = time.monotonic()
+
+        if state == "cancelled":
+            print(f"[{name}] cancelled")
+            return False
+        if state in TERMINAL_STATES:
+            return print_output(name, statement)
+        if changed:
+            print(f"[{name}] {state} {progress:.0%}")
+        if started is not None and time.monotonic() - started > timeout:
+            print(f"[{name}] TIMEOUT after {timeout}s — cancelling")
+            cancel(client, stmt_id)
+            return False
+        # Back off while nothing moves; poll quickly again as soon as something does
+        interval = poll_min if changed else min(interval * 1.5, poll_max)
+
+
+def run_cells(client, names, code_cells, timeout=600, poll_min=1.0, poll_max=15.0):
+    """Run names one after another, stopping at the first that fails.
+
+    Returns the names of the cells that failed (empty if all succeeded).
+    """
+    for position, name in enumerate(names):
+        if not run_cell(client, name, code_cells[CELL_MAP[name]], timeout, poll_min, poll_max):
+            print(f"FAILED at cell: {name}")
+            if names[position + 1:]:
+                print(f"Not run: {', '.join(names[position + 1:])}")
+            return [name]
+    return []
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('cells', nargs='*', default=['parse'], help='cell names, "all" or "list"')
+    parser.add_argument('--timeout', type=int, default=600, help='seconds a statement may run before it is cancelled')
+    parser.add_argument('--poll-min', type=float, default=1.0)
+    parser.add_argument('--poll-max', type=float, default=15.0)
+    args = parser.parse_args()
+
+    code_cells = read_code_cells()
+    if args.cells == ["list"]:
+        for name, idx in CELL_MAP.items():
             if idx < len(code_cells):
                 preview = code_cells[idx][:80].replace('\n', ' ')
                 print(f"  {name} (cell {idx}): {preview}...")
         sys.exit(0)
-    
-    if cell_name == "all":
-        # Run all remaining cells
-        cells_to_run = list(cell_map.items())
-    elif cell_name in cell_map:
-        cells_to_run = [(cell_name, cell_map[cell_name])]
-    else:
-        print(f"Unknown cell: {cell_name}. Use: {', '.join(cell_map.keys())}")
+
+    run_all = args.cells == ["all"]
+    # "all" runs metrics last on its own, so a failed run is recorded too
+    names = [name for name in CELL_MAP if name != "metrics"] if run_all else args.cells
+    unknown = [name for name in names if name not in CELL_MAP]
+    if unknown:
+        print(f"Unknown cell: {', '.join(unknown)}. Use: {', '.join(CELL_MAP)}, all, list")
         sys.exit(1)
-    
-    for name, idx in cells_to_run:
-        if idx >= len(code_cells):
-            print(f"Skipping {name}: cell {idx} not found")
-            continue
-        code = code_cells[idx]
-        print(f"\n{'='*60}")
-        print(f"Running cell: {name} ({len(code)} chars)")
-        print(f"{'='*60}")
-        
-        result = submit(code)
-        stmt_id = result.get("id")
-        print(f"Submitted as statement {stmt_id}")
-        
-        ok = poll(stmt_id)
-        if not ok:
-            print(f"FAILED at cell: {name}")
-            sys.exit(1)
-    
+    missing = [name for name in names if CELL_MAP[name] >= len(code_cells)]
+    for name in missing:
+        print(f"Skipping {name}: cell {CELL_MAP[name]} not found")
+    names = sorted((name for name in names if name not in missing), key=CELL_MAP.get)
+
+    client = FabricClient(session_url(), timeout=30)
+    failed = run_cells(client, names, code_cells, args.timeout, args.poll_min, args.poll_max)
+    if run_all:
+        # Record the run in etl_runs, failed or not
+        failed += run_cells(client, ["metrics"], code_cells, args.timeout, args.poll_min, args.poll_max)
+    if failed:
+        print(f"\nFailed cells: {', '.join(failed)}")
+        sys.exit(1)
+
     print("\nAll cells completed successfully!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""Shared fixtures: the notebook's definitions on a local Spark session, and scripts/ on the path."""
+import sys
+from pathlib import Path
+
+import pytest
+
+REPO = Path(__file__).resolve().parent.parent
+NOTEBOOK = REPO / "notebooks" / "CricketETL.py"
+
+sys.path.insert(0, str(REPO / "scripts"))
+
+# Code cells that only define things (params, imports, schemas, download helpers, parser): the
+# helpers the tests exercise, without downloading or writing anything
+DEFINITION_CELLS = (0, 1, 2, 3, 5)
+
+
+def read_code_cells():
+    raw_cells = NOTEBOOK.read_text().split("# CELL ********************")
+    code_cells = []
+    for raw in raw_cells:
+        raw = raw.strip()
+        if not raw or raw.startswith("# Fabric notebook") or raw.startswith("# METADATA") or raw.startswith("# MARKDOWN"):
+            continue
+        code_cells.append(raw)
+    return code_cells
+
+
+@pytest.fixture(scope="session")
+def notebook():
+    """Namespace of the notebook's definition cells, run against a local Spark session."""
+    for module in ("pyspark", "pyarrow", "delta"):
+        pytest.importorskip(module)
+    from pyspark.sql import SparkSession
+
+    spark = (SparkSession.builder.master("local[1]")
+             .config("spark.sql.shuffle.partitions", "1")
+             .config("spark.ui.enabled", "false")
+             .getOrCreate())
+    namespace = {}
+    code_cells = read_code_cells()
+    for index in DEFINITION_CELLS:
+        exec(code_cells[index], namespace)
+    yield namespace
+    spark.stop()
@@ -0,0 +1,129 @@
+"""RunCheckpoint resuming an interrupted run, with the Delta commits and table history stubbed."""
+import contextlib, json
+from types import SimpleNamespace
+
+import pytest
+
+USER_METADATA = "spark.databricks.delta.commitInfo.userMetadata"
+
+
+class DeltaHistory:
+    """Stand-in for DeltaTable.forName(spark, "deliveries").history(): the commits the test made."""
+
+    def __init__(self):
+        self.commits = []
+        self.conf = {}
+
+    def commit(self, rows=None):
+        """A deliveries commit under the current session conf; rows=None is an empty CREATE."""
+        metrics = {"numOutputRows": str(rows)} if rows is not None else {}
+        self.commits.append({"userMetadata": self.conf.get(USER_METADATA), "operationMetrics": metrics})
+
+    def forName(self, spark, table):
+        return self
+
+    def history(self):
+        return self
+
+    def select(self, *columns):
+        return self
+
+    def collect(self):
+        return list(self.commits)
+
+
+@pytest.fixture
+def delta(notebook, monkeypatch):
+    history = DeltaHistory()
+    spark = SimpleNamespace(
+        catalog=SimpleNamespace(tableExists=lambda table: bool(history.commits)),
+        conf=SimpleNamespace(set=history.conf.__setitem__, unset=lambda key: history.conf.pop(key, None)),
+    )
+    monkeypatch.setitem(notebook, "spark", spark)
+    monkeypatch.setitem(notebook, "DeltaTable", history)
+    return history
+
+
+@pytest.fixture
+def checkpoint_dir(tmp_path):
+    return str(tmp_path / "checkpoint")
+
+
+def write_chunk(checkpoint, delta, chunk, deliveries, committed=True):
+    """What the parse cell does per deliveries chunk: record the sidecar, then commit it tagged."""
+    checkpoint.record_chunk(chunk, json_files=[f"{chunk}.json"], matches=[], innings=[], players=[], errors=[],
+                            deliveries=deliveries)
+    if committed:
+        with checkpoint.commit_metadata(chunk=chunk):
+            delta.commit(deliveries)
+
+
+def test_only_committed_chunks_are_restored(notebook, delta, checkpoint_dir):
+    first = notebook["RunCheckpoint"](checkpoint_dir, "key")
+    write_chunk(first, delta, 0, 100)
+    write_chunk(first, delta, 1, 250)
+    # The run dies after recording chunk 2's sidecar but before its commit
+    write_chunk(first, delta, 2, 80, committed=False)
+    # Commits that don't count: another run's chunk 2, and a CREATE that wrote no rows
+    for checkpoint_id, rows in (("another run", 80), (first.state["id"], None)):
+        delta.conf[USER_METADATA] = json.dumps({"checkpoint": checkpoint_id, "chunk": 2})
+        delta.commit(rows)
+    delta.conf.clear()
+
+    rerun = notebook["RunCheckpoint"](checkpoint_dir, "key")
+    assert rerun.resumed
+    chunks = rerun.committed_chunks()
+    assert [chunk["json_files"] for chunk in chunks] == [["0.json"], ["1.json"]]
+    # The restored chunks' rows, which the rerun's own writes don't include
+    assert sum(chunk["deliveries"] for chunk in chunks) == 350
+    # Chunk 2 is dropped from the checkpoint, on disk too, so it is parsed and written again
+    assert rerun.state["chunks"] == [0, 1]
+    with open(f"{checkpoint_dir}/checkpoint.json") as f:
+        assert json.load(f)["chunks"] == [0, 1]
+
+
+def test_chunks_after_an_uncommitted_one_are_dropped(notebook, delta, checkpoint_dir):
+    first = notebook["RunCheckpoint"](checkpoint_dir, "key")
+    write_chunk(first, delta, 0, 100, committed=False)
+    write_chunk(first, delta, 1, 100)
+
+    rerun = notebook["RunCheckpoint"](checkpoint_dir, "key")
+    assert rerun.committed_chunks() == []
+    assert rerun.state["chunks"] == []
+
+
+def test_a_checkpoint_for_other_input_is_discarded(notebook, delta, checkpoint_dir):
+    first = notebook["RunCheckpoint"](checkpoint_dir, "key")
+    write_chunk(first, delta, 0, 100)
+    first.finish_step("matches")
+
+    rerun = notebook["RunCheckpoint"](checkpoint_dir, "changed key")
+    assert not rerun.resumed
+    assert rerun.committed_chunks() == []
+    assert not rerun.step_done("matches")
+
+
+def test_finished_steps_are_skipped(notebook, delta, checkpoint_dir, monkeypatch):
+    monkeypatch.setitem(notebook, "run_metrics",
+                        SimpleNamespace(table_write=lambda table, stage=None: contextlib.nullcontext()))
+    writes = []
+
+    def run(checkpoint, tables, fail=None):
+        monkeypatch.setitem(notebook, "checkpoint", checkpoint)
+        written = {}
+        for table in tables:
+            def write(table=table):
+                if table == fail:
+                    raise RuntimeError(f"{table} write failed")
+                writes.append(table)
+            written[table] = notebook["write_step"](table, write)
+        return written
+
+    with pytest.raises(RuntimeError):
+        run(notebook["RunCheckpoint"](checkpoint_dir, "key"), ["players", "matches", "innings"], fail="matches")
+    assert writes == ["players"]
+
+    writes.clear()
+    assert run(notebook["RunCheckpoint"](checkpoint_dir, "key"), ["players", "matches", "innings"]) == {
+        "players": False, "matches": True, "innings": True}
+    assert writes == ["matches", "innings"]
@@ -0,0 +1,77 @@
+"""The driver's CompactColumnBuffer against the plain list ColumnBuffer, on a match with null numbers."""
+import io, json, zipfile
+
+import pytest
+
+
+def delivery(batter, runs_batter=0, **extra):
+    return {"batter": batter, "bowler": "B Bowler", "non_striker": "N Striker",
+            "runs": {"batter": runs_batter, "extras": 0, "total": runs_batter}, **extra}
+
+
+MATCH = {
+    "meta": {"data_version": "1.1.0"},
+    "info": {"match_type": "T20", "overs": 20, "teams": ["Home", "Away"],
+             "registry": {"people": {"A Batter": "a1", "B Bowler": "b1", "N Striker": "n1"}}},
+    "innings": [{"team": "Home", "overs": [{"over": 0, "deliveries": [
+        delivery("A Batter", 4),
+        # Cricsheet occasionally has nulls where a number or flag belongs
+        {"batter": "A Batter", "bowler": "B Bowler", "non_striker": "N Striker",
+         "runs": {"batter": None, "extras": 1, "total": 1, "non_boundary": None}, "extras": {"wides": 1}},
+        delivery("N Striker", 1),
+    ]}]}],
+}
+CLEAN_MATCH = {**MATCH, "innings": [{"team": "Away", "overs": [{"over": 0, "deliveries": [delivery("A Batter", 6)]}]}]}
+
+
+@pytest.fixture(scope="module")
+def archive():
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, "w") as zf:
+        zf.writestr("1001.json", json.dumps(MATCH))
+        zf.writestr("1002.json", json.dumps(CLEAN_MATCH))
+    return zipfile.ZipFile(data)
+
+
+def parse(notebook, archive, compact):
+    tables = notebook["MatchTables"](notebook["matches_schema"], notebook["innings_schema"],
+                                     notebook["deliveries_schema"], compact_deliveries=compact)
+    errors = [error for _, _, error in notebook["iter_parsed_matches"](["1001.json", "1002.json"], archive, tables)]
+    return tables, errors
+
+
+def test_null_numbers_round_trip_through_the_compact_buffer(notebook, archive):
+    tables, errors = parse(notebook, archive, compact=True)
+    assert errors == [None, None]
+    rows = [dict(zip(tables.deliveries.columns, row)) for row in tables.deliveries.rows()]
+    assert [row["runs_batter"] for row in rows] == [4, None, 1, 6]
+    assert [row["runs_non_boundary"] for row in rows] == [False, None, False, False]
+    assert [row["extras_wides"] for row in rows] == [0, 1, 0, 0]
+
+    arrow_schema = notebook["to_arrow_schema"](notebook["deliveries_schema"])
+    arrays = dict(zip(tables.deliveries.columns, tables.deliveries.arrow_arrays(arrow_schema)))
+    assert arrays["runs_batter"].to_pylist() == [4, None, 1, 6]
+    assert arrays["runs_non_boundary"].to_pylist() == [False, None, False, False]
+    # Only the match with nulls went through the null-aware appends
+    assert all(column.append == column.data.append for column in tables.deliveries.data
+               if isinstance(column, notebook["TypedColumn"]))
+
+
+def test_compact_buffer_matches_the_list_buffer(notebook, archive):
+    compact, _ = parse(notebook, archive, compact=True)
+    plain, _ = parse(notebook, archive, compact=False)
+    assert list(compact.deliveries.rows()) == list(plain.deliveries.rows())
+
+    arrow_schema = notebook["to_arrow_schema"](notebook["deliveries_schema"])
+    assert compact.deliveries.arrow_arrays(arrow_schema) == plain.deliveries.arrow_arrays(arrow_schema)
+
+
+def test_truncate_drops_nulls_past_the_new_length(notebook):
+    column = notebook["TypedColumn"](notebook["IntegerType"]())
+    column.set_nullable(True)
+    for value in (1, None, 3, None):
+        column.append(value)
+    column.truncate(2)
+    column.append(5)
+    assert list(column.values()) == [1, None, 5]
+    assert column.to_arrow(notebook["pa"].int32()).to_pylist() == [1, None, 5]
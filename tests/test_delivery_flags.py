@@ -0,0 +1,77 @@
+"""with_delivery_flags against the semantic model's old FILTER / SUMX measures, on handcrafted balls.
+
+The expected values are worked out by hand from the measures as they were before they became SUMs:
+  Legal Deliveries  COUNTROWS(FILTER(deliveries, [extras_wides] = 0 && [extras_noballs] = 0))
+  Balls Faced       COUNTROWS(FILTER(deliveries, [extras_wides] = 0))
+  Dismissals        COUNTROWS(FILTER(deliveries, [is_wicket] && NOT([wicket_kind] IN {retired hurt, retired not out, retired out})))
+  Wickets           as Dismissals, also excluding run out, obstructing the field, handled the ball, hit the ball twice
+  Bowler Runs       SUMX(deliveries, [runs_total] - [extras_byes] - [extras_legbyes])
+  Boundary % (num.) COUNTROWS(FILTER(deliveries, [runs_batter] IN {4, 6} && [runs_non_boundary] = FALSE()))
+A blank wicket_kind is NOT IN any list in DAX, so a wicket with no kind counts as both.
+"""
+import pytest
+
+FLAGS = ["is_legal_ball", "is_ball_faced", "is_batter_dismissal", "is_bowler_wicket", "bowler_runs", "is_boundary"]
+
+# (description, runs_batter, runs_total, wides, noballs, byes, legbyes, non_boundary, is_wicket, wicket_kind,
+#  expected (legal, faced, dismissal, bowler wicket, bowler runs, boundary))
+BALLS = [
+    ("dot ball",                  0, 0, 0, 0, 0, 0, False, False, None,                    (1, 1, 0, 0, 0, 0)),
+    ("four",                      4, 4, 0, 0, 0, 0, False, False, None,                    (1, 1, 0, 0, 4, 1)),
+    ("six",                       6, 6, 0, 0, 0, 0, False, False, None,                    (1, 1, 0, 0, 6, 1)),
+    ("four run, not a boundary",  4, 4, 0, 0, 0, 0, True,  False, None,                    (1, 1, 0, 0, 4, 0)),
+    ("wide",                      0, 1, 1, 0, 0, 0, False, False, None,                    (0, 0, 0, 0, 1, 0)),
+    ("five wides",                0, 5, 5, 0, 0, 0, False, False, None,                    (0, 0, 0, 0, 5, 0)),
+    ("no-ball hit for four",      4, 5, 0, 1, 0, 0, False, False, None,                    (0, 1, 0, 0, 5, 1)),
+    ("four byes",                 0, 4, 0, 0, 4, 0, False, False, None,                    (1, 1, 0, 0, 0, 0)),
+    ("leg-bye",                   0, 1, 0, 0, 0, 1, False, False, None,                    (1, 1, 0, 0, 0, 0)),
+    ("bowled",                    0, 0, 0, 0, 0, 0, False, True,  "bowled",                (1, 1, 1, 1, 0, 0)),
+    ("caught",                    0, 0, 0, 0, 0, 0, False, True,  "caught",                (1, 1, 1, 1, 0, 0)),
+    ("run out after a single",    1, 1, 0, 0, 0, 0, False, True,  "run out",               (1, 1, 1, 0, 1, 0)),
+    ("retired hurt",              0, 0, 0, 0, 0, 0, False, True,  "retired hurt",          (1, 1, 0, 0, 0, 0)),
+    ("retired not out",           0, 0, 0, 0, 0, 0, False, True,  "retired not out",       (1, 1, 0, 0, 0, 0)),
+    ("retired out",               0, 0, 0, 0, 0, 0, False, True,  "retired out",           (1, 1, 0, 0, 0, 0)),
+    ("obstructing the field",     0, 0, 0, 0, 0, 0, False, True,  "obstructing the field", (1, 1, 1, 0, 0, 0)),
+    ("handled the ball",          0, 0, 0, 0, 0, 0, False, True,  "handled the ball",      (1, 1, 1, 0, 0, 0)),
+    ("hit the ball twice",        0, 0, 0, 0, 0, 0, False, True,  "hit the ball twice",    (1, 1, 1, 0, 0, 0)),
+    ("wicket with no kind",       0, 0, 0, 0, 0, 0, False, True,  None,                    (1, 1, 1, 1, 0, 0)),
+    ("stumped off a wide",        0, 1, 1, 0, 0, 0, False, True,  "stumped",               (0, 0, 1, 1, 1, 0)),
+]
+
+# Column totals of the expected values above: what each SUM measure must return
+EXPECTED_TOTALS = {
+    "is_legal_ball": 16,
+    "is_ball_faced": 17,
+    "is_batter_dismissal": 8,
+    "is_bowler_wicket": 4,
+    "bowler_runs": 27,
+    "is_boundary": 3,
+}
+
+
+@pytest.fixture(scope="module")
+def flagged(notebook):
+    spark, F = notebook["spark"], notebook["F"]
+    rows = []
+    for ball, (name, runs_batter, runs_total, wides, noballs, byes, legbyes, non_boundary, is_wicket, kind, _) in enumerate(BALLS):
+        row = dict.fromkeys(notebook["deliveries_schema"].fieldNames())
+        row.update(match_id="m1", innings_number=1, over_number=ball // 6, ball_number=ball % 6 + 1, batter=name,
+                   runs_batter=runs_batter, runs_extras=runs_total - runs_batter, runs_total=runs_total,
+                   runs_non_boundary=non_boundary, extras_wides=wides, extras_noballs=noballs,
+                   extras_byes=byes, extras_legbyes=legbyes, extras_penalty=0,
+                   is_wicket=is_wicket, wicket_kind=kind)
+        rows.append(row)
+    deliveries = spark.createDataFrame(rows, notebook["deliveries_schema"])
+    return notebook["with_delivery_flags"](deliveries).select("batter", *FLAGS).collect()
+
+
+def test_each_ball_matches_the_old_measures(flagged):
+    actual = {row["batter"]: tuple(row[flag] for flag in FLAGS) for row in flagged}
+    expected = {ball[0]: ball[-1] for ball in BALLS}
+    assert actual == expected
+
+
+def test_flag_sums_match_the_old_measures(flagged):
+    totals = {flag: sum(row[flag] for row in flagged) for flag in FLAGS}
+    assert totals == EXPECTED_TOTALS
+    assert totals == {flag: sum(ball[-1][i] for ball in BALLS) for i, flag in enumerate(FLAGS)}
@@ -0,0 +1,168 @@
+"""fetch_archive against a local stand-in for cricsheet.org, served in-process on a free port."""
+import hashlib, json, os, threading, zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+CHUNK_SIZE = 4 << 10
+
+
+def make_handler(path, ranges=True):
+    """Serve the file at path with ETag/Last-Modified, 304 on a matching If-None-Match, and (if ranges)
+    206 partial content honouring If-Range. Range requests starting at or after `fail_from` get a 500."""
+
+    class Handler(BaseHTTPRequestHandler):
+        # (method, request headers) of every request answered, for the tests to inspect
+        log = []
+        fail_from = None
+
+        def log_message(self, *args):
+            pass
+
+        def do_HEAD(self):
+            self.serve(head=True)
+
+        def do_GET(self):
+            self.serve(head=False)
+
+        def serve(self, head):
+            with open(path, "rb") as f:
+                data = f.read()
+            etag = f'"{hashlib.md5(data).hexdigest()}"'
+            self.log.append((self.command, dict(self.headers)))
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            byte_range = self.headers.get("Range")
+            if ranges and byte_range and self.headers.get("If-Range") in (None, etag):
+                start, end = (int(x) for x in byte_range.split("=")[1].split("-"))
+                if self.fail_from is not None and start >= self.fail_from:
+                    self.send_response(500)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                body = data[start:end + 1]
+                self.send_response(206)
+                self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+            else:
+                body = data
+                self.send_response(200)
+            self.send_header("ETag", etag)
+            if ranges:
+                self.send_header("Accept-Ranges", "bytes")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if not head:
+                self.wfile.write(body)
+
+    return Handler
+
+
+def write_archive(path, n_members=12):
+    """A small all_json.zip look-alike, stored uncompressed so it spans several ranges."""
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_STORED) as zf:
+        for i in range(n_members):
+            match = {"info": {"match_type": "T20"}, "innings": [{"team": f"Team {i}", "overs": list(range(200))}]}
+            zf.writestr(f"{1000 + i}.json", json.dumps(match))
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+@pytest.fixture
+def serve(tmp_path):
+    """Start a stand-in server for tmp_path/remote.zip; returns (url, handler class)."""
+    servers = []
+
+    def start(ranges=True):
+        handler = make_handler(tmp_path / "remote.zip", ranges)
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_port}/all_json.zip", handler
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def fetch(notebook, monkeypatch, tmp_path):
+    """fetch_archive into tmp_path/cache/all_json.zip, without the retry backoff."""
+    monkeypatch.setattr(notebook["time"], "sleep", lambda seconds: None)
+    (tmp_path / "cache").mkdir()
+    dest = str(tmp_path / "cache" / "all_json.zip")
+
+    def run(url, **kwargs):
+        return notebook["fetch_archive"](url, dest, workers=4, chunk_size=CHUNK_SIZE, **kwargs)
+
+    run.dest = dest
+    return run
+
+
+def test_unchanged_archive_is_not_downloaded_again(serve, fetch, tmp_path):
+    write_archive(tmp_path / "remote.zip")
+    url, handler = serve()
+    assert fetch(url) is True
+    assert read(fetch.dest) == read(tmp_path / "remote.zip")
+
+    handler.log.clear()
+    assert fetch(url) is False
+    # One conditional HEAD answered 304, and nothing else
+    assert [method for method, _ in handler.log] == ["HEAD"]
+    assert handler.log[0][1]["If-None-Match"] == json.loads(read(fetch.dest + ".meta.json"))["etag"]
+
+
+def test_failed_fetch_resumes_from_the_ranges_on_disk(serve, fetch, notebook, tmp_path):
+    write_archive(tmp_path / "remote.zip")
+    size = os.path.getsize(tmp_path / "remote.zip")
+    total = -(-size // CHUNK_SIZE)
+    url, handler = serve()
+
+    handler.fail_from = size // 2
+    with pytest.raises(notebook["urllib"].error.HTTPError):
+        fetch(url, retries=0)
+    done = json.loads(read(fetch.dest + ".part.json"))["done"]
+    assert 0 < len(done) < total
+    assert not os.path.exists(fetch.dest)
+
+    handler.fail_from = None
+    handler.log.clear()
+    assert fetch(url) is True
+    fetched = sorted(int(h["Range"].split("=")[1].split("-")[0]) for _, h in handler.log if "Range" in h)
+    assert fetched == sorted(set(range(0, size, CHUNK_SIZE)) - set(done))
+    assert read(fetch.dest) == read(tmp_path / "remote.zip")
+    assert not os.path.exists(fetch.dest + ".part") and not os.path.exists(fetch.dest + ".part.json")
+
+
+def test_corrupt_archive_fails_the_crc_check(serve, fetch, tmp_path):
+    write_archive(tmp_path / "remote.zip")
+    url, _ = serve()
+    assert fetch(url) is True
+    cached = read(fetch.dest)
+
+    # A new version whose bytes were damaged inside the first member's data
+    write_archive(tmp_path / "remote.zip", n_members=13)
+    damaged = bytearray(read(tmp_path / "remote.zip"))
+    damaged[200] ^= 0xFF
+    (tmp_path / "remote.zip").write_bytes(bytes(damaged))
+
+    with pytest.raises(IOError, match="CRC mismatch in 1000.json"):
+        fetch(url)
+    # The cached copy is kept, and the bad bytes are not left behind to resume from
+    assert read(fetch.dest) == cached
+    assert not os.path.exists(fetch.dest + ".part") and not os.path.exists(fetch.dest + ".part.json")
+
+
+def test_server_without_range_support_gets_a_single_get(serve, fetch, tmp_path):
+    write_archive(tmp_path / "remote.zip")
+    url, handler = serve(ranges=False)
+    assert fetch(url) is True
+    assert [method for method, _ in handler.log] == ["HEAD", "GET"]
+    assert all("Range" not in headers for _, headers in handler.log)
+    assert read(fetch.dest) == read(tmp_path / "remote.zip")
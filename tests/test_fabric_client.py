@@ -0,0 +1,170 @@
+"""fabric_client against scripts/mock_fabric.py, served in-process on a free port."""
+import json, subprocess, threading, time
+from http.server import ThreadingHTTPServer
+from types import SimpleNamespace
+
+import pytest
+
+import fabric_client
+import mock_fabric
+from fabric_client import FabricError
+
+SEMANTIC_MODELS = "/workspaces/ws/semanticModels"
+UPDATE_DEFINITION = "/workspaces/ws/items/item/updateDefinition"
+
+
+@pytest.fixture
+def serve():
+    """Start a mock Fabric API; returns (client for it, the server's request log)."""
+    servers = []
+
+    def start(seconds=0.0, fail=(), **faults):
+        handler = mock_fabric.make_handler(mock_fabric.Operations(seconds, list(fail)), **faults)
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return fabric_client.FabricClient(f"http://127.0.0.1:{server.server_port}/v1", retries=3), handler.log
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Waits the client asks for, recorded and cut short so the tests run quickly.
+
+    Only fabric_client's own time module is swapped, so sleeps in other threads (Spark's, the
+    servers') are neither recorded nor cut short.
+    """
+    waited = []
+
+    def sleep(seconds):
+        waited.append(seconds)
+        time.sleep(0.01)
+
+    monkeypatch.setattr(fabric_client, "time", SimpleNamespace(time=time.time, monotonic=time.monotonic, sleep=sleep))
+    return waited
+
+
+@pytest.fixture
+def az(monkeypatch):
+    """Stand-in for `az account get-access-token`, handing out token-1, token-2, ... valid for an hour."""
+    monkeypatch.delenv("FABRIC_ACCESS_TOKEN", raising=False)
+    monkeypatch.setattr(fabric_client, "_token", {"value": None, "expires": 0.0})
+    cli = SimpleNamespace(calls=0)
+
+    def run(args, **kwargs):
+        cli.calls += 1
+        token = {"accessToken": f"token-{cli.calls}", "expires_on": str(int(time.time()) + 3600)}
+        return subprocess.CompletedProcess(args, 0, stdout=json.dumps(token), stderr="")
+
+    monkeypatch.setattr(fabric_client.subprocess, "run", run)
+    return cli
+
+
+@pytest.fixture
+def static_token(monkeypatch):
+    monkeypatch.setenv("FABRIC_ACCESS_TOKEN", "mock")
+
+
+def statuses(log):
+    return [(method, status) for method, _, status, _ in log]
+
+
+def test_token_is_cached_until_near_expiry(serve, az, sleeps):
+    client, _ = serve()
+    location = client.request("POST", SEMANTIC_MODELS, {}).headers["Location"]
+    client.request("GET", location)
+    client.request("GET", location)
+    assert az.calls == 1
+
+    # Inside the five-minute margin the token is fetched again, and the new one is reused
+    fabric_client._token["expires"] = time.time() + 200
+    client.request("GET", location)
+    client.request("GET", location)
+    assert az.calls == 2
+
+
+def test_401_refreshes_the_token_once(serve, az, sleeps):
+    client, log = serve(token="token-2")
+    assert client.request("POST", SEMANTIC_MODELS, {}).status == 202
+    assert statuses(log) == [("POST", 401), ("POST", 202)]
+    assert az.calls == 2
+
+    client, log = serve(token="never")
+    with pytest.raises(FabricError) as error:
+        client.request("POST", SEMANTIC_MODELS, {})
+    assert error.value.status == 401
+    assert len(log) == 2
+
+
+def test_429_is_retried_after_retry_after(serve, static_token, sleeps):
+    client, log = serve(throttle=2, retry_after="7")
+    location = client.request("POST", SEMANTIC_MODELS, {}).headers["Location"]
+    assert client.get(location)["status"] == "Succeeded"
+    assert statuses(log) == [("POST", 202), ("GET", 429), ("GET", 200)]
+    assert sleeps == [7.0]
+
+
+def test_post_is_retried_on_429_until_retries_run_out(serve, static_token, sleeps):
+    client, log = serve(throttle=1, retry_after="2")
+    with pytest.raises(FabricError) as error:
+        client.request("POST", SEMANTIC_MODELS, {})
+    assert error.value.status == 429
+    assert statuses(log) == [("POST", 429)] * 4
+    assert sleeps == [2.0] * 3
+
+
+def test_5xx_is_retried_with_backoff(serve, static_token, sleeps):
+    client, log = serve(error_every=2)
+    location = client.request("POST", SEMANTIC_MODELS, {}).headers["Location"]
+    assert client.get(location)["status"] == "Succeeded"
+    assert statuses(log) == [("POST", 202), ("GET", 500), ("GET", 200)]
+    assert sleeps == [1]
+
+
+def test_post_is_not_retried_on_500(serve, static_token, sleeps):
+    client, log = serve(error_every=1)
+    with pytest.raises(FabricError) as error:
+        client.request("POST", SEMANTIC_MODELS, {})
+    assert error.value.status == 500
+    assert statuses(log) == [("POST", 500)]
+    assert sleeps == []
+
+
+def test_lro_follows_location_to_the_result(serve, static_token, sleeps):
+    client, log = serve(seconds=0.2)
+    response = client.post_and_wait(SEMANTIC_MODELS, {"displayName": "CricketAnalytics"})
+    assert response.status == 200
+    assert response.json()["displayName"] == "CricketAnalytics"
+
+    paths = [path for _, path, _, _ in log]
+    assert paths[0] == f"/v1{SEMANTIC_MODELS}"
+    assert len(paths) > 3  # polled while Running
+    assert all(path.startswith("/v1/operations/") for path in paths[1:-1])
+    assert paths[-1].endswith("/result")
+    # Every poll waited the Retry-After the operation asked for, on one kept-alive connection
+    assert set(sleeps) == {1.0}
+    assert len({port for _, _, _, port in log}) == 1
+
+
+def test_lro_without_a_result_returns_the_final_status(serve, static_token, sleeps):
+    client, log = serve()
+    response = client.post_and_wait(UPDATE_DEFINITION, {"definition": {"parts": []}})
+    assert response.json()["status"] == "Succeeded"
+    assert statuses(log) == [("POST", 202), ("GET", 200)]
+
+
+def test_failed_operation_raises(serve, static_token, sleeps):
+    client, _ = serve(fail=["updateDefinition"])
+    with pytest.raises(FabricError, match="Operation failed") as error:
+        client.post_and_wait(UPDATE_DEFINITION, {})
+    assert json.loads(error.value.body)["error"]["errorCode"] == "MockFailure"
+
+
+def test_operation_outlasting_the_timeout_raises(serve, static_token, sleeps):
+    client, _ = serve(seconds=60)
+    with pytest.raises(TimeoutError):
+        client.post_and_wait(UPDATE_DEFINITION, {}, timeout=0.1)
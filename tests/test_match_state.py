@@ -0,0 +1,78 @@
+"""with_match_state on a handcrafted T20 innings, the super over that followed it and a Test innings."""
+import pytest
+
+
+def ball(innings_number, over_number, ball_number, runs=1, wides=0, wicket_kind=None, match_id="m1", overs=20,
+         super_over=None):
+    return {"match_id": match_id, "innings_number": innings_number, "over_number": over_number,
+            "ball_number": ball_number, "runs_total": runs, "extras_wides": wides, "extras_noballs": 0,
+            "is_wicket": wicket_kind is not None, "wicket_kind": wicket_kind,
+            "overs_per_side": overs, "balls_per_over": 6, "is_super_over": super_over}
+
+
+@pytest.fixture(scope="module")
+def match_state(notebook):
+    balls = [
+        # First innings: two legal balls, a wide, then a wicket
+        ball(1, 0, 1), ball(1, 0, 2, runs=4), ball(1, 0, 3, wides=1), ball(1, 0, 4, runs=0, wicket_kind="bowled"),
+        # Super over: six legal balls and a wide, with a retirement that isn't a team wicket
+        ball(3, 0, 1, super_over=True), ball(3, 0, 2, wides=1, super_over=True), ball(3, 0, 3, runs=6, super_over=True),
+        ball(3, 0, 4, runs=0, wicket_kind="retired hurt", super_over=True), ball(3, 0, 5, super_over=True),
+        ball(3, 0, 6, super_over=True), ball(3, 0, 7, runs=2, super_over=True),
+        # A Test's third innings: no allocation, and not a super over
+        ball(3, 0, 1, match_id="test", overs=None, super_over=False), ball(3, 0, 2, match_id="test", overs=None),
+    ]
+    spark = notebook["spark"]
+    df = spark.createDataFrame(balls, "match_id string, innings_number int, over_number int, ball_number int, "
+                                      "runs_total int, extras_wides int, extras_noballs int, is_wicket boolean, "
+                                      "wicket_kind string, overs_per_side int, balls_per_over int, "
+                                      "is_super_over boolean")
+    df = df.withColumn("is_legal_ball", ((df.extras_wides == 0) & (df.extras_noballs == 0)).cast("int"))
+    rows = notebook["with_match_state"](df).orderBy("match_id", "innings_number", "over_number", "ball_number").collect()
+    innings = {key: [row for row in rows if row["match_id"] == "m1" and row["innings_number"] == key] for key in (1, 3)}
+    innings["test"] = [row for row in rows if row["match_id"] == "test"]
+    return innings
+
+
+def test_balls_remaining_counts_down_the_twenty_overs(match_state):
+    assert [row["balls_remaining"] for row in match_state[1]] == [119, 118, 118, 117]
+    assert {row["phase"] for row in match_state[1]} == {"powerplay"}
+
+
+def test_super_over_is_allotted_one_over(match_state):
+    super_over = match_state[3]
+    assert [row["balls_remaining"] for row in super_over] == [5, 5, 4, 3, 2, 1, 0]
+    assert [row["legal_ball_index"] for row in super_over] == [1, 1, 2, 3, 4, 5, 6]
+    assert {row["phase"] for row in super_over} == {"super over"}
+    assert super_over[-1]["running_runs"] == 12
+    assert super_over[-1]["running_wickets"] == 0
+
+
+def test_unlimited_overs_innings_have_no_allocation_or_phase(match_state):
+    assert [row["balls_remaining"] for row in match_state["test"]] == [None, None]
+    assert [row["phase"] for row in match_state["test"]] == [None, None]
+    assert [row["legal_ball_index"] for row in match_state["test"]] == [1, 2]
+
+
+def test_prepare_deliveries_takes_super_overs_from_innings(notebook):
+    spark = notebook["spark"]
+    schemas = {name: notebook[f"{name}_schema"] for name in ("matches", "innings", "deliveries")}
+
+    def row(name, **values):
+        return {**dict.fromkeys(schemas[name].fieldNames()), **values}
+
+    # A T20 whose two innings of one ball were followed by a super over in innings 4: flagged, not numbered
+    deliveries = [row("deliveries", match_id="m1", innings_number=innings, over_number=0, ball_number=1,
+                      runs_batter=1, runs_extras=0, runs_total=1, runs_non_boundary=False, extras_wides=0,
+                      extras_noballs=0, extras_byes=0, extras_legbyes=0, extras_penalty=0, is_wicket=False)
+                  for innings in (1, 2, 4)]
+    matches = [row("matches", match_id="m1", match_type="T20", overs_per_side=20, balls_per_over=6)]
+    innings = [row("innings", match_id="m1", innings_number=number, is_super_over=number == 4) for number in (1, 2, 4)]
+    df = notebook["prepare_deliveries"](spark.createDataFrame(deliveries, schemas["deliveries"]),
+                                        spark.createDataFrame(matches, schemas["matches"]),
+                                        spark.createDataFrame(innings, schemas["innings"]))
+
+    assert df.columns[:len(schemas["deliveries"].fieldNames())] == schemas["deliveries"].fieldNames()
+    assert "is_super_over" not in df.columns
+    state = {r["innings_number"]: (r["balls_remaining"], r["phase"]) for r in df.collect()}
+    assert state == {1: (119, "powerplay"), 2: (119, "powerplay"), 4: (5, "super over")}
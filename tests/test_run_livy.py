@@ -0,0 +1,74 @@
+"""run_livy.run_cells against scripts/mock_livy.py, served in-process on a free port."""
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+import fabric_client
+import mock_livy
+import run_livy
+
+CELLS = [name for name in run_livy.CELL_MAP if name != "metrics"]
+
+
+@pytest.fixture
+def serve(monkeypatch):
+    """Start a mock Livy session; returns (client for it, the session)."""
+    monkeypatch.setenv("FABRIC_ACCESS_TOKEN", "mock")
+    servers = []
+
+    def start(fail=(), throttle=0):
+        session = mock_livy.Session(0.02, list(fail))
+        server = ThreadingHTTPServer(("127.0.0.1", 0), mock_livy.make_handler(session, throttle))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        client = fabric_client.FabricClient(f"http://127.0.0.1:{server.server_port}/sessions/0", retries=3)
+        return client, session
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture(scope="module")
+def code_cells():
+    return run_livy.read_code_cells()
+
+
+def run(client, names, code_cells):
+    return run_livy.run_cells(client, names, code_cells, timeout=30, poll_min=0.01, poll_max=0.05)
+
+
+def states(session):
+    return [statement["state"] for statement in session.statements]
+
+
+def test_cells_run_one_after_another(serve, code_cells):
+    client, session = serve(throttle=7)
+    assert run(client, CELLS, code_cells) == []
+    assert [statement["code"] for statement in session.statements] == [code_cells[run_livy.CELL_MAP[name]] for name in CELLS]
+    assert set(states(session)) == {"available"}
+
+
+def test_a_failed_cell_stops_the_run(serve, code_cells):
+    client, session = serve(fail=['run_metrics.start("validate")'])
+    assert run(client, CELLS, code_cells) == ["validate"]
+
+    # Nothing after validate was submitted, so enrich never merged into players
+    validate = CELLS.index("validate")
+    assert len(session.statements) == validate + 1
+    assert session.statements[-1]["output"]["status"] == "error"
+    assert all(statement["output"]["status"] == "ok" for statement in session.statements[:validate])
+
+    # "all" then records the failed run with the metrics cell on its own
+    assert run(client, ["metrics"], code_cells) == []
+    assert states(session)[validate + 1:] == ["available"]
+    assert session.statements[-1]["code"] == code_cells[run_livy.CELL_MAP["metrics"]]
+
+
+def test_a_statement_outlasting_the_timeout_is_cancelled(serve, code_cells):
+    client, session = serve()
+    session.seconds = 5
+    assert not run_livy.run_cell(client, "params", code_cells[0], timeout=0.1, poll_min=0.01, poll_max=0.05)
+    assert states(session) == ["cancelled"]